@@ -1,27 +1,215 @@
 # -*- coding: utf-8 -*-
+import os
+import logging
+
 import dataiku
 from dataiku.customrecipe import get_input_names_for_role, get_output_names_for_role, get_recipe_config
 from plugin_config_loading import load_plugin_config
-from language_detection import LanguageDetector
-from dku_io_utils import process_dataset_chunks, set_column_description
+from language_detection import LanguageDetector, create_process_pool
+from dku_io_utils import (
+    process_dataset_chunks,
+    process_dataset_partitions,
+    read_dataset_sample,
+    iter_streaming_sample,
+    set_column_description,
+    is_append_mode,
+)
+from instrumentation import ProcessingMetrics
+from diagnostics import DetectionDiagnostics
+from chunk_sizing import AdaptiveChunkSizer
+from incremental_state import IncrementalState
+from profiling import DetectionProfiler
+from routing_tuning import RoutingTuner
+from language_distribution import LanguageDistributionEstimator
 
 # Setup
 input_dataset = dataiku.Dataset(get_input_names_for_role("input_dataset")[0])
 output_dataset = dataiku.Dataset(get_output_names_for_role("output_dataset")[0])
+cache_folder_names = get_output_names_for_role("cache_folder")
+cache_folder = dataiku.Folder(cache_folder_names[0]) if len(cache_folder_names) != 0 else None
+report_folder_names = get_output_names_for_role("report_folder")
+report_folder = dataiku.Folder(report_folder_names[0]) if len(report_folder_names) != 0 else None
 params = load_plugin_config(get_recipe_config())
-detector = LanguageDetector(
-    language_scope=params["language_scope"],
-    minimum_score=params["minimum_score"],
-    fallback_language=params["fallback_language"],
-)
+metrics = ProcessingMetrics()
+profiler = DetectionProfiler(profile_chunks=params["profile_chunks"]) if params["profiling"] else None
+detectors = []
+routing_threshold = None
+if params["routing_tuning"]:
+    # The threshold is part of the detector fingerprint, so it is tuned once and reused to keep caches valid
+    tuning_folder = cache_folder if cache_folder is not None else report_folder
+    tuning_dict = None
+    if tuning_folder is not None and not params["routing_retuning"]:
+        tuning_dict = RoutingTuner.load(tuning_folder, params["language_scope"])
+    if tuning_dict is None:
+        if tuning_folder is None:
+            logging.warning("No cache or report folder to save the routing threshold, it is tuned again at each run")
+        sample_df = input_dataset.get_dataframe(
+            columns=params["text_columns"], sampling="random", limit=params["routing_sample_size"]
+        )
+        tuning_detector = LanguageDetector(
+            language_scope=params["language_scope"],
+            max_num_bytes=params["max_num_bytes"],
+            progressive_detection=params["progressive_detection"],
+            normalization_steps=params["normalization_steps"],
+        )
+        try:
+            tuning_dict = RoutingTuner(tuning_detector, params["routing_accuracy_tolerance"]).tune(
+                [doc for col in params["text_columns"] for doc in sample_df[col].dropna().astype(str).tolist()]
+            )
+        finally:
+            tuning_detector.close()
+        if tuning_folder is not None:
+            tuning_folder.write_json(RoutingTuner.FILE_NAME, tuning_dict)
+    else:
+        logging.info("Using the saved routing threshold of {:d} characters".format(tuning_dict["routing_threshold"]))
+    routing_threshold = RoutingTuner.load_routing_threshold(tuning_dict, params["language_scope"])
+    if report_folder is not None and report_folder is not tuning_folder:
+        report_folder.write_json(RoutingTuner.FILE_NAME, tuning_dict)
+
+detection_kwargs = {
+    "language_scope": params["language_scope"],
+    "minimum_score": params["minimum_score"],
+    "fallback_language": params["fallback_language"],
+    "max_num_bytes": params["max_num_bytes"],
+    "progressive_detection": params["progressive_detection"],
+    "script_fast_path": params["script_fast_path"],
+    "normalization_steps": params["normalization_steps"],
+    "routing_threshold": routing_threshold,
+}
+process_pool = None
+if params["backend"] == "process":
+    # Fork detection processes before pipeline and partition threads start, shared by all detectors
+    process_pool = create_process_pool(params["num_workers"], profiler is not None, **detection_kwargs)
+
+
+def create_detector() -> LanguageDetector:
+    detector = LanguageDetector(
+        backend=params["backend"],
+        num_workers=params["num_workers"],
+        cache_size=params["cache_size"],
+        persistent_cache_path=os.path.join(cache_folder.get_path(), "language_detection_cache.sqlite")
+        if cache_folder is not None
+        else None,
+        persistent_cache_size=params["persistent_cache_size"],
+        metrics=metrics,
+        profiler=profiler,
+        process_pool=process_pool,
+        **detection_kwargs
+    )
+    detectors.append(detector)
+    return detector
+
+
+chunk_sizer = None
+if params["adaptive_chunking"]:
+    chunk_sizer = AdaptiveChunkSizer(
+        memory_budget_mb=params["memory_budget_mb"],
+        target_chunk_seconds=params["target_chunk_seconds"],
+        min_chunksize=params["min_chunk_size"],
+        max_chunksize=params["max_chunk_size"],
+    )
+
+incremental_state = None
+if params["incremental_mode"] and not params["language_distribution_mode"]:
+    assert cache_folder is not None, "Incremental mode requires a cache folder to store the watermark across runs"
+    incremental_state = IncrementalState.load(
+        folder=cache_folder,
+        watermark_column=params["watermark_column"],
+        config={
+            "detector": create_detector().get_config_fingerprint(),
+            "text_columns": params["text_columns"],
+            "columnar_output": params["columnar_output"],
+        },
+    )
+    if not is_append_mode(output_dataset):
+        # Overwriting the output with only new rows would lose previous rows once the watermark moves up
+        incremental_state.force_full_rebuild(
+            "the output dataset does not append instead of overwrite, so all rows are processed at each run"
+        )
 
 # Run
-process_dataset_chunks(
-    input_dataset=input_dataset,
-    output_dataset=output_dataset,
-    func=detector.detect_languages_df,
-    text_column=params["text_column"],
-)
+read_partitions = input_dataset.read_partitions or []
+distribution_estimator = None
+if params["language_distribution_mode"]:
+    distribution_estimator = LanguageDistributionEstimator(
+        detectors[0] if len(detectors) != 0 else create_detector(),
+        confidence=params["distribution_confidence"],
+        margin_of_error=params["distribution_margin_of_error"],
+    )
+    if params["distribution_sampling"] == "streaming":
+        distribution_dict = distribution_estimator.estimate_from_chunks(
+            iter_streaming_sample(
+                dataset=input_dataset,
+                columns=params["text_columns"],
+                sample_size=params["distribution_sample_size"],
+                metrics=metrics,
+            ),
+            params["text_columns"],
+        )
+    else:
+        sample_dfs, stratum_sizes = read_dataset_sample(
+            dataset=input_dataset,
+            columns=params["text_columns"],
+            sample_size=params["distribution_sample_size"],
+            sampling=params["distribution_sampling"],
+            max_workers=params["partition_workers"],
+            metrics=metrics,
+        )
+        distribution_dict = distribution_estimator.estimate(sample_dfs, params["text_columns"], stratum_sizes)
+    distribution_estimator.log_summary()
+    output_dataset.write_with_schema(distribution_estimator.to_df())
+    metrics_dict = metrics.to_dict()
+    if report_folder is not None:
+        report_folder.write_json(LanguageDistributionEstimator.FILE_NAME, distribution_dict)
+elif len(read_partitions) > 1 and params["partition_workers"] > 1 and incremental_state is None:
+    metrics_dict = process_dataset_partitions(
+        input_dataset=input_dataset,
+        output_dataset=output_dataset,
+        func_factory=lambda: create_detector().detect_languages_df,
+        partition_workers=params["partition_workers"],
+        chunksize=params["chunk_size"],
+        pipeline_queue_size=params["pipeline_queue_size"],
+        metrics=metrics,
+        chunk_sizer=chunk_sizer,
+        text_column=params["text_columns"],
+        columnar_output=params["columnar_output"],
+    )
+else:
+    detector = detectors[0] if len(detectors) != 0 else create_detector()  # reuse the detector of incremental mode
+    metrics_dict = process_dataset_chunks(
+        input_dataset=input_dataset,
+        output_dataset=output_dataset,
+        func=detector.detect_languages_df,
+        chunksize=params["chunk_size"],
+        pipeline_queue_size=params["pipeline_queue_size"],
+        record_count_mode=params["record_count_mode"],
+        metrics=metrics,
+        chunk_sizer=chunk_sizer,
+        incremental_state=incremental_state,
+        text_column=params["text_columns"],
+        columnar_output=params["columnar_output"],
+    )
+if incremental_state is not None:
+    incremental_state.save(cache_folder)
+diagnostics = DetectionDiagnostics()
+for detector in detectors:
+    detector.close()
+    diagnostics.merge(detector.diagnostics.to_dict())
+if process_pool is not None:
+    process_pool.close()
+    process_pool.join()
+if report_folder is not None:
+    report_folder.write_json("detection_report.json", {"metrics": metrics_dict, "diagnostics": diagnostics.to_dict()})
+if profiler is not None:
+    profiler.log_summary()
+    if report_folder is not None:
+        report_folder.write_json("detection_profile.json", dict(profiler.to_dict(), timers=metrics_dict["timers"]))
+if distribution_estimator is not None:
+    column_description_dict = distribution_estimator.COLUMN_DESCRIPTION_DICT
+else:  # from the input schema rather than from a detector, as some detectors may not have processed any chunk
+    column_description_dict = LanguageDetector.get_column_description_dict(
+        [col["name"] for col in input_dataset.read_schema()], params["text_columns"]
+    )
 set_column_description(
-    input_dataset=input_dataset, output_dataset=output_dataset, column_description_dict=detector.column_description_dict
+    input_dataset=input_dataset, output_dataset=output_dataset, column_description_dict=column_description_dict
 )
@@ -7,8 +7,9 @@ This issue is fixed in DSS 8.0.
 """
 
 import logging
-from typing import Dict, List, AnyStr
-from collections import OrderedDict
+from typing import Dict, List, AnyStr, Tuple
+from collections import OrderedDict, Counter
+from functools import lru_cache
 
 import cld3
 from langid.langid import LanguageIdentifier, model
@@ -190,12 +191,71 @@ def load_plugin_config(recipe_config: Dict) -> Dict:
 supported_languages_dict = {k["value"]: k["label"] for k in SUPPORTED_LANGUAGES}
 
 
+class DetectionEngine:
+    """
+    Interface of a language detection engine, same as DetectionEngine in python-lib/detection_engines.py:
+    supported codes, remapping of raw codes to plugin codes and detection of a batch of texts
+    """
+
+    name = ""
+    SUPPORTED_LANGUAGES = [language["value"] for language in SUPPORTED_LANGUAGES]
+    LANGUAGE_REMAPPING = {}
+
+    def __init__(self, language_scope: List[AnyStr]):
+        self.language_scope = language_scope
+
+    def get_language_code(self, engine_code: AnyStr) -> AnyStr:
+        return self.LANGUAGE_REMAPPING.get(engine_code[:2], engine_code[:2])
+
+    def detect_batch(self, texts: List[AnyStr]) -> (List[AnyStr], List[float]):
+        raise NotImplementedError
+
+
+ENGINE_REGISTRY = {}
+
+
+def register_engine(engine_class: type) -> type:
+    ENGINE_REGISTRY[engine_class.name] = engine_class
+    return engine_class
+
+
+@register_engine
+class LangidEngine(DetectionEngine):
+    name = "langid"
+    SUPPORTED_LANGUAGES = [
+        code for code in DetectionEngine.SUPPORTED_LANGUAGES if code not in SUPPORTED_LANGUAGES_IN_CLD3_NOT_IN_LANGID
+    ]
+
+    def __init__(self, language_scope: List[AnyStr]):
+        super().__init__(language_scope)
+        self._identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
+        self._identifier.set_languages([l for l in language_scope if l in set(self.SUPPORTED_LANGUAGES)])
+
+    def detect_batch(self, texts: List[AnyStr]) -> (List[AnyStr], List[float]):
+        outputs = [self._identifier.classify(text) for text in texts]
+        return ([self.get_language_code(output[0]) for output in outputs], [float(output[1]) for output in outputs])
+
+
+@register_engine
+class Cld3Engine(DetectionEngine):
+    name = "cld3"
+    LANGUAGE_REMAPPING = LANGUAGE_REMAPPING
+
+    def detect_batch(self, texts: List[AnyStr]) -> (List[AnyStr], List[float]):
+        outputs = [cld3.get_language(text) for text in texts]
+        return (
+            [self.get_language_code(output.language) for output in outputs],
+            [float(output.probability) for output in outputs],
+        )
+
+
 class LanguageDetector:
     """
-    Language detection wrapper class on top of cld3 and langid, with additional features:
-    - Route to cld3 for documents with more than 140 characters, else langid
-    - Harmonize small differences between cld3 and langid language scopes
+    Language detection wrapper class on top of detection engines, cld3 and langid by default, with additional features:
+    - Route to the long document engine for documents with more than 140 characters, else the short document engine
+    - Harmonize small differences between engine language codes
     - Add filter on language scope and minimum confidence score, else replace detection by fallback
+    - Count documents replaced by fallback instead of logging each of them
     """
 
     LANGID_CLD3_NUM_CHAR_THRESHOLD = 140
@@ -213,80 +273,79 @@ class LanguageDetector:
         language_scope: List = supported_languages_dict.keys(),
         minimum_score: float = 0.0,
         fallback_language: AnyStr = "",
+        short_doc_engine: AnyStr = "langid",
+        long_doc_engine: AnyStr = "cld3",
     ):
         self.language_scope = language_scope
+        self._language_scope_set = set(language_scope)
         self.minimum_score = float(minimum_score)
         self.fallback_language = fallback_language
         self.column_description_dict = self.COLUMN_DESCRIPTION_DICT  # may be changed by detect_languages_df
-        self._langid_identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
-        self._langid_identifier.set_languages(
-            [l for l in self.language_scope if l not in SUPPORTED_LANGUAGES_IN_CLD3_NOT_IN_LANGID]
-        )
-
-    def _langid_detection(self, doc: AnyStr) -> (AnyStr, float):
-        language_detection_object = self._langid_identifier.classify(doc)
-        lang_id = language_detection_object[0][:2]
-        lang_probability = float(language_detection_object[1])
-        return (lang_id, lang_probability)
-
-    def _cld3_detection(self, doc: AnyStr) -> (AnyStr, float):
-        language_detection_object = cld3.get_language(doc)
-        lang_id = language_detection_object.language[:2]
-        for original_code, new_code in LANGUAGE_REMAPPING.items():  # make cld3 compatible with langid
-            lang_id = lang_id.replace(original_code, new_code)
-        lang_probability = float(language_detection_object.probability)
-        return (lang_id, lang_probability)
+        self.rejection_counts = Counter()
+        self.short_doc_engine = ENGINE_REGISTRY[short_doc_engine](language_scope)
+        self.long_doc_engine = ENGINE_REGISTRY[long_doc_engine](language_scope)
 
     def _detection_filter(self, doc: AnyStr, lang_id: AnyStr, lang_probability: float) -> (AnyStr, float):
-        if lang_probability < self.minimum_score or lang_id not in self.language_scope:
-            warning_msg = "Problem encountered for document: '{}'.\n".format(doc)
-            if lang_id not in self.language_scope:
-                warning_msg += "Detected language: '{}' not within language scope: {}.\n".format(
-                    lang_id, self.language_scope
-                )
-            else:
-                warning_msg += "Confidence score: {:.2f} below minimum: {:.2f}.\n".format(
-                    lang_probability, self.minimum_score
+        if lang_id not in self._language_scope_set:
+            reason = "out of scope"
+        elif lang_probability < self.minimum_score:
+            reason = "below minimum score"
+        else:
+            return (lang_id, lang_probability)
+        self.rejection_counts[reason] += 1
+        num_rejections = sum(self.rejection_counts.values())
+        if num_rejections & (num_rejections - 1) == 0:  # log only at powers of 2 to limit the volume of logs
+            logging.warning(
+                "Replaced {:d} detections by fallback language '{}' so far: {}".format(
+                    num_rejections, self.fallback_language, dict(self.rejection_counts)
                 )
-            warning_msg += "Replacing detected language: '{}' by fallback: '{}'.".format(
-                lang_id, self.fallback_language
             )
-            logging.warning(warning_msg)
-            lang_id, lang_probability = self.fallback_language, None
-        return (lang_id, lang_probability)
+        return (self.fallback_language, None)
+
+    def detect_language_batch(self, docs: List[AnyStr]) -> List[Tuple[AnyStr, AnyStr, float]]:
+        # Route to the short or long document engine depending on number of characters, one batch per engine
+        output = [("", "", None)] * len(docs)
+        short_doc_indices = [i for i, doc in enumerate(docs) if doc and len(doc) <= self.LANGID_CLD3_NUM_CHAR_THRESHOLD]
+        long_doc_indices = [i for i, doc in enumerate(docs) if doc and len(doc) > self.LANGID_CLD3_NUM_CHAR_THRESHOLD]
+        for engine, indices in [(self.short_doc_engine, short_doc_indices), (self.long_doc_engine, long_doc_indices)]:
+            if len(indices) == 0:
+                continue
+            lang_ids, lang_probabilities = engine.detect_batch([docs[i] for i in indices])
+            for i, lang_id, lang_probability in zip(indices, lang_ids, lang_probabilities):
+                # Filters for language scope and minimum scores
+                lang_id, lang_probability = self._detection_filter(docs[i], lang_id, lang_probability)
+                # Enrich with language human name
+                lang_name = supported_languages_dict.get(lang_id, "")
+                # Round probability to 3 decimals
+                lang_probability = round(lang_probability, 3) if lang_probability else None
+                output[i] = (lang_id, lang_name, lang_probability)
+        return output
 
     def detect_language_doc(self, doc: AnyStr) -> (AnyStr, AnyStr, float):
-        # Route to langid or cld3 depending on number of characters
-        if doc is None or doc == "":
-            return ("", "", None)
-        if len(doc) <= self.LANGID_CLD3_NUM_CHAR_THRESHOLD:
-            lang_id, lang_probability = self._langid_detection(doc)
-        else:
-            lang_id, lang_probability = self._cld3_detection(doc)
-        # Filters for language scope and minimum scores
-        lang_id, lang_probability = self._detection_filter(doc, lang_id, lang_probability)
-        # Enrich with language human name
-        lang_name = supported_languages_dict.get(lang_id, "")
-        # Round probability to 3 decimals
-        lang_probability = round(lang_probability, 3) if lang_probability else None
-        return (lang_id, lang_name, lang_probability)
+        return self.detect_language_batch([doc])[0]
 
 
 # Setup
+MEMO_SIZE = 10000
+MEMO_MAX_NUM_CHAR = 1000  # longer documents are rarely repeated and would make the memo too large
 params = load_plugin_config(params)  # noqa
 detector = LanguageDetector(
     language_scope=params["language_scope"],
     minimum_score=params["minimum_score"],
     fallback_language=params["fallback_language"],
 )
+text_column = params["text_column"]
+new_cols = ["{}_{}".format(text_column, k) for k in detector.COLUMN_DESCRIPTION_DICT.keys()]
+detect_language_doc_memo = lru_cache(maxsize=MEMO_SIZE)(detector.detect_language_doc)
+
+
+def _set_output(row, lang_output_tuple):
+    row[new_cols[0]], row[new_cols[1]], row[new_cols[2]] = lang_output_tuple
+    return row
 
 
 def process(row):
-    text_column = params["text_column"]
     doc = str(row[text_column])
-    new_cols = ["{}_{}".format(text_column, k) for k in detector.COLUMN_DESCRIPTION_DICT.keys()]
-    (lang_id, lang_name, lang_probability) = detector.detect_language_doc(doc)
-    row[new_cols[0]] = lang_id
-    row[new_cols[1]] = lang_name
-    row[new_cols[2]] = lang_probability
-    return row
+    if len(doc) <= MEMO_MAX_NUM_CHAR:
+        return _set_output(row, detect_language_doc_memo(doc))
+    return _set_output(row, detector.detect_language_doc(doc))
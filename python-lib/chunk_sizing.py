@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import logging
+from typing import Iterator, Generator
+
+import pandas as pd
+
+
+class AdaptiveChunkSizer:
+    """
+    Choose the number of rows per chunk from a memory budget and a target processing time per chunk,
+    using the bytes per row and the processing time per row observed on previous chunks.
+    Estimates are exponential moving averages, and chunk sizes are kept within minimum and maximum limits.
+
+    Attributes:
+        memory_budget_mb: Memory budget for one chunk being processed, in megabytes
+        target_chunk_seconds: Target processing time per chunk, in seconds
+        min_chunksize: Minimum number of rows per chunk, also the size of chunks read from the dataset
+        max_chunksize: Maximum number of rows per chunk
+    """
+
+    MEMORY_OVERHEAD_FACTOR = 3  # input chunk, output copy and intermediate arrays of the detector
+    SMOOTHING = 0.3  # weight of the last chunk in the moving averages
+    RESIZE_TOLERANCE = 0.2  # relative change below which the chunk size is kept, to avoid resizing on noise
+
+    def __init__(
+        self,
+        memory_budget_mb: float = 1024,
+        target_chunk_seconds: float = 10.0,
+        min_chunksize: int = 1000,
+        max_chunksize: int = 100000,
+    ):
+        if min_chunksize < 1 or max_chunksize < min_chunksize:
+            raise ValueError("Chunk size limits must satisfy 1 <= min_chunksize <= max_chunksize")
+        self.memory_budget_bytes = memory_budget_mb * 1024 * 1024
+        self.target_chunk_seconds = target_chunk_seconds
+        self.min_chunksize = int(min_chunksize)
+        self.max_chunksize = int(max_chunksize)
+        self.chunksize = self.min_chunksize  # start small until throughput is observed
+        self.bytes_per_row = None
+        self.seconds_per_row = None
+
+    def _smooth(self, average: float, value: float) -> float:
+        return value if average is None else (1 - self.SMOOTHING) * average + self.SMOOTHING * value
+
+    def observe_read(self, df: pd.DataFrame) -> None:
+        """
+        Update the estimate of memory per row from a chunk read from the dataset
+        """
+        if len(df.index) != 0:
+            bytes_per_row = df.memory_usage(index=False, deep=True).sum() / len(df.index)
+            self.bytes_per_row = self._smooth(self.bytes_per_row, bytes_per_row)
+
+    def observe_processing(self, num_rows: int, seconds: float) -> None:
+        """
+        Update the estimate of processing time per row from a processed chunk, then choose the next chunk size
+        """
+        if num_rows == 0:
+            return
+        self.seconds_per_row = self._smooth(self.seconds_per_row, seconds / num_rows)
+        rows_by_memory = self.max_chunksize
+        if self.bytes_per_row is not None and self.bytes_per_row > 0:
+            rows_by_memory = int(self.memory_budget_bytes / (self.bytes_per_row * self.MEMORY_OVERHEAD_FACTOR))
+        rows_by_latency = self.max_chunksize
+        if self.seconds_per_row > 0:
+            rows_by_latency = int(self.target_chunk_seconds / self.seconds_per_row)
+        chunksize = min(max(min(rows_by_memory, rows_by_latency), self.min_chunksize), self.max_chunksize)
+        if abs(chunksize - self.chunksize) > self.RESIZE_TOLERANCE * self.chunksize:
+            logging.info(
+                "Chunk size changed from {:d} to {:d} rows: {:.0f} bytes and {:.6f} seconds per row, "
+                "{:d} rows within memory budget, {:d} rows within target time".format(
+                    self.chunksize,
+                    chunksize,
+                    self.bytes_per_row or 0,
+                    self.seconds_per_row,
+                    rows_by_memory,
+                    rows_by_latency,
+                )
+            )
+            self.chunksize = chunksize
+
+    def iter_rechunked(self, df_iterator: Iterator) -> Generator:
+        """
+        Group small dataframe chunks into chunks of the current size, observing the memory of each small chunk
+        """
+        buffer = []
+        num_buffered_rows = 0
+        for df in df_iterator:
+            self.observe_read(df)
+            buffer.append(df)
+            num_buffered_rows += len(df.index)
+            if num_buffered_rows >= self.chunksize:
+                yield buffer[0] if len(buffer) == 1 else pd.concat(buffer)
+                buffer = []
+                num_buffered_rows = 0
+        if len(buffer) != 0:
+            yield buffer[0] if len(buffer) == 1 else pd.concat(buffer)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import logging
+import hashlib
+import sqlite3
+from threading import Lock
+from typing import List, AnyStr, Dict, Tuple
+from collections import OrderedDict
+
+
+class LRUDetectionCache:
+    """
+    Bounded in-memory cache of language detection results with least-recently-used eviction.
+    Documents are keyed by their text, or by a hash of their text if they are long,
+    so that the cache does not retain large documents in memory.
+    """
+
+    KEY_MAX_NUM_CHAR = 256
+
+    def __init__(self, max_size: int = 100000):
+        self.max_size = int(max_size)
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def _key(self, doc: AnyStr) -> AnyStr:
+        if len(doc) <= self.KEY_MAX_NUM_CHAR:
+            return doc
+        return hashlib.md5(doc.encode("utf8")).digest()
+
+    def get_many(self, docs: List[AnyStr]) -> Dict[AnyStr, Tuple]:
+        """
+        Look up a list of unique documents and return a dictionary of the cached results.
+        Documents missing from the cache are not in the dictionary.
+        """
+        cached_results = {}
+        with self._lock:
+            for doc in docs:
+                key = self._key(doc)
+                result = self._cache.get(key)
+                if result is None:
+                    self.misses += 1
+                else:
+                    self._cache.move_to_end(key)
+                    cached_results[doc] = result
+                    self.hits += 1
+        return cached_results
+
+    def set_many(self, docs: List[AnyStr], results: List[Tuple]) -> None:
+        """
+        Add detection results to the cache, evicting the least recently used ones beyond the maximum size
+        """
+        with self._lock:
+            for doc, result in zip(docs, results):
+                key = self._key(doc)
+                self._cache[key] = result
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def get_stats(self) -> Dict:
+        num_lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / num_lookups if num_lookups != 0 else 0.0,
+            "size": len(self._cache),
+            "max_size": self.max_size,
+        }
+
+    def log_stats(self) -> None:
+        stats = self.get_stats()
+        logging.info(
+            "Detection cache: {:d} hits, {:d} misses ({:.1%} hit rate), {:d}/{:d} entries".format(
+                stats["hits"], stats["misses"], stats["hit_rate"], stats["size"], stats["max_size"]
+            )
+        )
+
+
+class PersistentDetectionCache:
+    """
+    On-disk cache of language detection results stored in a SQLite database, reusable across recipe runs.
+    Documents are keyed by a hash of their text. The cache is tied to a fingerprint of the detector configuration
+    and is emptied automatically when this configuration changes. Least recently used entries are evicted
+    when the number of entries exceeds the maximum size, tracked with a running count rather than counted
+    at each write. As other connections may write to the same file, entries are counted again regularly.
+    """
+
+    SQLITE_MAX_VARIABLES = 500  # stay below the SQLite limit of 999 variables per query
+    COUNT_INTERVAL_RATIO = 0.01  # share of the maximum size written between two exact counts of entries
+
+    def __init__(self, path: AnyStr, config_fingerprint: AnyStr, max_size: int = 10000000):
+        self.path = path
+        self.config_fingerprint = config_fingerprint
+        self.max_size = int(max_size)
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        directory = os.path.dirname(path)
+        if directory != "" and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS detections "
+                "(key BLOB PRIMARY KEY, lang_id TEXT, lang_name TEXT, lang_probability REAL, last_used INTEGER)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS detections_last_used ON detections (last_used)")
+        self._invalidate_if_config_changed()
+        # Running count of entries, counted again from time to time to include writes of other connections
+        self._count_interval = max(1, int(self.max_size * self.COUNT_INTERVAL_RATIO))
+        self._num_entries = self._count_entries()
+        self._num_written_since_count = 0
+
+    def _count_entries(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM detections").fetchone()[0]
+
+    def _invalidate_if_config_changed(self) -> None:
+        row = self._connection.execute("SELECT value FROM metadata WHERE key = 'config_fingerprint'").fetchone()
+        if row is not None and row[0] == self.config_fingerprint:
+            logging.info("Reusing persistent detection cache: {}".format(self.path))
+            return
+        if row is not None:
+            logging.info("Detector configuration changed, emptying persistent detection cache: {}".format(self.path))
+        with self._connection:
+            self._connection.execute("DELETE FROM detections")
+            self._connection.execute(
+                "INSERT OR REPLACE INTO metadata (key, value) VALUES ('config_fingerprint', ?)",
+                (self.config_fingerprint,),
+            )
+
+    @staticmethod
+    def _key(doc: AnyStr) -> bytes:
+        return hashlib.sha1(doc.encode("utf8")).digest()
+
+    def get_many(self, docs: List[AnyStr]) -> Dict[AnyStr, Tuple]:
+        """
+        Look up a list of unique documents with bulk queries and return a dictionary of the cached results.
+        Documents missing from the cache are not in the dictionary.
+        """
+        cached_results = {}
+        doc_by_key = {self._key(doc): doc for doc in docs}
+        keys = list(doc_by_key.keys())
+        with self._lock:
+            for start in range(0, len(keys), self.SQLITE_MAX_VARIABLES):
+                batch_keys = keys[start : start + self.SQLITE_MAX_VARIABLES]
+                rows = self._connection.execute(
+                    "SELECT key, lang_id, lang_name, lang_probability FROM detections WHERE key IN ({})".format(
+                        ",".join("?" * len(batch_keys))
+                    ),
+                    batch_keys,
+                ).fetchall()
+                for key, lang_id, lang_name, lang_probability in rows:
+                    cached_results[doc_by_key[key]] = (lang_id, lang_name, lang_probability)
+            if len(cached_results) != 0:
+                with self._connection:
+                    self._connection.executemany(
+                        "UPDATE detections SET last_used = ? WHERE key = ?",
+                        [(int(time.time()), self._key(doc)) for doc in cached_results],
+                    )
+            self.hits += len(cached_results)
+            self.misses += len(docs) - len(cached_results)
+        return cached_results
+
+    def set_many(self, docs: List[AnyStr], results: List[Tuple]) -> None:
+        """
+        Add detection results to the cache with a bulk insert, evicting the least recently used ones
+        beyond the maximum size
+        """
+        last_used = int(time.time())
+        rows = [(r[0], r[1], r[2], last_used, self._key(doc)) for doc, r in zip(docs, results)]
+        with self._lock, self._connection:
+            num_inserted = self._connection.executemany(
+                "INSERT OR IGNORE INTO detections (lang_id, lang_name, lang_probability, last_used, key) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            ).rowcount
+            if num_inserted < len(rows):  # some documents were already cached, e.g. by another connection
+                self._connection.executemany(
+                    "UPDATE detections SET lang_id = ?, lang_name = ?, lang_probability = ?, last_used = ? "
+                    "WHERE key = ?",
+                    rows,
+                )
+            self._num_entries += num_inserted
+            self._num_written_since_count += len(rows)
+            if self._num_written_since_count >= self._count_interval:
+                self._num_entries = self._count_entries()
+                self._num_written_since_count = 0
+            if self._num_entries > self.max_size:
+                self._num_entries -= self._connection.execute(
+                    "DELETE FROM detections WHERE key IN "
+                    "(SELECT key FROM detections ORDER BY last_used, rowid LIMIT ?)",
+                    (self._num_entries - self.max_size,),
+                ).rowcount
+
+    def get_stats(self) -> Dict:
+        num_lookups = self.hits + self.misses
+        with self._lock:
+            size = self._count_entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / num_lookups if num_lookups != 0 else 0.0,
+            "size": size,
+            "max_size": self.max_size,
+        }
+
+    def log_stats(self) -> None:
+        stats = self.get_stats()
+        logging.info(
+            "Persistent detection cache: {:d} hits, {:d} misses ({:.1%} hit rate), {:d}/{:d} entries".format(
+                stats["hits"], stats["misses"], stats["hit_rate"], stats["size"], stats["max_size"]
+            )
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+from typing import AnyStr, Dict, List
+
+import numpy as np
+
+from language_dict import SUPPORTED_LANGUAGES, SUPPORTED_LANGUAGES_IN_CLD3_NOT_IN_LANGID, LANGUAGE_REMAPPING
+from langid_model_cache import load_langid_identifier, DEFAULT_MODEL_CACHE_DIR
+from plugin_io_utils import get_package_version
+
+
+class DetectionEngine:
+    """
+    Interface of a language detection engine, used by LanguageDetector to route documents.
+    An engine declares the languages it supports and the remapping of its raw codes to the plugin codes,
+    and detects languages of a batch of texts at once, so that engines with native batch inference can use it.
+    Engines are registered by name with register_engine, so that a locally trained or vendored model
+    can be used without changing LanguageDetector.
+
+    Attributes:
+        language_scope: List of language codes to detect, which the engine may use to restrict its model
+        model_cache_dir: Directory to cache compiled models, for engines which compile them
+    """
+
+    name = ""
+    package_name = None  # package of the engine, whose version is part of the detector config fingerprint
+    SUPPORTED_LANGUAGES = [language["value"] for language in SUPPORTED_LANGUAGES]
+    LANGUAGE_REMAPPING = {}  # raw codes of the engine to two-letter plugin codes, besides truncation to two letters
+
+    def __init__(self, language_scope: List[AnyStr], model_cache_dir: AnyStr = DEFAULT_MODEL_CACHE_DIR):
+        self.language_scope = language_scope
+        self.model_cache_dir = model_cache_dir
+        self._language_code_table = {code: code for code in self.SUPPORTED_LANGUAGES}
+
+    @property
+    def version(self) -> AnyStr:
+        return get_package_version(self.package_name) if self.package_name is not None else ""
+
+    def get_language_code(self, engine_code: AnyStr) -> AnyStr:
+        """
+        Two-letter plugin code for a raw engine code, from a lookup table filled on first use
+        """
+        lang_id = self._language_code_table.get(engine_code)
+        if lang_id is None:
+            lang_id = self.LANGUAGE_REMAPPING.get(engine_code[:2], engine_code[:2])
+            self._language_code_table[engine_code] = lang_id
+        return lang_id
+
+    def detect_batch(self, texts: List[AnyStr]) -> (List[AnyStr], np.array):
+        """
+        Detect languages of a list of non-empty texts, returning a list of plugin codes and an array of scores
+        """
+        raise NotImplementedError
+
+
+ENGINE_REGISTRY = {}
+
+
+def register_engine(engine_class: type) -> type:
+    """
+    Register a DetectionEngine subclass under its name, usable as a class decorator
+    """
+    if not engine_class.name:
+        raise ValueError("Detection engine {} must have a name".format(engine_class.__name__))
+    ENGINE_REGISTRY[engine_class.name] = engine_class
+    return engine_class
+
+
+def create_engine(
+    name: AnyStr, language_scope: List[AnyStr], model_cache_dir: AnyStr = DEFAULT_MODEL_CACHE_DIR
+) -> DetectionEngine:
+    if name not in ENGINE_REGISTRY:
+        raise ValueError("Detection engine '{}' not in {}".format(name, sorted(ENGINE_REGISTRY)))
+    return ENGINE_REGISTRY[name](language_scope, model_cache_dir)
+
+
+@register_engine
+class LangidEngine(DetectionEngine):
+    """
+    langid model restricted to the language scope, scoring batches by vectorized matrix multiplications
+    """
+
+    name = "langid"
+    package_name = "langid"
+    SUPPORTED_LANGUAGES = [
+        code for code in DetectionEngine.SUPPORTED_LANGUAGES if code not in SUPPORTED_LANGUAGES_IN_CLD3_NOT_IN_LANGID
+    ]
+    BATCH_SIZE = 256
+
+    def __init__(self, language_scope: List[AnyStr], model_cache_dir: AnyStr = DEFAULT_MODEL_CACHE_DIR):
+        super().__init__(language_scope, model_cache_dir)
+        supported_languages = set(self.SUPPORTED_LANGUAGES)
+        self._identifier = load_langid_identifier(
+            [l for l in language_scope if l in supported_languages], model_cache_dir
+        )
+        # The model is stored as float64, so that the memory-mapped arrays are used without a private copy
+        self._nb_ptc = np.asarray(self._identifier.nb_ptc, dtype=np.float64)
+        self._nb_pc = np.asarray(self._identifier.nb_pc, dtype=np.float64)
+
+    def _state_counts(self, doc: AnyStr) -> Dict:
+        # Same tokenizer state machine as langid.LanguageIdentifier.instance2fv, without the dense feature vector
+        tk_nextmove = self._identifier.tk_nextmove
+        state = 0
+        state_counts = defaultdict(int)
+        for letter in doc.encode("utf8"):
+            state = tk_nextmove[(state << 8) + letter]
+            state_counts[state] += 1
+        return state_counts
+
+    def detect_batch(self, texts: List[AnyStr]) -> (List[AnyStr], np.array):
+        """
+        Score a batch of texts using one matrix multiplication per sub-batch.
+        Sub-batches of BATCH_SIZE texts bound the size of the dense feature matrix.
+        """
+        tk_output = self._identifier.tk_output
+        nb_classes = self._identifier.nb_classes
+        num_features = self._identifier.nb_numfeats
+        codes, scores = [], np.zeros(len(texts))
+        for start in range(0, len(texts), self.BATCH_SIZE):
+            batch_texts = texts[start : start + self.BATCH_SIZE]
+            rows, features, counts = [], [], []
+            for i, doc in enumerate(batch_texts):
+                for state, count in self._state_counts(doc).items():
+                    for feature_index in tk_output.get(state, ()):
+                        rows.append(i)
+                        features.append(feature_index)
+                        counts.append(count)
+            feature_matrix = np.bincount(
+                np.array(rows, dtype=np.int64) * num_features + np.array(features, dtype=np.int64),
+                weights=np.array(counts, dtype=np.float64),
+                minlength=len(batch_texts) * num_features,
+            ).reshape(len(batch_texts), num_features)
+            log_probs = feature_matrix.dot(self._nb_ptc) + self._nb_pc
+            # Same normalization as langid norm_probs, applied row by row
+            with np.errstate(over="ignore"):
+                probs = 1 / np.exp(log_probs[:, None, :] - log_probs[:, :, None]).sum(axis=2)
+            best_class_indices = np.argmax(probs, axis=1)
+            codes.extend(self.get_language_code(str(nb_classes[i])) for i in best_class_indices)
+            scores[start : start + len(batch_texts)] = probs[np.arange(len(batch_texts)), best_class_indices]
+        return (codes, scores)
+
+
+@register_engine
+class Cld3Engine(DetectionEngine):
+    """
+    cld3 neural model, which has no batch inference so that texts are scored one by one
+    """
+
+    name = "cld3"
+    package_name = "pycld3"
+    LANGUAGE_REMAPPING = LANGUAGE_REMAPPING
+
+    def detect_batch(self, texts: List[AnyStr]) -> (List[AnyStr], np.array):
+        import cld3  # lazy import to speed up startup when no document is routed to cld3
+
+        codes, scores = [], np.zeros(len(texts))
+        for i, text in enumerate(texts):
+            language_detection_object = cld3.get_language(text)
+            codes.append(self.get_language_code(language_detection_object.language))
+            scores[i] = language_detection_object.probability
+        return (codes, scores)
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Local low-latency language detection service with dynamic micro-batching
+
+Single-document requests are queued and grouped into micro-batches, flushed when they reach a maximum size
+or when the oldest request has waited for a maximum time. Batches are detected in a pool of worker threads,
+so that the per-call overhead is amortized under load while latency stays bounded when traffic is low.
+
+Run with python-lib in the PYTHONPATH:
+    python python-lib/detection_service.py --port 8080 --max-batch-size 64 --max-wait-ms 5
+
+Endpoints:
+    POST /detect with {"text": "..."} or {"texts": ["...", ...]}
+    GET /stats for latency percentiles, queue depth and throughput
+    GET /health
+"""
+import json
+import asyncio
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AnyStr, Dict, List, Tuple
+
+import numpy as np
+
+from language_detection import LanguageDetector
+from language_dict import SUPPORTED_LANGUAGES
+
+
+class LatencyRecorder:
+    """
+    Sliding window of request latencies, to report percentiles over the most recent requests
+    """
+
+    def __init__(self, window_size: int = 100000):
+        self.latencies = deque(maxlen=window_size)
+        self.num_requests = 0
+
+    def add(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+        self.num_requests += 1
+
+    def to_dict(self) -> Dict:
+        if len(self.latencies) == 0:
+            return {"num_requests": self.num_requests}
+        latencies_ms = np.array(self.latencies) * 1000
+        return {
+            "num_requests": self.num_requests,
+            "latency_ms_p50": round(float(np.percentile(latencies_ms, 50)), 3),
+            "latency_ms_p99": round(float(np.percentile(latencies_ms, 99)), 3),
+            "latency_ms_max": round(float(latencies_ms.max()), 3),
+        }
+
+
+class MicroBatcher:
+    """
+    Group concurrent detection requests into micro-batches dispatched to a pool of worker threads
+
+    Attributes:
+        detector: LanguageDetector instance used to detect each batch
+        max_batch_size: Maximum number of documents in a micro-batch
+        max_wait_ms: Maximum time in milliseconds a request waits for its micro-batch to fill up
+        num_workers: Maximum number of micro-batches being detected concurrently
+    """
+
+    def __init__(
+        self, detector: LanguageDetector, max_batch_size: int = 64, max_wait_ms: float = 5.0, num_workers: int = 4
+    ):
+        if max_batch_size < 1:
+            raise ValueError("Maximum batch size must be at least 1")
+        if max_wait_ms < 0:
+            raise ValueError("Maximum wait time must be positive")
+        self.detector = detector
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.num_workers = num_workers
+        self.latency = LatencyRecorder()
+        self.batch_sizes = deque(maxlen=10000)
+        self.max_queue_depth = 0
+        self._queue = None  # created in start, within the event loop
+        self._semaphore = None
+        self._executor = None
+        self._batch_loop_task = None
+
+    async def start(self) -> None:
+        self.detector.start()  # before the executor threads, for the process backend
+        self._queue = asyncio.Queue()
+        self._semaphore = asyncio.Semaphore(self.num_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.num_workers)
+        self._batch_loop_task = asyncio.ensure_future(self._batch_loop())
+
+    async def stop(self) -> None:
+        if self._batch_loop_task is not None:
+            self._batch_loop_task.cancel()
+            try:
+                await self._batch_loop_task
+            except asyncio.CancelledError:
+                pass
+            self._batch_loop_task = None
+        for _ in range(self.num_workers):  # wait for the batches in flight
+            await self._semaphore.acquire()
+        self._executor.shutdown()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def detect(self, doc: AnyStr) -> Tuple[AnyStr, AnyStr, float]:
+        """
+        Detect the language of one document, returning its (language code, language name, score)
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._queue.put_nowait((doc, future, loop.time()))
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return await future
+
+    async def _collect_batch(self) -> List:
+        loop = asyncio.get_event_loop()
+        items = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while len(items) < self.max_batch_size:
+            if not self._queue.empty():
+                items.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def _batch_loop(self) -> None:
+        while True:
+            items = await self._collect_batch()
+            await self._semaphore.acquire()
+            asyncio.ensure_future(self._run_batch(items))
+
+    async def _run_batch(self, items: List) -> None:
+        loop = asyncio.get_event_loop()
+        self.batch_sizes.append(len(items))
+        try:
+            docs = [doc for doc, _, _ in items]
+            lang_output_tuple_list = await loop.run_in_executor(
+                self._executor, self.detector.detect_languages_list, docs
+            )
+            for (_, future, start_time), lang_output_tuple in zip(items, lang_output_tuple_list):
+                if not future.done():
+                    future.set_result(lang_output_tuple)
+                self.latency.add(loop.time() - start_time)
+        except Exception:
+            logging.exception(
+                "Language detection failed on a batch of {:d} documents, retrying one by one".format(len(items))
+            )
+            await self._run_items_one_by_one(items)
+        finally:
+            self._semaphore.release()
+
+    async def _run_items_one_by_one(self, items: List) -> None:
+        # Isolate a failing document, so that its error only fails its own request
+        loop = asyncio.get_event_loop()
+        for doc, future, start_time in items:
+            try:
+                lang_output_tuple_list = await loop.run_in_executor(
+                    self._executor, self.detector.detect_languages_list, [doc]
+                )
+                if not future.done():
+                    future.set_result(lang_output_tuple_list[0])
+                self.latency.add(loop.time() - start_time)
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+
+    def get_stats(self) -> Dict:
+        stats = self.latency.to_dict()
+        stats.update(
+            {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "mean_batch_size": round(float(np.mean(self.batch_sizes)), 2) if len(self.batch_sizes) != 0 else 0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "num_workers": self.num_workers,
+            }
+        )
+        return stats
+
+
+class DetectionService:
+    """
+    Minimal HTTP/1.1 JSON server in front of a MicroBatcher, with keep-alive connections for load testing
+    """
+
+    HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+    def __init__(self, batcher: MicroBatcher, host: AnyStr = "127.0.0.1", port: int = 8080):
+        self.batcher = batcher
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self) -> None:
+        await self.batcher.start()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logging.info("Language detection service listening on {}:{:d}".format(self.host, self.port))
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.batcher.stop()
+
+    @staticmethod
+    def _format_output(lang_output_tuple: Tuple) -> Dict:
+        return dict(zip(["language_code", "language_name", "language_score"], lang_output_tuple))
+
+    async def _route(self, method: AnyStr, path: AnyStr, body: bytes) -> Tuple[int, Dict]:
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and path == "/stats":
+            return 200, self.batcher.get_stats()
+        if method == "POST" and path == "/detect":
+            try:
+                request = json.loads(body.decode("utf-8"))
+            except ValueError as error:
+                return 400, {"error": "Invalid JSON: {}".format(error)}
+            if isinstance(request, dict) and isinstance(request.get("text"), str):
+                return 200, self._format_output(await self.batcher.detect(request["text"]))
+            if isinstance(request, dict) and isinstance(request.get("texts"), list):
+                if not all(isinstance(text, str) for text in request["texts"]):
+                    return 400, {"error": "All elements of 'texts' must be strings"}
+                results = await asyncio.gather(*[self.batcher.detect(text) for text in request["texts"]])
+                return 200, {"results": [self._format_output(result) for result in results]}
+            return 400, {"error": "Request must have a 'text' string or a 'texts' list"}
+        return 404, {"error": "Unknown endpoint: {} {}".format(method, path)}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path = (request_line.decode("latin-1").split(" ") + ["", ""])[:2]
+                headers = {}
+                while True:
+                    header_line = await reader.readline()
+                    if header_line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header_line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    content_length = int(headers.get("content-length", 0))
+                    is_valid_content_length = content_length >= 0
+                except ValueError:
+                    is_valid_content_length = False
+                if is_valid_content_length:
+                    body = await reader.readexactly(content_length)
+                    try:
+                        status, response = await self._route(method, path, body)
+                    except Exception as error:
+                        status, response = 500, {"error": str(error)}
+                else:
+                    status, response = 400, {"error": "Invalid Content-Length: '{}'".format(headers["content-length"])}
+                payload = json.dumps(response).encode("utf-8")
+                header = "HTTP/1.1 {:d} {}\r\nContent-Type: application/json\r\nContent-Length: {:d}\r\n\r\n".format(
+                    status, self.HTTP_REASONS[status], len(payload)
+                )
+                writer.write(header.encode("latin-1") + payload)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close" or not is_valid_content_length:
+                    break  # without a valid length, the end of the body and the next request cannot be found
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _log_stats_periodically(batcher: MicroBatcher, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        logging.info("Service stats: {}".format(json.dumps(batcher.get_stats())))
+
+
+def main(argv: List[AnyStr] = None) -> None:
+    parser = argparse.ArgumentParser(description="Local language detection service with dynamic micro-batching")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--num-workers", type=int, default=4)
+    parser.add_argument("--language-scope", nargs="*", default=[lang["value"] for lang in SUPPORTED_LANGUAGES])
+    parser.add_argument("--minimum-score", type=float, default=0.0)
+    parser.add_argument("--fallback-language", default="")
+    parser.add_argument("--cache-size", type=int, default=100000)
+    parser.add_argument("--stats-interval", type=float, default=60.0, help="Seconds between stats logs, 0 to disable")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="Language Detection plugin %(levelname)s - %(message)s")
+
+    detector = LanguageDetector(
+        language_scope=list(args.language_scope),
+        minimum_score=args.minimum_score,
+        fallback_language=args.fallback_language,
+        num_workers=args.num_workers,
+        cache_size=args.cache_size,
+    )
+    service = DetectionService(
+        MicroBatcher(detector, args.max_batch_size, args.max_wait_ms, args.num_workers), args.host, args.port
+    )
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(service.start())
+    if args.stats_interval > 0:
+        asyncio.ensure_future(_log_stats_periodically(service.batcher, args.stats_interval))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(service.stop())
+        detector.close()
+        logging.info("Final service stats: {}".format(json.dumps(service.batcher.get_stats())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+from threading import Lock
+from itertools import islice
+from collections import Counter
+from typing import AnyStr, Dict, List
+
+import numpy as np
+
+
+class DetectionDiagnostics:
+    """
+    Aggregate diagnostics on detections replaced by the fallback language, instead of logging each of them:
+    - Counts of rejections by reason (out of language scope, below minimum score), per chunk and per run
+    - Matrix of detected languages replaced by the fallback language
+    - Histogram of detection scores before filtering
+    - Small sample of truncated example documents
+    """
+
+    REJECTION_REASONS = ("out_of_scope", "below_minimum_score")
+    NUM_SCORE_BINS = 10
+    MAX_NUM_EXAMPLES = 10
+    EXAMPLE_MAX_NUM_CHAR = 100
+
+    def __init__(self):
+        self.rejection_counts = Counter()
+        self.chunk_rejection_counts = Counter()
+        self.fallback_counts = Counter()
+        self.score_histogram = [0] * self.NUM_SCORE_BINS
+        self.examples = []
+        self._lock = Lock()
+
+    def add_score(self, lang_probability: float) -> None:
+        self.add_scores(np.array([lang_probability]))
+
+    def add_scores(self, lang_probabilities: np.array) -> None:
+        score_bins = np.clip((lang_probabilities * self.NUM_SCORE_BINS).astype(int), 0, self.NUM_SCORE_BINS - 1)
+        bin_counts = np.bincount(score_bins, minlength=self.NUM_SCORE_BINS)
+        with self._lock:
+            for score_bin, count in enumerate(bin_counts.tolist()):
+                self.score_histogram[score_bin] += count
+
+    def add_rejection(
+        self, doc: AnyStr, lang_id: AnyStr, lang_probability: float, reason: AnyStr, fallback_language: AnyStr
+    ) -> None:
+        self.add_rejections([doc], [lang_id], [lang_probability], reason, fallback_language)
+
+    def add_rejections(
+        self,
+        docs: List[AnyStr],
+        lang_ids: List[AnyStr],
+        lang_probabilities: List[float],
+        reason: AnyStr,
+        fallback_language: AnyStr,
+    ) -> None:
+        with self._lock:
+            self.rejection_counts[reason] += len(docs)
+            self.chunk_rejection_counts[reason] += len(docs)
+            self.fallback_counts.update((lang_id, fallback_language) for lang_id in lang_ids)
+            num_missing_examples = max(self.MAX_NUM_EXAMPLES - len(self.examples), 0)
+            for doc, lang_id, lang_probability in islice(zip(docs, lang_ids, lang_probabilities), num_missing_examples):
+                if len(doc) > self.EXAMPLE_MAX_NUM_CHAR:
+                    doc = doc[: self.EXAMPLE_MAX_NUM_CHAR] + "..."
+                self.examples.append(
+                    {"doc": doc, "language": lang_id, "score": round(lang_probability, 3), "reason": reason}
+                )
+
+    def merge(self, diagnostics_dict: Dict) -> None:
+        """
+        Merge diagnostics from the output of to_dict, for instance collected in another process
+        """
+        with self._lock:
+            for reason, count in diagnostics_dict["rejection_counts"].items():
+                self.rejection_counts[reason] += count
+                self.chunk_rejection_counts[reason] += count
+            for fallback in diagnostics_dict["fallback_counts"]:
+                self.fallback_counts[(fallback["detected"], fallback["fallback"])] += fallback["count"]
+            for score_bin, count in enumerate(diagnostics_dict["score_histogram"]["counts"]):
+                self.score_histogram[score_bin] += count
+            num_missing_examples = self.MAX_NUM_EXAMPLES - len(self.examples)
+            self.examples.extend(diagnostics_dict["examples"][: max(num_missing_examples, 0)])
+
+    def reset(self) -> None:
+        with self._lock:
+            self.rejection_counts.clear()
+            self.chunk_rejection_counts.clear()
+            self.fallback_counts.clear()
+            self.score_histogram = [0] * self.NUM_SCORE_BINS
+            self.examples = []
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "rejection_counts": dict(self.rejection_counts),
+                "fallback_counts": [
+                    {"detected": detected, "fallback": fallback, "count": count}
+                    for (detected, fallback), count in self.fallback_counts.most_common()
+                ],
+                "score_histogram": {
+                    "bin_edges": [i / self.NUM_SCORE_BINS for i in range(self.NUM_SCORE_BINS + 1)],
+                    "counts": list(self.score_histogram),
+                },
+                "examples": list(self.examples),
+            }
+
+    @staticmethod
+    def _format_rejection_counts(rejection_counts: Counter) -> AnyStr:
+        return ", ".join("{:d} {}".format(rejection_counts[r], r.replace("_", " ")) for r in sorted(rejection_counts))
+
+    def log_chunk_summary(self) -> None:
+        """
+        Log rejections since the last call, then reset the chunk counters
+        """
+        with self._lock:
+            chunk_rejection_counts = Counter(self.chunk_rejection_counts)
+            self.chunk_rejection_counts.clear()
+        if len(chunk_rejection_counts) != 0:
+            logging.warning(
+                "Replaced {:d} detections by fallback language in chunk: {}".format(
+                    sum(chunk_rejection_counts.values()), self._format_rejection_counts(chunk_rejection_counts)
+                )
+            )
+
+    def log_summary(self, max_num_languages: int = 10) -> None:
+        diagnostics_dict = self.to_dict()
+        rejection_counts = Counter(diagnostics_dict["rejection_counts"])
+        if len(rejection_counts) == 0:
+            logging.info("No detection replaced by fallback language")
+            return
+        logging.warning(
+            "Replaced {:d} detections by fallback language in total: {}".format(
+                sum(rejection_counts.values()), self._format_rejection_counts(rejection_counts)
+            )
+        )
+        fallback_summary = [
+            "'{}' by '{}' ({:d})".format(f["detected"], f["fallback"], f["count"])
+            for f in diagnostics_dict["fallback_counts"][:max_num_languages]
+        ]
+        logging.warning("Most frequent replacements: {}".format(", ".join(fallback_summary)))
+        for example in diagnostics_dict["examples"]:
+            logging.warning("Example of replaced detection: {}".format(json.dumps(example, ensure_ascii=False)))
+        logging.info("Detection score histogram: {}".format(json.dumps(diagnostics_dict["score_histogram"])))
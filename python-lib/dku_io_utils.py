@@ -1,19 +1,63 @@
 # -*- coding: utf-8 -*-
 import logging
 import math
-from typing import Callable, Dict
+import time
+from functools import partial
+from threading import local
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, AnyStr, Iterator, Generator, List
 
 from tqdm import tqdm
 import dataiku
 
+from parallel_utils import iter_prefetched, iter_parallel_ordered, BackgroundConsumer
+from instrumentation import ProcessingMetrics
+from chunk_sizing import AdaptiveChunkSizer
+from incremental_state import IncrementalState
 
-def count_records(dataset: dataiku.Dataset) -> int:
+RECORD_COUNT_METRIC_ID = "records:COUNT_RECORDS"
+RECORD_COUNT_MODES = ("compute", "cached", "none")
+SAMPLING_METHODS = ("random", "stratified")
+_END_OF_ITERATOR = object()
+
+
+def _get_cached_record_count(metric: dataiku.ComputedMetrics, partition: AnyStr = None) -> int:
+    # Last computed value of the record count metric, or None if it was never computed
+    try:
+        if partition is None:
+            data = metric.get_global_data(metric_id=RECORD_COUNT_METRIC_ID)
+        else:
+            data = metric.get_partition_data(partition=partition, metric_id=RECORD_COUNT_METRIC_ID)
+        return dataiku.ComputedMetrics.get_value_from_data(data)
+    except Exception:  # the metrics API raises various errors for missing values
+        return None
+
+
+def count_records(dataset: dataiku.Dataset, mode: AnyStr = "compute", max_workers: int = 1) -> int:
     """
     Count the number of records of a dataset using the Dataiku dataset metrics API
+    - "compute" mode computes the record count metric, which may scan the whole dataset
+    - "cached" mode only uses the last computed values of the metric, and returns None if they are missing
+    In "compute" mode, the metrics of up to max_workers partitions are computed at the same time.
     """
-    metric_id = "records:COUNT_RECORDS"
+    assert mode in RECORD_COUNT_MODES
+    metric_id = RECORD_COUNT_METRIC_ID
     dataset_name = dataset.name.split(".")[1]
     partitions = dataset.read_partitions
+    if mode == "cached":
+        logging.info("Reading last record count of dataset: {}".format(dataset_name))
+        metric = dataset.get_last_metric_values()
+        if partitions is None or len(partitions) == 0:
+            record_count = _get_cached_record_count(metric)
+        else:
+            record_counts = [_get_cached_record_count(metric, partition) for partition in partitions]
+            record_count = None if None in record_counts else sum(record_counts)
+        if record_count is None:
+            logging.info("No record count available for dataset: {}".format(dataset_name))
+        else:
+            logging.info("Dataset contains {:d} records according to the last computed metrics".format(record_count))
+        return record_count
     client = dataiku.api_client()
     project = client.get_project(dataiku.default_project_key())
     logging.info("Counting records of dataset: {}".format(dataset_name))
@@ -23,37 +67,313 @@ def count_records(dataset: dataiku.Dataset) -> int:
         record_count = dataiku.ComputedMetrics.get_value_from_data(metric.get_global_data(metric_id=metric_id))
         logging.info("Dataset contains {:d} records and is not partitioned".format(record_count))
     else:
-        record_count = 0
-        for partition in partitions:
+
+        def count_partition_records(partition):
             project.get_dataset(dataset_name).compute_metrics(partition=partition, metric_ids=[metric_id])
             metric = dataset.get_last_metric_values()
-            record_count += dataiku.ComputedMetrics.get_value_from_data(
+            return dataiku.ComputedMetrics.get_value_from_data(
                 metric.get_partition_data(partition=partition, metric_id=metric_id)
             )
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            record_count = sum(executor.map(count_partition_records, partitions))
         logging.info("Dataset contains {:d} records in partition(s) {}".format(record_count, partitions))
     return record_count
 
 
+def read_dataset_sample(
+    dataset: dataiku.Dataset,
+    columns: List[AnyStr],
+    sample_size: int,
+    sampling: AnyStr = "random",
+    max_workers: int = 1,
+    metrics: ProcessingMetrics = None,
+) -> (Dict, Dict):
+    """
+    Read a random sample of at most sample_size rows of some columns of a dataset, as a dictionary of dataframes
+    per stratum and a dictionary of stratum sizes, from the last computed record counts, or None if unknown.
+    - "random" sampling reads a single stratum named "" for the whole dataset
+    - "stratified" sampling reads the same number of rows in each partition, up to max_workers at the same time,
+      so that small partitions are represented. Non-partitioned datasets fall back to random sampling.
+    The sample size bounds the rows returned, not the rows read: Dataiku random sampling scans the whole dataset,
+    or each partition, so this takes as long as a full read. See iter_streaming_sample for a bounded read.
+    The time spent reading is added to the "read" timer of the metrics.
+    """
+    assert sampling in SAMPLING_METHODS
+    if metrics is None:
+        metrics = ProcessingMetrics()
+    partitions = dataset.read_partitions or []
+    if sampling == "random" or len(partitions) <= 1:
+        logging.info("Reading random sample of {:d} rows".format(sample_size))
+        with metrics.timer("read"):
+            sample_df = dataset.get_dataframe(
+                columns=columns, sampling="random", limit=sample_size, infer_with_pandas=False
+            )
+        return ({"": sample_df}, {"": _get_cached_record_count(dataset.get_last_metric_values())})
+    partition_sample_size = int(math.ceil(sample_size / len(partitions)))
+    logging.info(
+        "Reading stratified sample of {:d} rows in each of {:d} partitions".format(
+            partition_sample_size, len(partitions)
+        )
+    )
+
+    def read_partition_sample(partition):
+        partition_dataset = dataiku.Dataset(dataset.name)
+        partition_dataset.add_read_partitions(partition)
+        with metrics.timer("read"):
+            return partition_dataset.get_dataframe(
+                columns=columns, sampling="random", limit=partition_sample_size, infer_with_pandas=False
+            )
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        sample_dfs = dict(zip(partitions, executor.map(read_partition_sample, partitions)))
+    metric = dataset.get_last_metric_values()
+    stratum_sizes = {partition: _get_cached_record_count(metric, partition) for partition in partitions}
+    if None in stratum_sizes.values():
+        logging.info("No record count available for all partitions, weighting partitions by their sample size")
+    return (sample_dfs, stratum_sizes)
+
+
+def iter_streaming_sample(
+    dataset: dataiku.Dataset,
+    columns: List[AnyStr],
+    sample_size: int,
+    chunksize: int = 10000,
+    metrics: ProcessingMetrics = None,
+) -> Generator:
+    """
+    Iterate over dataframe chunks of a random sample of at most sample_size rows of some columns of a dataset,
+    read in a single streaming pass which stops as soon as the iterator is closed, unlike read_dataset_sample.
+    Rows are kept with a probability of sample_size over the last computed record count, so that the sample spans
+    the whole dataset if it is read to the end. Without record count, the first rows are read.
+    Rows come in the order of the dataset, so that stopping early reads its first part only.
+    The time spent reading is added to the "read" timer of the metrics.
+    """
+    if metrics is None:
+        metrics = ProcessingMetrics()
+    record_count = count_records(dataset, mode="cached")
+    sampling_kwargs = {}
+    if record_count is not None and record_count > sample_size:
+        sampling_kwargs = {"sampling": "random", "ratio": sample_size / record_count}
+        logging.info("Streaming random sample of {:.4%} of rows".format(sampling_kwargs["ratio"]))
+    else:
+        logging.info("Streaming the first {:d} rows".format(sample_size))
+    df_iterator = dataset.iter_dataframes(
+        chunksize=chunksize, infer_with_pandas=False, columns=columns, **sampling_kwargs
+    )
+    num_rows = 0
+    for df in _iter_timed(df_iterator, metrics, "read"):
+        df = df.iloc[: sample_size - num_rows]
+        num_rows += len(df)
+        yield df
+        if num_rows >= sample_size:
+            return
+
+
+def is_append_mode(dataset: dataiku.Dataset) -> bool:
+    """
+    Whether the output dataset of a recipe is set to append instead of overwrite
+    """
+    spec_item = getattr(dataset, "spec_item", None) or {}
+    return bool(spec_item.get("appendMode", False))
+
+
+def _iter_timed(iterator: Iterator, metrics: ProcessingMetrics, timer_name: AnyStr) -> Generator:
+    # Add the time spent getting each item of an iterator to a timer
+    while True:
+        with metrics.timer(timer_name):
+            item = next(iterator, _END_OF_ITERATOR)
+        if item is _END_OF_ITERATOR:
+            return
+        yield item
+
+
 def process_dataset_chunks(
-    input_dataset: dataiku.Dataset, output_dataset: dataiku.Dataset, func: Callable, chunksize: float = 10000, **kwargs
-) -> None:
+    input_dataset: dataiku.Dataset,
+    output_dataset: dataiku.Dataset,
+    func: Callable,
+    chunksize: float = 10000,
+    pipeline_queue_size: int = 0,
+    record_count_mode: AnyStr = "compute",
+    metrics: ProcessingMetrics = None,
+    chunk_sizer: AdaptiveChunkSizer = None,
+    incremental_state: IncrementalState = None,
+    **kwargs
+) -> Dict:
     """
     Read a dataset by chunks, process each dataframe chunk with a function and write back to another dataset.
     Automatically adds a tqdm progress bar and generic logging.
+    If pipeline_queue_size is above 0, chunks are read ahead and written in background threads
+    while the current chunk is processed, with at most pipeline_queue_size chunks waiting in each queue.
+    The record_count_mode sets how the progress bar is sized, see count_records, or "none" for no count.
+    If a chunk sizer is given, the fixed chunksize is ignored: small chunks are read and grouped into chunks
+    of the size chosen by the chunk sizer from the memory and processing time of previous chunks.
+    If an incremental state is given, only rows above its watermark are processed and appended to the output,
+    which must then be set to append instead of overwrite, else a ValueError is raised unless the state is
+    a full rebuild. The output is only recreated for a full rebuild.
+    Timings of the read, process and write stages are added to the metrics, which are returned as a dictionary.
     """
-    logging.info("Processing dataframe chunks of size {:d})...".format(chunksize))
-    with output_dataset.get_writer() as writer:
+    if metrics is None:
+        metrics = ProcessingMetrics()
+    if incremental_state is not None and not incremental_state.is_full_rebuild and not is_append_mode(output_dataset):
+        raise ValueError("Incremental processing requires the output dataset to append instead of overwrite")
+    if chunk_sizer is not None:
+        chunksize = chunk_sizer.min_chunksize
+        logging.info("Processing dataframe chunks of adaptive size...")
+    else:
+        logging.info("Processing dataframe chunks of size {:d})...".format(chunksize))
+    with output_dataset.get_writer() as writer, ExitStack() as pipeline_stack:
         df_iterator = input_dataset.iter_dataframes(chunksize=chunksize, infer_with_pandas=False)
-        len_iterator = math.ceil(count_records(input_dataset) / chunksize)
-        for i, df in tqdm(enumerate(df_iterator), total=len_iterator):
+        df_iterator = _iter_timed(df_iterator, metrics, "read")
+        if chunk_sizer is not None:
+            df_iterator = chunk_sizer.iter_rechunked(df_iterator)
+        record_count = None
+        if record_count_mode != "none":
+            record_count = count_records(input_dataset, mode=record_count_mode)
+        if chunk_sizer is not None:  # progress in rows since the number of chunks is unknown
+            progress_bar = pipeline_stack.enter_context(tqdm(total=record_count, unit="row"))
+        else:
+            len_iterator = math.ceil(record_count / chunksize) if record_count is not None else None
+            progress_bar = pipeline_stack.enter_context(tqdm(total=len_iterator))
+
+        def write_func(output_df):
+            with metrics.timer("write"):
+                writer.write_dataframe(output_df)
+
+        if pipeline_queue_size > 0:
+            logging.info("Pipelining read, process and write with queues of {:d} chunks".format(pipeline_queue_size))
+            df_iterator = iter_prefetched(df_iterator, pipeline_queue_size)
+            write_consumer = BackgroundConsumer(write_func, pipeline_queue_size)
+            write_func = pipeline_stack.enter_context(write_consumer).put
+        is_first_chunk = True
+        is_full_rebuild = incremental_state is None or incremental_state.is_full_rebuild
+        for df in df_iterator:
+            progress_bar.update(len(df) if chunk_sizer is not None else 1)
+            if incremental_state is not None:
+                num_read_rows = len(df)
+                df = incremental_state.filter_new_rows(df)
+                metrics.increment("skipped_rows", num_read_rows - len(df))
+                if len(df) == 0:
+                    continue
+            start = time.perf_counter()
+            with metrics.timer("process"):
+                output_df = func(df=df, **kwargs)
+            if chunk_sizer is not None:
+                chunk_sizer.observe_processing(len(df), time.perf_counter() - start)
+            if is_first_chunk:
+                if is_full_rebuild and (output_dataset.writePartition is None or output_dataset.writePartition == ""):
+                    output_dataset.write_schema_from_dataframe(output_df, dropAndCreate=True)
+                else:
+                    output_dataset.write_schema_from_dataframe(output_df)
+                is_first_chunk = False
+            write_func(output_df)
+            metrics.increment("rows", len(df))
+            metrics.increment("chunks")
+    logging.info("Processing dataframe chunks: Done!")
+    metrics.log_summary()
+    return metrics.to_dict()
+
+
+def _iter_partition_chunks(
+    input_dataset_name: AnyStr,
+    partition: AnyStr,
+    get_func: Callable,
+    chunksize: int,
+    metrics: ProcessingMetrics,
+    chunk_sizer: AdaptiveChunkSizer = None,
+    **kwargs
+) -> Generator:
+    # Read one partition with its own reader and yield processed chunks, logging the time spent on the partition
+    start = time.perf_counter()
+    func = get_func()
+    partition_dataset = dataiku.Dataset(input_dataset_name)
+    partition_dataset.add_read_partitions(partition)
+    if chunk_sizer is not None:
+        chunksize = chunk_sizer.min_chunksize
+    df_iterator = partition_dataset.iter_dataframes(chunksize=chunksize, infer_with_pandas=False)
+    df_iterator = _iter_timed(df_iterator, metrics, "read")
+    if chunk_sizer is not None:
+        df_iterator = chunk_sizer.iter_rechunked(df_iterator)
+    num_rows = 0
+    for df in df_iterator:
+        chunk_start = time.perf_counter()
+        with metrics.timer("process"):
             output_df = func(df=df, **kwargs)
+        if chunk_sizer is not None:
+            chunk_sizer.observe_processing(len(df), time.perf_counter() - chunk_start)
+        num_rows += len(df)
+        yield output_df
+    seconds = time.perf_counter() - start
+    metrics.add_time("partition", seconds)
+    logging.info("Partition {} read and processed: {:d} rows in {:.2f} seconds".format(partition, num_rows, seconds))
+
+
+def process_dataset_partitions(
+    input_dataset: dataiku.Dataset,
+    output_dataset: dataiku.Dataset,
+    func_factory: Callable,
+    partition_workers: int = 4,
+    chunksize: float = 10000,
+    pipeline_queue_size: int = 2,
+    metrics: ProcessingMetrics = None,
+    chunk_sizer: AdaptiveChunkSizer = None,
+    **kwargs
+) -> Dict:
+    """
+    Read the partitions of a dataset in parallel, process each dataframe chunk and write back to another dataset.
+    Each worker thread calls func_factory once to get its own processing function, and each partition has its own
+    reader. At most partition_workers partitions are processed at the same time. Output chunks are written
+    in the order of the read partitions, with at most pipeline_queue_size processed chunks waiting per partition,
+    so that the output is deterministic and memory stays bounded.
+    If a chunk sizer is given, chunk sizes adapt as in process_dataset_chunks, shared by all partitions.
+    Timings are added to the metrics, which are returned as a dictionary.
+    """
+    if metrics is None:
+        metrics = ProcessingMetrics()
+    partitions = list(input_dataset.read_partitions)
+    logging.info(
+        "Processing {:d} partitions with {:d} workers by chunks of size {:d}...".format(
+            len(partitions), partition_workers, chunksize
+        )
+    )
+    worker_state = local()
+
+    def get_worker_func():
+        if not hasattr(worker_state, "func"):
+            worker_state.func = func_factory()
+        return worker_state.func
+
+    iterator_funcs = [
+        partial(
+            _iter_partition_chunks,
+            input_dataset.name,
+            partition,
+            get_worker_func,
+            chunksize,
+            metrics,
+            chunk_sizer,
+            **kwargs
+        )
+        for partition in partitions
+    ]
+    with output_dataset.get_writer() as writer, tqdm(total=len(partitions), unit="partition") as progress_bar:
+        output_iterator = iter_parallel_ordered(iterator_funcs, partition_workers, pipeline_queue_size)
+        for i, (partition_index, output_df) in enumerate(output_iterator):
             if i == 0:
                 if output_dataset.writePartition is None or output_dataset.writePartition == "":
                     output_dataset.write_schema_from_dataframe(output_df, dropAndCreate=True)
                 else:
                     output_dataset.write_schema_from_dataframe(output_df)
-            writer.write_dataframe(output_df)
-    logging.info("Processing dataframe chunks: Done!")
+            progress_bar.update(partition_index - progress_bar.n)  # previous partitions are fully written
+            with metrics.timer("write"):
+                writer.write_dataframe(output_df)
+            metrics.increment("rows", len(output_df))
+            metrics.increment("chunks")
+        progress_bar.update(len(partitions) - progress_bar.n)
+    metrics.increment("partitions", len(partitions))
+    logging.info("Processing partitions: Done!")
+    metrics.log_summary()
+    return metrics.to_dict()
 
 
 def set_column_description(
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import hashlib
+from collections import Counter
+from datetime import datetime
+from typing import Any, AnyStr, Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+class IncrementalState:
+    """
+    Watermark of an incremental run: the maximum value of a key or timestamp column among rows already processed.
+    Only rows at or above the watermark are processed, and the watermark moves up to the maximum value seen.
+    As the watermark column may not be unique, e.g. a timestamp, rows at the watermark are also recorded by a hash
+    of their other values, so that rows already processed are skipped while rows arriving later with the same value are not.
+    The state is tied to a fingerprint of the configuration: when the configuration or the watermark column changes,
+    or when there is no previous state, the run is a full rebuild processing all rows.
+
+    Attributes:
+        watermark_column: Name of the column used as watermark, e.g. an increasing id or an event timestamp
+        config_fingerprint: Hash of the configuration which may change the output
+        watermark: Watermark from the previous run, or None for a full rebuild
+        new_watermark: Watermark after the rows filtered so far in this run
+        boundary_row_hashes: Counts of the hashes of rows at the watermark processed by the previous run
+        new_boundary_row_hashes: Counts of the hashes of rows at the new watermark seen so far in this run
+    """
+
+    STATE_FILE_NAME = "incremental_state.json"
+
+    def __init__(self, watermark_column: AnyStr, config: Dict, previous_state: Dict = None):
+        self.watermark_column = watermark_column
+        self.config_fingerprint = hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf8")).hexdigest()
+        previous_state = previous_state or {}
+        self.watermark = None
+        self.boundary_row_hashes = Counter()
+        if previous_state.get("config_fingerprint") != self.config_fingerprint:
+            logging.info("No previous state for this configuration, running a full rebuild")
+        elif previous_state.get("watermark_column") != watermark_column:
+            logging.info("Watermark column changed, running a full rebuild")
+        else:
+            self.watermark = self._deserialize(previous_state.get("watermark"))
+            self.boundary_row_hashes = Counter(
+                {int(row_hash): count for row_hash, count in (previous_state.get("boundary_row_hashes") or {}).items()}
+            )
+            logging.info("Processing rows with '{}' from watermark: {}".format(watermark_column, self.watermark))
+        self.new_watermark = self.watermark
+        self.new_boundary_row_hashes = Counter()
+
+    @property
+    def is_full_rebuild(self) -> bool:
+        return self.watermark is None
+
+    def force_full_rebuild(self, reason: AnyStr) -> None:
+        """
+        Ignore the watermark of the previous run, to process all rows again
+        """
+        if not self.is_full_rebuild:
+            logging.warning("Running a full rebuild: {}".format(reason))
+        self.watermark = None
+        self.new_watermark = None
+        self.boundary_row_hashes = Counter()
+        self.new_boundary_row_hashes = Counter()
+
+    @staticmethod
+    def _serialize(value: Any) -> Dict:
+        if value is None:
+            return None
+        if isinstance(value, (datetime, pd.Timestamp)):
+            return {"type": "datetime", "value": pd.Timestamp(value).isoformat()}
+        if isinstance(value, (int, np.integer)):
+            return {"type": "int", "value": int(value)}
+        if isinstance(value, (float, np.floating)):
+            return {"type": "float", "value": float(value)}
+        return {"type": "str", "value": str(value)}
+
+    @staticmethod
+    def _deserialize(serialized_value: Dict) -> Any:
+        if serialized_value is None:
+            return None
+        value_type, value = serialized_value["type"], serialized_value["value"]
+        if value_type == "datetime":
+            return pd.Timestamp(value)
+        return {"int": int, "float": float, "str": str}[value_type](value)
+
+    def _hash_rows(self, df: pd.DataFrame) -> List[int]:
+        # Rows compared by hash are at the same watermark, so only the other columns are hashed
+        other_columns = [col for col in df.columns if col != self.watermark_column]
+        if len(other_columns) == 0:
+            return [0] * len(df.index)
+        return [int(row_hash) for row_hash in pd.util.hash_pandas_object(df[other_columns], index=False).values]
+
+    def filter_new_rows(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Keep rows above the watermark and rows at the watermark not processed by the previous run,
+        dropping rows without watermark value, and update the new watermark
+        """
+        watermark_values = df[self.watermark_column]
+        is_new = watermark_values.notnull()
+        if self.watermark is not None:
+            is_new &= watermark_values >= self.watermark
+            is_boundary = (watermark_values == self.watermark).values
+            for i, row_hash in zip(np.flatnonzero(is_boundary), self._hash_rows(df[is_boundary])):
+                if self.boundary_row_hashes[row_hash] > 0:  # as many times as the row was processed
+                    self.boundary_row_hashes[row_hash] -= 1
+                    is_new.iloc[i] = False
+        new_df = df if is_new.all() else df[is_new]
+        if len(new_df.index) != 0:
+            max_value = new_df[self.watermark_column].max()
+            if self.new_watermark is None or max_value > self.new_watermark:
+                self.new_watermark = max_value
+                self.new_boundary_row_hashes = Counter()
+        if self.new_watermark is not None:  # rows at the new watermark, processed in this run or before
+            is_new_boundary = (watermark_values == self.new_watermark).values
+            self.new_boundary_row_hashes.update(self._hash_rows(df[is_new_boundary]))
+        return new_df
+
+    def to_dict(self) -> Dict:
+        return {
+            "config_fingerprint": self.config_fingerprint,
+            "watermark_column": self.watermark_column,
+            "watermark": self._serialize(self.new_watermark),
+            "boundary_row_hashes": {str(row_hash): count for row_hash, count in self.new_boundary_row_hashes.items()},
+        }
+
+    @classmethod
+    def load(cls, folder, watermark_column: AnyStr, config: Dict):
+        """
+        Load the state of the previous run from a Dataiku managed folder
+        """
+        try:
+            previous_state = folder.read_json(cls.STATE_FILE_NAME)
+        except Exception:  # the folder API raises various errors for missing files
+            previous_state = None
+        return cls(watermark_column, config, previous_state)
+
+    def save(self, folder) -> None:
+        """
+        Save the state to a Dataiku managed folder, to be called once all rows are written
+        """
+        folder.write_json(self.STATE_FILE_NAME, self.to_dict())
+        logging.info("Saved incremental state with watermark: {}".format(self.new_watermark))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+import logging
+from threading import Lock
+from contextlib import contextmanager
+from collections import defaultdict
+from typing import AnyStr, Dict
+
+
+class ProcessingMetrics:
+    """
+    Thread-safe collector of named timers and counters, shared between the chunk pipeline and the detector:
+    - Timers for pipeline stages (read, process, write) and detection engines (langid, cld3)
+    - Counters for rows, documents and characters, used to compute throughput over the wall-clock time
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.timer_seconds = defaultdict(float)
+        self.timer_counts = defaultdict(int)
+        self.counters = defaultdict(int)
+        self._lock = Lock()
+
+    def add_time(self, name: AnyStr, seconds: float, count: int = 1) -> None:
+        with self._lock:
+            self.timer_seconds[name] += seconds
+            self.timer_counts[name] += count
+
+    def increment(self, name: AnyStr, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += value
+
+    @contextmanager
+    def timer(self, name: AnyStr, count: int = 1):
+        """
+        Context manager adding the time spent in its block to a named timer.
+        The count is the number of items processed by the block, e.g. the number of documents in a batch.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, count)
+
+    def merge(self, metrics_dict: Dict) -> None:
+        """
+        Merge timers and counters from the output of to_dict, for instance collected in another process
+        """
+        for name, timer in metrics_dict.get("timers", {}).items():
+            self.add_time(name, timer["total_seconds"], timer["count"])
+        for name, value in metrics_dict.get("counters", {}).items():
+            self.increment(name, value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.start_time = time.perf_counter()
+            self.timer_seconds.clear()
+            self.timer_counts.clear()
+            self.counters.clear()
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            wall_clock_seconds = time.perf_counter() - self.start_time
+            timers = {
+                name: {
+                    "count": self.timer_counts[name],
+                    "total_seconds": seconds,
+                    "mean_seconds": seconds / self.timer_counts[name] if self.timer_counts[name] != 0 else 0.0,
+                }
+                for name, seconds in self.timer_seconds.items()
+            }
+            counters = dict(self.counters)
+        throughput = {
+            "{}_per_second".format(name): counters.get(name, 0) / wall_clock_seconds if wall_clock_seconds > 0 else 0.0
+            for name in ("rows", "docs", "chars")
+        }
+        return {
+            "wall_clock_seconds": wall_clock_seconds,
+            "throughput": throughput,
+            "timers": timers,
+            "counters": counters,
+        }
+
+    def log_summary(self) -> None:
+        metrics_dict = self.to_dict()
+        throughput = metrics_dict["throughput"]
+        logging.info(
+            "Processed {:d} rows in {:.1f} seconds: {:.1f} rows/s, {:.1f} docs/s, {:.1f} chars/s".format(
+                metrics_dict["counters"].get("rows", 0),
+                metrics_dict["wall_clock_seconds"],
+                throughput["rows_per_second"],
+                throughput["docs_per_second"],
+                throughput["chars_per_second"],
+            )
+        )
+        for name, timer in sorted(metrics_dict["timers"].items()):
+            logging.info(
+                "Timer '{}': {:.3f} seconds in total for {:d} items, {:.6f} seconds per item".format(
+                    name, timer["total_seconds"], timer["count"], timer["mean_seconds"]
+                )
+            )
+        logging.info("Processing metrics: {}".format(json.dumps(metrics_dict, sort_keys=True)))
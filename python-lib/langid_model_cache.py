@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import array
+import shutil
+import hashlib
+import logging
+import tempfile
+from typing import List, AnyStr, Dict
+
+import numpy as np
+
+from plugin_io_utils import get_package_version
+
+DEFAULT_MODEL_CACHE_DIR = os.path.join(tempfile.gettempdir(), "dss-plugin-nlp-language-detection", "langid_models")
+MODEL_CACHE_FORMAT_VERSION = 2  # 2: float64 model arrays
+
+
+def _get_model_dir(languages: List[AnyStr], model_cache_dir: AnyStr) -> AnyStr:
+    model_key = {
+        "languages": sorted(languages),
+        "langid_version": get_package_version("langid"),
+        "format_version": MODEL_CACHE_FORMAT_VERSION,
+    }
+    return os.path.join(model_cache_dir, hashlib.sha1(json.dumps(model_key).encode("utf8")).hexdigest())
+
+
+def _encode_tk_output(tk_output: Dict) -> (np.array, np.array, np.array):
+    # Flatten the dictionary of tokenizer state to feature indices into arrays
+    states = np.array(sorted(tk_output.keys()), dtype=np.int64)
+    feature_indices = [tk_output[state] for state in states.tolist()]
+    offsets = np.cumsum([0] + [len(indices) for indices in feature_indices], dtype=np.int64)
+    return (states, offsets, np.array([i for indices in feature_indices for i in indices], dtype=np.int64))
+
+
+def _decode_tk_output(states: np.array, offsets: np.array, indices: np.array) -> Dict:
+    indices = indices.tolist()
+    return {
+        state: tuple(indices[start:end])
+        for state, start, end in zip(states.tolist(), offsets[:-1].tolist(), offsets[1:].tolist())
+    }
+
+
+def _cast_model_to_float64(identifier):
+    # Batch scoring uses float64 arrays, stored as such so that memory-mapped models are used without copy
+    identifier.nb_ptc = np.ascontiguousarray(identifier.nb_ptc, dtype=np.float64)
+    identifier.nb_pc = np.ascontiguousarray(identifier.nb_pc, dtype=np.float64)
+    return identifier
+
+
+def compile_langid_model(languages: List[AnyStr], model_dir: AnyStr):
+    """
+    Decode the langid model, restrict it to a list of languages and save it as .npy files in a directory.
+    Files are written to a temporary directory first, so that concurrent processes never read a partial model.
+    """
+    # Importing langid.langid always evaluates its model string, but only decoding it is slow, about 2 seconds
+    from langid.langid import LanguageIdentifier, model
+
+    identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
+    identifier.set_languages(languages)
+    _cast_model_to_float64(identifier)
+    try:
+        os.makedirs(os.path.dirname(model_dir), exist_ok=True)
+        temp_model_dir = tempfile.mkdtemp(dir=os.path.dirname(model_dir))
+        np.save(os.path.join(temp_model_dir, "nb_ptc.npy"), identifier.nb_ptc)
+        np.save(os.path.join(temp_model_dir, "nb_pc.npy"), identifier.nb_pc)
+        np.save(os.path.join(temp_model_dir, "nb_classes.npy"), np.array(identifier.nb_classes))
+        tk_nextmove = np.frombuffer(identifier.tk_nextmove, dtype=np.dtype(identifier.tk_nextmove.typecode))
+        np.save(os.path.join(temp_model_dir, "tk_nextmove.npy"), tk_nextmove)
+        for name, tk_output_array in zip(
+            ("tk_output_states", "tk_output_offsets", "tk_output_indices"), _encode_tk_output(identifier.tk_output)
+        ):
+            np.save(os.path.join(temp_model_dir, name + ".npy"), tk_output_array)
+        os.chmod(temp_model_dir, 0o755)  # mkdtemp restricts access to the current user
+        try:
+            os.rename(temp_model_dir, model_dir)
+            logging.info("Compiled langid model for {:d} languages in: {}".format(len(languages), model_dir))
+        except OSError:  # compiled at the same time by another process
+            shutil.rmtree(temp_model_dir, ignore_errors=True)
+    except OSError as error:
+        logging.warning("Could not save compiled langid model in {}: {}".format(model_dir, error))
+    return identifier
+
+
+def load_langid_identifier(languages: List[AnyStr], model_cache_dir: AnyStr = DEFAULT_MODEL_CACHE_DIR):
+    """
+    Load a langid LanguageIdentifier restricted to a list of languages.
+    The restricted model is compiled once into a cache directory of .npy files, which are then memory-mapped,
+    so that loading skips decoding the langid model string, which takes seconds, and processes using the same model
+    share the same physical memory pages. Importing langid itself still takes about 100 milliseconds.
+    Model arrays are float64, as used by batch scoring, which gives the same scores as the float32 langid model
+    since langid computes dot products in float64.
+    If model_cache_dir is None, the model is decoded from the langid model string without cache.
+    """
+    from langid.langid import LanguageIdentifier, model  # decoding the model string is skipped on a cache hit
+
+    if model_cache_dir is None:
+        identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
+        identifier.set_languages(languages)
+        return _cast_model_to_float64(identifier)
+    model_dir = _get_model_dir(languages, model_cache_dir)
+    if not os.path.isdir(model_dir):
+        return compile_langid_model(languages, model_dir)
+    nb_ptc = np.load(os.path.join(model_dir, "nb_ptc.npy"), mmap_mode="r")
+    nb_pc = np.load(os.path.join(model_dir, "nb_pc.npy"), mmap_mode="r")
+    nb_classes = np.load(os.path.join(model_dir, "nb_classes.npy")).tolist()
+    tk_nextmove_array = np.load(os.path.join(model_dir, "tk_nextmove.npy"), mmap_mode="r")
+    # array.array is faster than numpy for the element-wise lookups of the tokenizer
+    tk_nextmove = array.array(tk_nextmove_array.dtype.char, tk_nextmove_array.tobytes())
+    tk_output = _decode_tk_output(
+        *[
+            np.load(os.path.join(model_dir, name + ".npy"))
+            for name in ("tk_output_states", "tk_output_offsets", "tk_output_indices")
+        ]
+    )
+    return LanguageIdentifier(nb_ptc, nb_pc, nb_ptc.shape[0], nb_classes, tk_nextmove, tk_output, norm_probs=True)
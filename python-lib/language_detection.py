@@ -1,30 +1,109 @@
 # -*- coding: utf-8 -*-
+import json
+import time
 import logging
-from typing import List, AnyStr
+import hashlib
+import threading
+from typing import List, AnyStr, Tuple, Dict, Iterable, Generator, Callable, Union
 from concurrent.futures import ThreadPoolExecutor
-from collections import OrderedDict
+from multiprocessing import Pool
+from collections import OrderedDict, defaultdict, deque
+from itertools import islice
 
+import numpy as np
 import pandas as pd
-import cld3
-from langid.langid import LanguageIdentifier, model
 
-from language_dict import SUPPORTED_LANGUAGES, SUPPORTED_LANGUAGES_IN_CLD3_NOT_IN_LANGID, LANGUAGE_REMAPPING
+from language_dict import SUPPORTED_LANGUAGES
 
 from plugin_io_utils import generate_unique
+from langid_model_cache import DEFAULT_MODEL_CACHE_DIR
+from parallel_utils import get_available_cpu_count
+from detection_cache import LRUDetectionCache, PersistentDetectionCache
+from instrumentation import ProcessingMetrics
+from diagnostics import DetectionDiagnostics
+from script_detection import ScriptClassifier
+from text_normalization import TextNormalizer
+from profiling import DetectionProfiler
+from detection_engines import DetectionEngine, create_engine
 
 supported_languages_dict = {k["value"]: k["label"] for k in SUPPORTED_LANGUAGES}
 
 
+def truncate_utf8(doc: AnyStr, max_num_bytes: int) -> AnyStr:
+    """
+    Truncate a document to at most max_num_bytes bytes in UTF-8, without cutting a multi-byte character
+    """
+    if len(doc) * 4 <= max_num_bytes:  # no UTF-8 character takes more than 4 bytes
+        return doc
+    # The first max_num_bytes characters always contain the first max_num_bytes bytes, so encode only those
+    return doc[:max_num_bytes].encode("utf8")[:max_num_bytes].decode("utf8", errors="ignore")
+
+
+_process_worker_detector = None  # LanguageDetector built once per worker of the process backend
+
+
+def _init_process_worker(detector_kwargs: Dict, profiling: bool = False) -> None:
+    global _process_worker_detector
+    _process_worker_detector = LanguageDetector(**detector_kwargs)
+    if profiling:  # histograms are sent back with each batch, as the profiler itself cannot be pickled
+        _process_worker_detector.profiler = DetectionProfiler()
+
+
+def _detect_language_batch_in_process(docs: List[AnyStr]) -> (np.array, np.array, Dict, Dict, Dict):
+    # Return compact arrays rather than a list of tuples to limit pickling between processes
+    _process_worker_detector.metrics.reset()
+    _process_worker_detector.diagnostics.reset()
+    if _process_worker_detector.profiler is not None:
+        _process_worker_detector.profiler = DetectionProfiler()
+    lang_output_tuple_list = _process_worker_detector.detect_language_batch(docs)
+    lang_ids = np.array([t[0] for t in lang_output_tuple_list], dtype=object)
+    lang_probabilities = np.array([np.nan if t[2] is None else t[2] for t in lang_output_tuple_list], dtype=float)
+    return (
+        lang_ids,
+        lang_probabilities,
+        _process_worker_detector.metrics.to_dict(),
+        _process_worker_detector.diagnostics.to_dict(),
+        _process_worker_detector.profiler.to_dict() if _process_worker_detector.profiler is not None else None,
+    )
+
+
+def create_process_pool(num_workers: int = None, profiling: bool = False, **detector_kwargs) -> Pool:
+    """
+    Start a pool of processes for the process backend, each with a LanguageDetector built from detector_kwargs.
+    The pool can be shared by detectors of the same configuration with their process_pool argument,
+    so that the total number of processes stays within num_workers. It must then be closed by the caller.
+    Call it before starting any thread: forking a process while other threads run may deadlock on locks held
+    by these threads, e.g. logging locks.
+    """
+    if num_workers is None or num_workers <= 0:
+        num_workers = get_available_cpu_count()
+    if threading.active_count() > 1:
+        logging.warning("Starting detection processes while threads are running, start them before")
+    logging.info("Starting pool of {:d} language detection processes".format(num_workers))
+    return Pool(processes=num_workers, initializer=_init_process_worker, initargs=(detector_kwargs, profiling))
+
+
 class LanguageDetector:
     """
-    Language detection wrapper class on top of cld3 and langid, with additional features:
-    - Route to cld3 for documents with more than 140 characters, else langid
-    - Harmonize small differences between cld3 and langid language scopes
+    Language detection wrapper class on top of detection engines, cld3 and langid by default, with additional features:
+    - Route to the long document engine for documents longer than a routing threshold, 140 characters by default,
+      else to the short document engine. Engines are chosen by name among registered DetectionEngine classes.
+    - Harmonize small differences between engine language codes
     - Add filter on language scope and minimum confidence score, else replace detection by fallback
+    - Run detection on dataframes or on any iterable of documents with a thread or process pool backend
+    - Detect each unique document once per dataframe, with an optional LRU cache across dataframes
+      and an optional persistent cache across runs
+    - Bound the cost of very long documents with a maximum number of bytes and an optional progressive mode
+      scoring sampled windows until the detected language is stable
+    - Record latency histograms per engine and document length with an optional profiler, disabled by default
     """
 
     LANGID_CLD3_NUM_CHAR_THRESHOLD = 140
     NUM_THREADS = 4
+    PROGRESSIVE_WINDOW_NUM_CHAR = 1000
+    PROGRESSIVE_MAX_NUM_WINDOWS = 8
+    PROGRESSIVE_SCORE_TOLERANCE = 0.05
+    EXECUTION_BACKENDS = ("thread", "process")
     COLUMN_DESCRIPTION_DICT = OrderedDict(
         [
             ("language_code", "Language code in ISO 639-1 format"),
@@ -38,72 +117,531 @@ class LanguageDetector:
         language_scope: List = supported_languages_dict.keys(),
         minimum_score: float = 0.0,
         fallback_language: AnyStr = "",
+        backend: AnyStr = "thread",
+        num_workers: int = None,
+        cache_size: int = 0,
+        persistent_cache_path: AnyStr = None,
+        persistent_cache_size: int = 10000000,
+        metrics: ProcessingMetrics = None,
+        max_num_bytes: int = 0,
+        progressive_detection: bool = False,
+        model_cache_dir: AnyStr = DEFAULT_MODEL_CACHE_DIR,
+        script_fast_path: bool = False,
+        normalization_steps: List[AnyStr] = None,
+        profiler: DetectionProfiler = None,
+        routing_threshold: int = None,
+        short_doc_engine: AnyStr = "langid",
+        long_doc_engine: AnyStr = "cld3",
+        process_pool: Pool = None,
     ):
+        if backend not in self.EXECUTION_BACKENDS:
+            raise ValueError("Execution backend '{}' not in {}".format(backend, self.EXECUTION_BACKENDS))
         self.language_scope = language_scope
+        self._language_scope_set = set(language_scope)
         self.minimum_score = float(minimum_score)
         self.fallback_language = fallback_language
+        self.backend = backend
+        if num_workers is None or num_workers <= 0:
+            num_workers = self.NUM_THREADS if backend == "thread" else get_available_cpu_count()
+        self.num_workers = int(num_workers)
+        self.max_num_bytes = int(max_num_bytes)  # 0 means no maximum
+        self.progressive_detection = progressive_detection
+        self.routing_threshold = (
+            int(routing_threshold) if routing_threshold is not None else self.LANGID_CLD3_NUM_CHAR_THRESHOLD
+        )
+        self.script_fast_path = script_fast_path
+        self.script_classifier = ScriptClassifier(language_scope) if script_fast_path else None
+        self.normalization_steps = list(normalization_steps) if normalization_steps else []  # empty means disabled
+        self.text_normalizer = TextNormalizer(self.normalization_steps) if self.normalization_steps else None
+        self.short_doc_engine = create_engine(short_doc_engine, language_scope, model_cache_dir)
+        self.long_doc_engine = create_engine(long_doc_engine, language_scope, model_cache_dir)
+        self._process_pool = process_pool  # created on first use, unless shared with create_process_pool
+        self._owns_process_pool = process_pool is None
+        self._thread_pool = None  # created on first use
+        self._pool_lock = threading.Lock()  # pools may be first used by several threads at once, e.g. in a service
+        self.metrics = metrics if metrics is not None else ProcessingMetrics()
+        self.profiler = profiler  # None disables profiling
+        self.diagnostics = DetectionDiagnostics()
+        self.cache = LRUDetectionCache(cache_size) if cache_size > 0 else None
+        self.persistent_cache = None
+        if persistent_cache_path is not None:
+            self.persistent_cache = PersistentDetectionCache(
+                persistent_cache_path, self.get_config_fingerprint(), persistent_cache_size
+            )
         self.column_description_dict = self.COLUMN_DESCRIPTION_DICT  # may be changed by detect_languages_df
-        self._langid_identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
-        self._langid_identifier.set_languages(
-            [l for l in self.language_scope if l not in SUPPORTED_LANGUAGES_IN_CLD3_NOT_IN_LANGID]
+        self.model_cache_dir = model_cache_dir
+
+    def get_config_fingerprint(self) -> AnyStr:
+        """
+        Hash of all the parameters which may change detection results, including engine versions
+        """
+        config = {
+            "language_scope": sorted(self.language_scope),
+            "minimum_score": self.minimum_score,
+            "fallback_language": self.fallback_language,
+            "langid_cld3_num_char_threshold": self.routing_threshold,
+            "max_num_bytes": self.max_num_bytes,
+            "progressive_detection": self.progressive_detection,
+            "script_fast_path": self.script_fast_path,
+            "normalization_steps": self.normalization_steps,
+            "short_doc_engine": [self.short_doc_engine.name, self.short_doc_engine.version],
+            "long_doc_engine": [self.long_doc_engine.name, self.long_doc_engine.version],
+        }
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf8")).hexdigest()
+
+    def _progressive_detection(self, doc: AnyStr) -> (AnyStr, float):
+        """
+        Score windows spread over the document, in the order: start, middle, quarters, eighths...
+        Stop once the language with the highest total score and its mean score are stable from one window to the next.
+        """
+        window_size = self.PROGRESSIVE_WINDOW_NUM_CHAR
+        num_windows = min(self.PROGRESSIVE_MAX_NUM_WINDOWS, int(np.ceil(len(doc) / window_size)))
+        window_fractions = [0.0] + [(2 * i + 1) / 2 ** (k + 1) for k in range(4) for i in range(2**k)]
+        total_scores, scores = defaultdict(float), defaultdict(list)
+        previous_lang_id, previous_lang_probability = None, None
+        for window_fraction in window_fractions[:num_windows]:
+            start = int(window_fraction * max(len(doc) - window_size, 0))
+            lang_ids, lang_probabilities = self.long_doc_engine.detect_batch([doc[start : start + window_size]])
+            lang_id, lang_probability = lang_ids[0], float(lang_probabilities[0])
+            self.metrics.increment("progressive_windows")
+            total_scores[lang_id] += lang_probability
+            scores[lang_id].append(lang_probability)
+            best_lang_id = max(total_scores, key=total_scores.get)
+            best_lang_probability = float(np.mean(scores[best_lang_id]))
+            if best_lang_id == previous_lang_id and (
+                abs(best_lang_probability - previous_lang_probability) <= self.PROGRESSIVE_SCORE_TOLERANCE
+            ):
+                self.metrics.increment("progressive_early_stops")
+                break
+            previous_lang_id, previous_lang_probability = best_lang_id, best_lang_probability
+        return (best_lang_id, best_lang_probability)
+
+    def _long_doc_detection_batch(self, docs: List[AnyStr]) -> (List[AnyStr], np.array):
+        # Bounded-cost detection for documents above the routing threshold
+        if self.max_num_bytes > 0:
+            truncated_docs = [truncate_utf8(doc, self.max_num_bytes) for doc in docs]
+            num_truncated_chars = [len(doc) - len(truncated_doc) for doc, truncated_doc in zip(docs, truncated_docs)]
+            self.metrics.increment("truncated_docs", sum(1 for num_chars in num_truncated_chars if num_chars != 0))
+            self.metrics.increment("truncated_chars", sum(num_truncated_chars))
+            docs = truncated_docs
+        if not self.progressive_detection:
+            return self.long_doc_engine.detect_batch(docs)
+        lang_ids, lang_probabilities = [""] * len(docs), np.zeros(len(docs))
+        batch_indices = []
+        for i, doc in enumerate(docs):
+            if len(doc) > self.PROGRESSIVE_WINDOW_NUM_CHAR:
+                lang_ids[i], lang_probabilities[i] = self._progressive_detection(doc)
+            else:
+                batch_indices.append(i)
+        batch_lang_ids, batch_lang_probabilities = self.long_doc_engine.detect_batch([docs[i] for i in batch_indices])
+        for i, lang_id, lang_probability in zip(batch_indices, batch_lang_ids, batch_lang_probabilities):
+            lang_ids[i], lang_probabilities[i] = lang_id, lang_probability
+        return (lang_ids, lang_probabilities)
+
+    def _run_engine(
+        self, engine: DetectionEngine, detect_batch: Callable, docs: List[AnyStr]
+    ) -> (List[AnyStr], np.array):
+        """
+        Run the batch detection function of an engine, recording its time in metrics.
+        With a profiler, documents are detected by bucket of length to record the latency of each bucket.
+        """
+        if len(docs) == 0:
+            return ([], np.zeros(0))
+        if self.profiler is None:
+            with self.metrics.timer(engine.name, count=len(docs)):
+                return detect_batch(docs)
+        doc_lengths = np.array([len(doc) for doc in docs])
+        length_buckets = np.searchsorted(self.profiler.LENGTH_BUCKET_EDGES, doc_lengths, side="right")
+        lang_ids, lang_probabilities = [""] * len(docs), np.zeros(len(docs))
+        for length_bucket in np.unique(length_buckets):
+            indices = np.flatnonzero(length_buckets == length_bucket)
+            start = time.perf_counter()
+            bucket_lang_ids, lang_probabilities[indices] = detect_batch([docs[i] for i in indices])
+            seconds = time.perf_counter() - start
+            self.metrics.add_time(engine.name, seconds, len(indices))
+            self.profiler.record_engine_latency(
+                engine.name, doc_lengths[indices], [seconds / len(indices)] * len(indices)
+            )
+            for i, lang_id in zip(indices, bucket_lang_ids):
+                lang_ids[i] = lang_id
+        return (lang_ids, lang_probabilities)
+
+    def _postprocess_detection_arrays(
+        self, docs: List[AnyStr], engine_codes: List[AnyStr], lang_probabilities: np.array
+    ) -> (np.array, np.array, np.array):
+        """
+        Post-process engine outputs for a batch with array operations: filter on language scope
+        and minimum score with fallback, enrich with language names and round scores.
+        Documents without engine output have an empty code. Return arrays of codes, names and scores,
+        with NaN for missing scores. Problems are aggregated in diagnostics rather than logged for each document.
+        """
+        code_indices, unique_engine_codes = pd.factorize(np.asarray(engine_codes, dtype=object))
+        unique_lang_ids = np.array(unique_engine_codes.tolist() + [""], dtype=object)
+        unique_in_scope = np.array([lang_id in self._language_scope_set for lang_id in unique_lang_ids])
+        lang_ids, in_scope = unique_lang_ids[code_indices], unique_in_scope[code_indices]
+        lang_probabilities = np.asarray(lang_probabilities, dtype=np.float64)
+        is_detected = lang_ids != ""
+        self.diagnostics.add_scores(lang_probabilities[is_detected])
+        is_out_of_scope = is_detected & ~in_scope
+        is_below_minimum_score = is_detected & in_scope & (lang_probabilities < self.minimum_score)
+        for reason, is_rejected in [("out_of_scope", is_out_of_scope), ("below_minimum_score", is_below_minimum_score)]:
+            rejected_indices = np.flatnonzero(is_rejected)
+            if len(rejected_indices) != 0:
+                self.diagnostics.add_rejections(
+                    [docs[i] for i in rejected_indices],
+                    lang_ids[rejected_indices].tolist(),
+                    lang_probabilities[rejected_indices].tolist(),
+                    reason,
+                    self.fallback_language,
+                )
+        is_rejected = is_out_of_scope | is_below_minimum_score
+        lang_ids[is_rejected] = self.fallback_language
+        lang_probabilities = np.round(lang_probabilities, 3)
+        lang_probabilities[is_rejected | (lang_probabilities == 0)] = np.nan
+        name_indices, unique_output_lang_ids = pd.factorize(lang_ids)
+        unique_lang_names = np.array(
+            [supported_languages_dict.get(lang_id, "") for lang_id in unique_output_lang_ids] + [""], dtype=object
         )
+        return (lang_ids, unique_lang_names[name_indices], lang_probabilities)
+
+    def detect_language_doc(self, doc: AnyStr) -> (AnyStr, AnyStr, float):
+        return self.detect_language_batch([doc])[0]
 
-    def _langid_detection(self, doc: AnyStr) -> (AnyStr, float):
-        language_detection_object = self._langid_identifier.classify(doc)
-        lang_id = language_detection_object[0][:2]
-        lang_probability = float(language_detection_object[1])
-        return (lang_id, lang_probability)
-
-    def _cld3_detection(self, doc: AnyStr) -> (AnyStr, float):
-        language_detection_object = cld3.get_language(doc)
-        lang_id = language_detection_object.language[:2]
-        for original_code, new_code in LANGUAGE_REMAPPING.items():  # make cld3 compatible with langid
-            lang_id = lang_id.replace(original_code, new_code)
-        lang_probability = float(language_detection_object.probability)
-        return (lang_id, lang_probability)
-
-    def _detection_filter(self, doc: AnyStr, lang_id: AnyStr, lang_probability: float) -> (AnyStr, float):
-        if lang_probability < self.minimum_score or lang_id not in self.language_scope:
-            warning_msg = "Problem encountered for document: '{}'.\n".format(doc)
-            if lang_id not in self.language_scope:
-                warning_msg += "Detected language: '{}' not within language scope: {}.\n".format(
-                    lang_id, self.language_scope
+    def detect_language_batch(self, docs: List[AnyStr]) -> List[Tuple[AnyStr, AnyStr, float]]:
+        """
+        Detect languages of a list of documents, returning (language code, language name, score) tuples.
+        Documents are normalized, then routed to the script fast path, or to the short or long document engine
+        depending on their length. Each engine detects all its documents of the batch at once,
+        and their outputs are post-processed as arrays.
+        """
+        engine_codes = [""] * len(docs)
+        lang_probabilities = np.full(len(docs), np.nan)
+        short_circuited_indices = []
+        short_doc_indices, long_doc_indices = [], []
+        num_docs, num_chars = 0, 0
+        clean_docs = docs
+        if self.text_normalizer is not None:
+            with self.metrics.timer("normalization", count=len(docs)):
+                clean_docs = self.text_normalizer.normalize_batch(docs)
+            num_removed_chars = 0
+        script_lang_ids = None
+        if self.script_classifier is not None:
+            with self.metrics.timer("script", count=len(docs)):
+                script_lang_ids, script_probabilities = self.script_classifier.classify_batch(
+                    [doc if doc is not None else "" for doc in clean_docs]
                 )
+            self.metrics.increment("script_fast_path_docs", int(np.count_nonzero(script_lang_ids)))
+        for i, (doc, clean_doc) in enumerate(zip(docs, clean_docs)):
+            if doc is None or doc == "":
+                continue
+            num_docs += 1
+            num_chars += len(doc)
+            if self.text_normalizer is not None:
+                num_removed_chars += len(doc) - len(clean_doc)
+                if not self.text_normalizer.has_alphabetic_content(clean_doc):
+                    short_circuited_indices.append(i)
+                    continue
+            if script_lang_ids is not None and script_lang_ids[i] != "":
+                engine_codes[i], lang_probabilities[i] = script_lang_ids[i], script_probabilities[i]
+            elif len(clean_doc) <= self.routing_threshold:
+                short_doc_indices.append(i)
             else:
-                warning_msg += "Confidence score: {:.2f} below minimum: {:.2f}.\n".format(
-                    lang_probability, self.minimum_score
+                long_doc_indices.append(i)
+        self.metrics.increment("docs", num_docs)
+        self.metrics.increment("chars", num_chars)
+        if self.text_normalizer is not None:
+            self.metrics.increment("normalization_removed_chars", num_removed_chars)
+            self.metrics.increment("normalization_short_circuited_docs", len(short_circuited_indices))
+        for engine, detect_batch, indices in [
+            (self.short_doc_engine, self.short_doc_engine.detect_batch, short_doc_indices),
+            (self.long_doc_engine, self._long_doc_detection_batch, long_doc_indices),
+        ]:
+            engine_output = self._run_engine(engine, detect_batch, [clean_docs[i] for i in indices])
+            for i, engine_code in zip(indices, engine_output[0]):
+                engine_codes[i] = engine_code
+            lang_probabilities[indices] = engine_output[1]
+        with self.metrics.timer("postprocessing", count=len(docs)):
+            lang_ids, lang_names, lang_probabilities = self._postprocess_detection_arrays(
+                docs, engine_codes, lang_probabilities
+            )
+            output = list(
+                zip(
+                    lang_ids.tolist(),
+                    lang_names.tolist(),
+                    [None if p != p else p for p in lang_probabilities.tolist()],  # NaN is the only p != p
                 )
-            warning_msg += "Replacing detected language: '{}' by fallback: '{}'.".format(
-                lang_id, self.fallback_language
             )
-            logging.warning(warning_msg)
-            lang_id, lang_probability = self.fallback_language, None
-        return (lang_id, lang_probability)
+        for i in short_circuited_indices:
+            output[i] = self._short_circuit_detection(docs[i])
+        return output
 
-    def detect_language_doc(self, doc: AnyStr) -> (AnyStr, AnyStr, float):
-        # Route to langid or cld3 depending on number of characters
-        if doc is None or doc == "":
-            return ("", "", None)
-        if len(doc) <= self.LANGID_CLD3_NUM_CHAR_THRESHOLD:
-            lang_id, lang_probability = self._langid_detection(doc)
+    def _short_circuit_detection(self, doc: AnyStr) -> (AnyStr, AnyStr, float):
+        # Documents without alphabetic content after normalization get the fallback language without detection
+        self.diagnostics.add_rejection(doc, "", 0.0, "no_alphabetic_content", self.fallback_language)
+        return (self.fallback_language, supported_languages_dict.get(self.fallback_language, ""), None)
+
+    def start(self) -> None:
+        """
+        Start the worker processes of the process backend, to be called before the caller starts any thread:
+        forking a process while other threads run may deadlock on locks held by these threads, e.g. logging locks
+        """
+        if self.backend == "process":
+            self._get_process_pool()
+
+    def _get_process_pool(self) -> Pool:
+        with self._pool_lock:
+            if self._process_pool is None:
+                self._process_pool = create_process_pool(
+                    num_workers=self.num_workers,
+                    profiling=self.profiler is not None,
+                    language_scope=list(self.language_scope),
+                    minimum_score=self.minimum_score,
+                    fallback_language=self.fallback_language,
+                    max_num_bytes=self.max_num_bytes,
+                    progressive_detection=self.progressive_detection,
+                    model_cache_dir=self.model_cache_dir,
+                    script_fast_path=self.script_fast_path,
+                    normalization_steps=self.normalization_steps,
+                    routing_threshold=self.routing_threshold,
+                    short_doc_engine=self.short_doc_engine.name,
+                    long_doc_engine=self.long_doc_engine.name,
+                )
+            return self._process_pool
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(max_workers=self.num_workers)
+            return self._thread_pool
+
+    def close(self) -> None:
+        """
+        Log diagnostics and cache statistics, and stop worker threads and processes, if they were started
+        """
+        self.diagnostics.log_summary()
+        if self.cache is not None:
+            self.cache.log_stats()
+        if self.persistent_cache is not None:
+            self.persistent_cache.log_stats()
+            self.persistent_cache.close()
+            self.persistent_cache = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown()
+            self._thread_pool = None
+        if self._process_pool is not None:
+            if self._owns_process_pool:
+                self._process_pool.close()
+                self._process_pool.join()
+            self._process_pool = None
+
+    def _decode_process_output(self, process_output: Tuple) -> List[Tuple[AnyStr, AnyStr, float]]:
+        # Convert the compact output of _detect_language_batch_in_process back to tuples
+        lang_ids, lang_probabilities, metrics_dict, diagnostics_dict, profiler_dict = process_output
+        self.metrics.merge(metrics_dict)
+        self.diagnostics.merge(diagnostics_dict)
+        if profiler_dict is not None:
+            self.profiler.merge(profiler_dict)
+        lang_output_tuple_list = []
+        for lang_id, lang_probability in zip(lang_ids.tolist(), lang_probabilities.tolist()):
+            lang_probability = None if np.isnan(lang_probability) else lang_probability
+            lang_output_tuple_list.append((lang_id, supported_languages_dict.get(lang_id, ""), lang_probability))
+        return lang_output_tuple_list
+
+    def _detect_languages_process_pool(self, doc_slices: List[List[AnyStr]]) -> List[Tuple[AnyStr, AnyStr, float]]:
+        process_output_list = self._get_process_pool().map(_detect_language_batch_in_process, doc_slices)
+        return [t for process_output in process_output_list for t in self._decode_process_output(process_output)]
+
+    def _detect_languages_parallel(
+        self, doc_list: List[AnyStr], sequential: bool = False
+    ) -> List[Tuple[AnyStr, AnyStr, float]]:
+        if sequential:  # in the calling thread, for instance to be captured by cProfile
+            return self.detect_language_batch(doc_list)
+        # Contiguous slices so that each worker scores its short documents in batches
+        slice_size = max(1, int(np.ceil(len(doc_list) / self.num_workers)))
+        doc_slices = [doc_list[i : i + slice_size] for i in range(0, len(doc_list), slice_size)]
+        if self.backend == "process":
+            lang_output_tuple_list = self._detect_languages_process_pool(doc_slices)
         else:
-            lang_id, lang_probability = self._cld3_detection(doc)
-        # Filters for language scope and minimum scores
-        lang_id, lang_probability = self._detection_filter(doc, lang_id, lang_probability)
-        # Enrich with language human name
-        lang_name = supported_languages_dict.get(lang_id, "")
-        # Round probability to 3 decimals
-        lang_probability = round(lang_probability, 3) if lang_probability else None
-        return (lang_id, lang_name, lang_probability)
-
-    def detect_languages_df(self, df: pd.DataFrame, text_column: AnyStr) -> pd.DataFrame:
-        self.column_description_dict = OrderedDict()
-        for k, v in self.COLUMN_DESCRIPTION_DICT.items():
-            self.column_description_dict[generate_unique(k, df.keys(), text_column)] = v
-        doc_iterator = (doc for _, doc in df[text_column].astype(str).iteritems())
-        output_df = df.copy()
-        with ThreadPoolExecutor(max_workers=self.NUM_THREADS) as executor:
-            lang_output_tuple_list = list(executor.map(self.detect_language_doc, doc_iterator))
-        for i, col in enumerate(self.column_description_dict.keys()):
-            output_df[col] = [t[i] for t in lang_output_tuple_list]
+            lang_output_tuple_list = [
+                t for s in self._get_thread_pool().map(self.detect_language_batch, doc_slices) for t in s
+            ]
+        return lang_output_tuple_list
+
+    def _lookup_caches(self, unique_doc_list: List[AnyStr]) -> (Dict, List[AnyStr]):
+        # Look up the in-memory then the persistent cache, and return cached results and documents to detect
+        lang_output_dict = self.cache.get_many(unique_doc_list) if self.cache is not None else {}
+        docs_to_detect = [doc for doc in unique_doc_list if doc not in lang_output_dict]
+        if self.persistent_cache is not None and len(docs_to_detect) != 0:
+            persistent_lang_output_dict = self.persistent_cache.get_many(docs_to_detect)
+            if self.cache is not None:
+                self.cache.set_many(
+                    list(persistent_lang_output_dict.keys()), list(persistent_lang_output_dict.values())
+                )
+            lang_output_dict.update(persistent_lang_output_dict)
+            docs_to_detect = [doc for doc in docs_to_detect if doc not in persistent_lang_output_dict]
+        return (lang_output_dict, docs_to_detect)
+
+    def _store_in_caches(self, docs: List[AnyStr], lang_output_tuple_list: List[Tuple]) -> None:
+        if self.cache is not None:
+            self.cache.set_many(docs, lang_output_tuple_list)
+        if self.persistent_cache is not None:
+            self.persistent_cache.set_many(docs, lang_output_tuple_list)
+
+    def _detect_languages_unique(
+        self, unique_doc_list: List[AnyStr], sequential: bool = False
+    ) -> List[Tuple[AnyStr, AnyStr, float]]:
+        lang_output_dict, docs_to_detect = self._lookup_caches(unique_doc_list)
+        detected_lang_output_tuple_list = self._detect_languages_parallel(docs_to_detect, sequential)
+        self._store_in_caches(docs_to_detect, detected_lang_output_tuple_list)
+        lang_output_dict.update(zip(docs_to_detect, detected_lang_output_tuple_list))
+        return [lang_output_dict[doc] for doc in unique_doc_list]
+
+    def detect_languages_list(self, docs: List[AnyStr]) -> List[Tuple[AnyStr, AnyStr, float]]:
+        """
+        Detect languages of a list of documents, running detection once per unique document
+        with the caches and the parallel backend
+        """
+        unique_doc_list = list(OrderedDict.fromkeys(doc for doc in docs if doc is not None))
+        lang_output_dict = dict(zip(unique_doc_list, self._detect_languages_unique(unique_doc_list)))
+        return [lang_output_dict[doc] if doc is not None else ("", "", None) for doc in docs]
+
+    def _submit_micro_batch(self, doc_batch: List[AnyStr]) -> Callable:
+        # Start detection of a micro-batch in the background and return a function waiting for its results
+        doc_batch = [doc if doc is None or isinstance(doc, str) else str(doc) for doc in doc_batch]
+        unique_doc_list = list(OrderedDict.fromkeys(doc for doc in doc_batch if doc is not None))
+        lang_output_dict, docs_to_detect = self._lookup_caches(unique_doc_list)
+        if self.backend == "process":
+            async_result = self._get_process_pool().apply_async(_detect_language_batch_in_process, (docs_to_detect,))
+        else:
+            future = self._get_thread_pool().submit(self.detect_language_batch, docs_to_detect)
+
+        def wait_for_results():
+            if self.backend == "process":
+                detected_lang_output_tuple_list = self._decode_process_output(async_result.get())
+            else:
+                detected_lang_output_tuple_list = future.result()
+            self._store_in_caches(docs_to_detect, detected_lang_output_tuple_list)
+            lang_output_dict.update(zip(docs_to_detect, detected_lang_output_tuple_list))
+            return [lang_output_dict[doc] if doc is not None else ("", "", None) for doc in doc_batch]
+
+        return wait_for_results
+
+    def detect_languages_iter(self, docs: Iterable[AnyStr], batch_size: int = 1000) -> Generator:
+        """
+        Detect languages of any iterable of documents, for instance file lines or database cursors,
+        and lazily yield (language code, language name, score) tuples in the same order.
+        Documents are consumed by micro-batches, with at most one batch in flight per worker to bound memory.
+        """
+        doc_iterator = iter(docs)
+        pending_batches = deque()
+        for doc_batch in iter(lambda: list(islice(doc_iterator, batch_size)), []):
+            pending_batches.append(self._submit_micro_batch(doc_batch))
+            if len(pending_batches) >= self.num_workers:
+                yield from pending_batches.popleft()()
+        while len(pending_batches) != 0:
+            yield from pending_batches.popleft()()
+
+    def _detect_languages_columnar(
+        self, texts: pd.Series, sequential: bool = False
+    ) -> (pd.Categorical, pd.Categorical, np.array):
+        """
+        Detect languages of a series of texts, keeping nulls as nulls, and return arrays for the whole series:
+        categorical language codes, categorical language names and float32 scores
+        """
+        doc_codes, unique_docs = pd.factorize(texts)  # nulls are coded as -1
+        unique_lang_output_tuple_list = self._detect_languages_unique(
+            [doc if isinstance(doc, str) else str(doc) for doc in unique_docs], sequential
+        )
+        output_arrays = []
+        for i in range(2):
+            value_codes, categories = pd.factorize(
+                np.array([t[i] for t in unique_lang_output_tuple_list], dtype=object)
+            )
+            value_codes = np.append(value_codes, -1)  # so that the null code -1 maps to the null category code
+            output_arrays.append(pd.Categorical.from_codes(value_codes[doc_codes], categories))
+        unique_lang_probabilities = np.array(
+            [np.nan if t[2] is None else t[2] for t in unique_lang_output_tuple_list] + [np.nan], dtype=np.float32
+        )
+        output_arrays.append(unique_lang_probabilities[doc_codes])
+        return tuple(output_arrays)
+
+    def detect_languages_arrow(self, texts):
+        """
+        Detect languages of an Arrow string array, keeping nulls as nulls, and return an Arrow table
+        with dictionary-encoded language codes and names, and float32 scores. Requires the pyarrow package.
+        """
+        import pyarrow as pa
+
+        lang_ids, lang_names, lang_probabilities = self._detect_languages_columnar(pd.Series(texts.to_pandas()))
+        return pa.Table.from_arrays(
+            [pa.array(lang_ids), pa.array(lang_names), pa.array(lang_probabilities, mask=np.isnan(lang_probabilities))],
+            names=list(self.COLUMN_DESCRIPTION_DICT.keys()),
+        )
+
+    @classmethod
+    def get_column_description_dict(cls, input_columns: List[AnyStr], text_columns: List[AnyStr]) -> OrderedDict:
+        """
+        Descriptions of the output columns added for each text column, in order,
+        with names made unique so that they do not overwrite input columns
+        """
+        column_description_dict = OrderedDict()
+        for col in text_columns:
+            for k, v in cls.COLUMN_DESCRIPTION_DICT.items():
+                output_column = generate_unique(k, input_columns + list(column_description_dict.keys()), col)
+                column_description_dict[output_column] = v
+        return column_description_dict
+
+    def detect_languages_df(
+        self, df: pd.DataFrame, text_column: Union[AnyStr, List[AnyStr]], columnar_output: bool = False
+    ) -> pd.DataFrame:
+        """
+        Detect languages of one or several text columns and add language code, name and score columns for each.
+        Values of all text columns are deduplicated together, so that a text repeated across columns is detected once.
+        By default, return a copy of the dataframe and detect languages of all values converted to string.
+        With columnar output, add columns to the input dataframe in place without copying it, and keep nulls as nulls.
+        Codes and names are then categorical columns, and scores a float32 column.
+        Chunks captured by the cProfile option of the profiler are detected in the calling thread.
+        """
+        if self.profiler is not None:
+            with self.profiler.capture() as is_captured:
+                return self._detect_languages_df(df, text_column, columnar_output, sequential=is_captured)
+        return self._detect_languages_df(df, text_column, columnar_output)
+
+    def _detect_languages_df(
+        self,
+        df: pd.DataFrame,
+        text_column: Union[AnyStr, List[AnyStr]],
+        columnar_output: bool,
+        sequential: bool = False,
+    ) -> pd.DataFrame:
+        text_columns = [text_column] if isinstance(text_column, str) else list(text_column)
+        self.column_description_dict = self.get_column_description_dict(list(df.keys()), text_columns)
+        output_columns = list(self.column_description_dict.keys())
+        num_output_columns = len(self.COLUMN_DESCRIPTION_DICT)
+        output_column_lists = [
+            output_columns[i * num_output_columns : (i + 1) * num_output_columns] for i in range(len(text_columns))
+        ]
+        num_rows = len(df.index)
+        if columnar_output:
+            texts = df[text_columns[0]] if len(text_columns) == 1 else pd.concat([df[col] for col in text_columns])
+            output_arrays = self._detect_languages_columnar(texts, sequential)
+            with self.metrics.timer("enrichment", count=num_rows):
+                for i, output_columns in enumerate(output_column_lists):
+                    for col, output_array in zip(output_columns, output_arrays):
+                        df[col] = output_array[i * num_rows : (i + 1) * num_rows]
+            self.diagnostics.log_chunk_summary()
+            return df
+        # Detect each unique document once and broadcast the results back to all rows
+        texts = pd.concat([df[col].astype(str) for col in text_columns], ignore_index=True)
+        doc_codes, unique_docs = pd.factorize(texts)
+        unique_lang_output_tuple_list = self._detect_languages_unique(unique_docs.tolist(), sequential)
+        with self.metrics.timer("enrichment", count=num_rows):
+            output_df = df.copy()
+            for i, output_columns in enumerate(output_column_lists):
+                lang_output_tuple_list = [
+                    unique_lang_output_tuple_list[code] for code in doc_codes[i * num_rows : (i + 1) * num_rows]
+                ]
+                for j, col in enumerate(output_columns):
+                    output_df[col] = [t[j] for t in lang_output_tuple_list]
+        self.diagnostics.log_chunk_summary()
         return output_df
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+Estimation of the language distribution of a dataset from detections on a sample, with confidence intervals
+
+Detection stops as soon as the intervals of all languages are tighter than a margin of error, so that the language
+mix of a large dataset is known after detecting a few thousand documents. Run with python-lib in the PYTHONPATH:
+    python python-lib/language_distribution.py --input sample.txt --output language_distribution.json
+"""
+import json
+import logging
+import argparse
+from collections import OrderedDict, defaultdict
+from typing import AnyStr, Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from language_detection import LanguageDetector
+from language_dict import SUPPORTED_LANGUAGES
+
+
+class LanguageDistributionEstimator:
+    """
+    Estimate the proportion of each language among the documents of a dataset, from a random sample,
+    optionally stratified by partition. The sample is shuffled and detected batch by batch until the confidence
+    intervals of all languages are within the margin of error, or until the sample is exhausted.
+    With estimate_from_chunks, the sample is instead a stream of chunks which is no longer read once
+    the intervals are precise enough, to bound the read of large datasets.
+
+    Intervals are Wilson score intervals. For a stratified sample, proportions are weighted by the size of each
+    stratum, and the Wilson interval uses the effective sample size of the stratified variance.
+    Empty documents are counted but not part of the proportions. Documents without a detected language,
+    below the minimum score without fallback, have an empty language code.
+
+    Attributes:
+        detector: LanguageDetector used on the sample
+        confidence: Confidence level of the intervals, among Z_SCORES keys
+        margin_of_error: Maximum half-width of the intervals to stop detection early
+        min_sample_size: Minimum number of detected documents per text column before stopping early
+        batch_size: Number of sampled rows detected between two checks of the intervals
+    """
+
+    Z_SCORES = {0.9: 1.6449, 0.95: 1.96, 0.99: 2.5758}
+    LENGTH_BUCKET_EDGES = [16, 32, 64, 140, 256, 1024, 4096, 16384]  # in characters
+    SCORE_BUCKET_EDGES = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+    FILE_NAME = "language_distribution.json"
+    COLUMN_DESCRIPTION_DICT = OrderedDict(
+        [
+            ("text_column", "Column of the input dataset"),
+            ("language_code", "Language code in ISO 639-1 format"),
+            ("language_name", "Language name in ISO 639-1 format"),
+            ("num_docs", "Number of documents of the sample detected in this language"),
+            ("proportion", "Estimated proportion of documents in this language"),
+            ("ci_lower", "Lower bound of the confidence interval of the proportion"),
+            ("ci_upper", "Upper bound of the confidence interval of the proportion"),
+            ("mean_score", "Mean confidence score of the documents detected in this language with a score"),
+        ]
+    )
+
+    def __init__(
+        self,
+        detector: LanguageDetector,
+        confidence: float = 0.95,
+        margin_of_error: float = 0.01,
+        min_sample_size: int = 1000,
+        batch_size: int = 1000,
+    ):
+        if confidence not in self.Z_SCORES:
+            raise ValueError("Confidence level {} not in {}".format(confidence, sorted(self.Z_SCORES)))
+        self.detector = detector
+        self.confidence = confidence
+        self.margin_of_error = margin_of_error
+        self.min_sample_size = min_sample_size
+        self.batch_size = batch_size
+        self.num_sampled_rows = 0
+        self.stop_reason = None
+        self._z = self.Z_SCORES[confidence]
+        self._stratum_sizes = {}
+        self._language_names = {}
+        # Per text column and stratum: counts and score sums per language, number of documents and empty documents
+        self._language_counts = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+        self._score_sums = defaultdict(lambda: defaultdict(float))
+        self._num_scored_docs = defaultdict(lambda: defaultdict(int))  # without the documents replaced by fallback
+        self._num_docs = defaultdict(lambda: defaultdict(int))
+        self._num_empty_docs = defaultdict(int)
+        self._length_histograms = defaultdict(lambda: np.zeros(len(self.LENGTH_BUCKET_EDGES) + 1, dtype=np.int64))
+        self._score_histograms = defaultdict(lambda: np.zeros(len(self.SCORE_BUCKET_EDGES) + 1, dtype=np.int64))
+        self._doc_lengths = defaultdict(list)
+
+    def wilson_interval(self, proportion: float, sample_size: float) -> (float, float):
+        if sample_size <= 0:
+            return (0.0, 1.0)
+        z2_over_n = self._z**2 / sample_size
+        center = (proportion + z2_over_n / 2) / (1 + z2_over_n)
+        half_width = (
+            self._z
+            / (1 + z2_over_n)
+            * np.sqrt(proportion * (1 - proportion) / sample_size + z2_over_n / sample_size / 4)
+        )
+        return (max(0.0, center - half_width), min(1.0, center + half_width))
+
+    def add_docs(self, text_column: AnyStr, docs: List[AnyStr], stratum: AnyStr = "") -> None:
+        """
+        Detect languages of sampled documents of a text column and add them to the counts of their stratum
+        """
+        non_empty_docs = [doc for doc in docs if doc]
+        self._num_empty_docs[text_column] += len(docs) - len(non_empty_docs)
+        if len(non_empty_docs) == 0:
+            return
+        detections = self.detector.detect_languages_list(non_empty_docs)
+        language_counts, score_sums = self._language_counts[text_column][stratum], self._score_sums[text_column]
+        num_scored_docs = self._num_scored_docs[text_column]
+        scores = []
+        for lang_id, lang_name, score in detections:
+            language_counts[lang_id] += 1
+            self._language_names[lang_id] = lang_name
+            if score is not None:
+                score_sums[lang_id] += score
+                num_scored_docs[lang_id] += 1
+                scores.append(score)
+        self._num_docs[text_column][stratum] += len(non_empty_docs)
+        doc_lengths = [len(doc) for doc in non_empty_docs]
+        self._doc_lengths[text_column].extend(doc_lengths)
+        np.add.at(
+            self._length_histograms[text_column], np.searchsorted(self.LENGTH_BUCKET_EDGES, doc_lengths, "right"), 1
+        )
+        np.add.at(self._score_histograms[text_column], np.searchsorted(self.SCORE_BUCKET_EDGES, scores, "right"), 1)
+
+    def _stratum_weight(self, text_column: AnyStr, stratum: AnyStr) -> float:
+        # Share of the dataset in a stratum, from its size if known for all strata, else from its sample size
+        num_docs = self._num_docs[text_column]
+        if all(self._stratum_sizes.get(s) is not None for s in num_docs):
+            return self._stratum_sizes[stratum] / sum(self._stratum_sizes[s] for s in num_docs)
+        return num_docs[stratum] / sum(num_docs.values())
+
+    def estimate_proportions(self, text_column: AnyStr) -> List[Dict]:
+        """
+        Estimated proportion and confidence interval of each language detected in a text column, most frequent first
+        """
+        num_docs = {stratum: n for stratum, n in self._num_docs[text_column].items() if n != 0}
+        languages = {lang_id for stratum in num_docs for lang_id in self._language_counts[text_column][stratum]}
+        estimates = []
+        for lang_id in languages:
+            proportion, variance = 0.0, 0.0
+            for stratum, n in num_docs.items():
+                weight = self._stratum_weight(text_column, stratum)
+                stratum_proportion = self._language_counts[text_column][stratum].get(lang_id, 0) / n
+                proportion += weight * stratum_proportion
+                variance += weight**2 * stratum_proportion * (1 - stratum_proportion) / n
+            effective_sample_size = sum(num_docs.values())
+            if variance > 0:
+                effective_sample_size = proportion * (1 - proportion) / variance
+            ci_lower, ci_upper = self.wilson_interval(proportion, effective_sample_size)
+            count = sum(self._language_counts[text_column][stratum].get(lang_id, 0) for stratum in num_docs)
+            num_scored_docs = self._num_scored_docs[text_column].get(lang_id, 0)
+            estimates.append(
+                {
+                    "text_column": text_column,
+                    "language_code": lang_id,
+                    "language_name": self._language_names[lang_id],
+                    "num_docs": count,
+                    "proportion": proportion,
+                    "ci_lower": ci_lower,
+                    "ci_upper": ci_upper,
+                    "mean_score": self._score_sums[text_column][lang_id] / num_scored_docs if num_scored_docs else None,
+                }
+            )
+        return sorted(estimates, key=lambda estimate: (-estimate["proportion"], estimate["language_code"]))
+
+    def max_margin(self, text_column: AnyStr) -> float:
+        """
+        Largest half-width of the confidence intervals of a text column, 1 before any document is detected
+        """
+        estimates = self.estimate_proportions(text_column)
+        if len(estimates) == 0:
+            return 1.0
+        return max((estimate["ci_upper"] - estimate["ci_lower"]) / 2 for estimate in estimates)
+
+    def is_precise_enough(self, text_columns: List[AnyStr]) -> bool:
+        return all(
+            sum(self._num_docs[text_column].values()) >= self.min_sample_size
+            and self.max_margin(text_column) <= self.margin_of_error
+            for text_column in text_columns
+        )
+
+    def _add_rows(self, df: pd.DataFrame, text_columns: List[AnyStr], stratum: AnyStr = "") -> None:
+        for text_column in text_columns:
+            self.add_docs(text_column, [str(doc) if pd.notnull(doc) else None for doc in df[text_column]], stratum)
+        self.num_sampled_rows += len(df)
+
+    def estimate_from_chunks(self, chunks: Iterable[pd.DataFrame], text_columns: List[AnyStr]) -> Dict:
+        """
+        Detect languages on a stream of sampled dataframe chunks, until the intervals are precise enough.
+        The stream is not consumed further once they are, so that a lazy reader stops reading the dataset.
+        Rows are not shuffled: stopping early keeps the first rows of the stream, which are a random sample
+        only if languages are not clustered in the order of the stream. Return the dictionary of to_dict.
+        """
+        chunks = iter(chunks)
+        self.stop_reason = "sample_exhausted"
+        for chunk_df in chunks:
+            for start in range(0, len(chunk_df), self.batch_size):
+                self._add_rows(chunk_df.iloc[start : start + self.batch_size], text_columns)
+                if self.is_precise_enough(text_columns):
+                    self.stop_reason = "converged"
+                    break
+            if self.stop_reason == "converged":
+                break
+        if hasattr(chunks, "close"):
+            chunks.close()
+        logging.info(
+            "Language distribution estimated on a stream of {:d} sampled rows: {}".format(
+                self.num_sampled_rows, self.stop_reason
+            )
+        )
+        return self.to_dict()
+
+    def estimate(
+        self,
+        sample_dfs: Dict[AnyStr, pd.DataFrame],
+        text_columns: List[AnyStr],
+        stratum_sizes: Dict[AnyStr, int] = None,
+        random_state: int = 1337,
+    ) -> Dict:
+        """
+        Detect languages on a sample given as one dataframe per stratum, until the intervals are precise enough.
+        Each stratum is shuffled, so that stopping early keeps a random sample whatever the order of the rows,
+        and each batch takes rows from all strata in proportion to their sample sizes.
+        Stratum sizes, e.g. record counts of partitions, weight the proportions; without them strata are weighted
+        by their sample sizes. Return the dictionary of to_dict.
+        """
+        self._stratum_sizes = dict(stratum_sizes or {})
+        shuffled_dfs = {
+            stratum: df.sample(frac=1, random_state=random_state) for stratum, df in sample_dfs.items() if len(df) != 0
+        }
+        total_rows = sum(len(df) for df in shuffled_dfs.values())
+        self.stop_reason = "sample_exhausted"
+        for start in range(0, total_rows, self.batch_size):
+            end = min(start + self.batch_size, total_rows)
+            for stratum, df in shuffled_dfs.items():
+                # Same share of each stratum in each batch, so that all strata are exhausted together
+                self._add_rows(
+                    df.iloc[start * len(df) // total_rows : end * len(df) // total_rows], text_columns, stratum
+                )
+            if self.is_precise_enough(text_columns):
+                self.stop_reason = "converged"
+                break
+        logging.info(
+            "Language distribution estimated on {:d} of {:d} sampled rows: {}".format(
+                self.num_sampled_rows, total_rows, self.stop_reason
+            )
+        )
+        return self.to_dict()
+
+    def to_df(self) -> pd.DataFrame:
+        estimates = [estimate for text_column in self._num_docs for estimate in self.estimate_proportions(text_column)]
+        return pd.DataFrame(estimates, columns=list(self.COLUMN_DESCRIPTION_DICT.keys()))
+
+    def to_dict(self) -> Dict:
+        text_columns = {}
+        for text_column in self._num_docs:
+            doc_lengths = self._doc_lengths[text_column]
+            length_quantiles = {}
+            if len(doc_lengths) != 0:
+                length_quantiles = {"p{:d}".format(q): float(np.percentile(doc_lengths, q)) for q in (10, 50, 90, 99)}
+            text_columns[text_column] = {
+                "num_docs": sum(self._num_docs[text_column].values()),
+                "num_empty_docs": self._num_empty_docs[text_column],
+                "num_docs_per_stratum": dict(self._num_docs[text_column]),
+                "max_margin": self.max_margin(text_column),
+                "languages": self.estimate_proportions(text_column),
+                "length_histogram": self._length_histograms[text_column].tolist(),
+                "length_quantiles": length_quantiles,
+                "score_histogram": self._score_histograms[text_column].tolist(),
+            }
+        return {
+            "confidence": self.confidence,
+            "margin_of_error": self.margin_of_error,
+            "num_sampled_rows": self.num_sampled_rows,
+            "stop_reason": self.stop_reason,
+            "stratum_sizes": self._stratum_sizes,
+            "length_buckets": self.LENGTH_BUCKET_EDGES,
+            "score_buckets": self.SCORE_BUCKET_EDGES,
+            "text_columns": text_columns,
+        }
+
+    def log_summary(self) -> None:
+        for text_column in self._num_docs:
+            for estimate in self.estimate_proportions(text_column):
+                logging.info(
+                    "Column '{}': {:.2%} of '{}' documents ({:.2%} - {:.2%} at {:.0%} confidence)".format(
+                        text_column,
+                        estimate["proportion"],
+                        estimate["language_code"],
+                        estimate["ci_lower"],
+                        estimate["ci_upper"],
+                        self.confidence,
+                    )
+                )
+
+
+def main(argv: List[AnyStr] = None) -> None:
+    parser = argparse.ArgumentParser(description="Estimate the language distribution of a sample of documents")
+    parser.add_argument("--input", required=True, help="Text file with one document per line")
+    parser.add_argument("--output", default=LanguageDistributionEstimator.FILE_NAME)
+    parser.add_argument("--language-scope", nargs="*", default=[lang["value"] for lang in SUPPORTED_LANGUAGES])
+    parser.add_argument(
+        "--confidence", type=float, default=0.95, choices=sorted(LanguageDistributionEstimator.Z_SCORES)
+    )
+    parser.add_argument("--margin-of-error", type=float, default=0.01)
+    parser.add_argument("--min-sample-size", type=int, default=1000)
+    parser.add_argument("--max-num-bytes", type=int, default=100000)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="Language Detection plugin %(levelname)s - %(message)s")
+
+    with open(args.input, encoding="utf-8") as input_file:
+        sample_df = pd.DataFrame({"text": [line.rstrip("\n") for line in input_file]})
+    detector = LanguageDetector(language_scope=list(args.language_scope), max_num_bytes=args.max_num_bytes)
+    estimator = LanguageDistributionEstimator(
+        detector, confidence=args.confidence, margin_of_error=args.margin_of_error, min_sample_size=args.min_sample_size
+    )
+    distribution_dict = estimator.estimate({"": sample_df}, ["text"])
+    detector.close()
+    estimator.log_summary()
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(distribution_dict, output_file, indent=2)
+    logging.info("Saved language distribution to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import os
+import math
+import logging
+from queue import Queue, Full, Empty
+from threading import Thread, Event
+from concurrent.futures import ThreadPoolExecutor
+from typing import AnyStr, Any, Callable, Iterator, Generator, List
+
+
+def _read_cgroup_file(path: AnyStr) -> AnyStr:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (OSError, IOError):
+        return ""
+
+
+def get_cgroup_cpu_quota() -> float:
+    """
+    Get the CPU quota of the current container from cgroups (v2 then v1), or None if there is no quota
+    """
+    cpu_max = _read_cgroup_file("/sys/fs/cgroup/cpu.max").split()  # cgroup v2: "<quota> <period>"
+    if len(cpu_max) == 2 and cpu_max[0] != "max":
+        return float(cpu_max[0]) / float(cpu_max[1])
+    quota = _read_cgroup_file("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")  # cgroup v1
+    period = _read_cgroup_file("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return float(quota) / float(period)
+    return None
+
+
+def get_available_cpu_count() -> int:
+    """
+    Count the CPU cores actually available to this process, taking into account
+    CPU affinity and container (cgroup) quotas rather than the number of cores of the host
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpu_count = len(os.sched_getaffinity(0))
+    else:
+        cpu_count = os.cpu_count() or 1
+    cpu_quota = get_cgroup_cpu_quota()
+    if cpu_quota is not None:
+        cpu_count = min(cpu_count, max(1, int(math.ceil(cpu_quota))))
+    logging.info("Number of available CPU cores: {:d}".format(cpu_count))
+    return cpu_count
+
+
+_END_OF_QUEUE = object()  # sentinel marking the end of items in a queue
+
+
+def _put_until_stopped(item_queue: Queue, item: Any, stop_event: Event) -> bool:
+    # Blocking put on a bounded queue which gives up if the other side has stopped
+    while not stop_event.is_set():
+        try:
+            item_queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            pass
+    return False
+
+
+def iter_prefetched(iterator: Iterator, max_queue_size: int) -> Generator:
+    """
+    Iterate over an iterator read ahead by a background thread, with at most max_queue_size items waiting.
+    Exceptions raised by the iterator are raised again in the calling thread.
+    """
+    item_queue = Queue(maxsize=max_queue_size)
+    stop_event = Event()
+
+    def _produce():
+        try:
+            for item in iterator:
+                if not _put_until_stopped(item_queue, (None, item), stop_event):
+                    return
+            _put_until_stopped(item_queue, (None, _END_OF_QUEUE), stop_event)
+        except Exception as error:
+            _put_until_stopped(item_queue, (error, None), stop_event)
+
+    thread = Thread(target=_produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            error, item = item_queue.get()
+            if error is not None:
+                raise error
+            if item is _END_OF_QUEUE:
+                break
+            yield item
+    finally:
+        stop_event.set()
+        thread.join()
+
+
+def iter_parallel_ordered(iterator_funcs: List[Callable], max_workers: int, max_queue_size: int) -> Generator:
+    """
+    Consume several iterators in parallel worker threads and yield (iterator index, item) pairs in a deterministic
+    order: all items of the first iterator, then all items of the second one, etc. Each iterator is created by
+    calling its function in a worker thread. At most max_workers iterators are consumed at the same time,
+    each with at most max_queue_size items waiting. Exceptions are raised again in the calling thread,
+    and iterators which have not started yet are not started anymore.
+    """
+    item_queues = [Queue(maxsize=max(1, max_queue_size)) for _ in iterator_funcs]
+    stop_event = Event()
+
+    def _produce(iterator_func, item_queue):
+        if stop_event.is_set():  # do not start iterators queued before the consumer stopped
+            return
+        try:
+            for item in iterator_func():
+                if not _put_until_stopped(item_queue, (None, item), stop_event):
+                    return
+            _put_until_stopped(item_queue, (None, _END_OF_QUEUE), stop_event)
+        except Exception as error:
+            _put_until_stopped(item_queue, (error, None), stop_event)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = []
+    try:
+        # Iterators start in order, so the one being yielded is always running or done
+        for iterator_func, item_queue in zip(iterator_funcs, item_queues):
+            futures.append(executor.submit(_produce, iterator_func, item_queue))
+        for i, item_queue in enumerate(item_queues):
+            while True:
+                error, item = item_queue.get()
+                if error is not None:
+                    raise error
+                if item is _END_OF_QUEUE:
+                    break
+                yield i, item
+    finally:
+        stop_event.set()
+        for future in futures:
+            future.cancel()  # only cancels iterators which have not started
+        executor.shutdown()
+
+
+class BackgroundConsumer:
+    """
+    Apply a function to items in order in a background thread, fed through a bounded queue.
+    Exceptions raised by the function are raised again in the calling thread on the next put or on close.
+    """
+
+    def __init__(self, func: Callable, max_queue_size: int):
+        self.func = func
+        self._queue = Queue(maxsize=max_queue_size)
+        self._stop_event = Event()
+        self._error = None
+        self._thread = Thread(target=self._consume, name="consumer", daemon=True)
+        self._thread.start()
+
+    def _consume(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                item = self._queue.get(timeout=0.1)
+            except Empty:
+                continue
+            if item is _END_OF_QUEUE:
+                return
+            try:
+                self.func(item)
+            except Exception as error:
+                self._error = error
+                self._stop_event.set()
+                return
+
+    def put(self, item: Any) -> None:
+        if not _put_until_stopped(self._queue, item, self._stop_event):
+            raise self._error
+
+    def close(self) -> None:
+        """
+        Wait for all items to be consumed and stop the background thread
+        """
+        if _put_until_stopped(self._queue, _END_OF_QUEUE, self._stop_event):
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._stop_event.set()
+            self._thread.join()
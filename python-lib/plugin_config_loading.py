@@ -3,6 +3,7 @@ import logging
 from typing import Dict
 
 from language_dict import SUPPORTED_LANGUAGES
+from text_normalization import TextNormalizer
 
 
 def load_plugin_config(recipe_config: Dict) -> Dict:
@@ -14,7 +15,11 @@ def load_plugin_config(recipe_config: Dict) -> Dict:
     # Text column
     params["text_column"] = recipe_config.get("text_column")
     assert params["text_column"] is not None and params["text_column"] != ""
-    logging.info("Text column: {}".format(params["text_column"]))
+    params["text_columns"] = [params["text_column"]]
+    for col in recipe_config.get("additional_text_columns") or []:
+        if col and col not in params["text_columns"]:
+            params["text_columns"].append(col)
+    logging.info("Text columns: {}".format(params["text_columns"]))
     # Language scope
     params["language_scope"] = recipe_config.get("language_scope", [])
     if len(params["language_scope"]) == 0:
@@ -35,4 +40,131 @@ def load_plugin_config(recipe_config: Dict) -> Dict:
         params["fallback_language"] = ""
     else:
         logging.info("Fallback language: {}".format(params["fallback_language"]))
+    # Parallel execution
+    params["backend"] = recipe_config.get("backend", "thread")
+    assert params["backend"] in {"thread", "process"}
+    params["num_workers"] = int(recipe_config.get("num_workers", 0))
+    assert params["num_workers"] >= 0
+    if params["num_workers"] == 0:
+        logging.info("Parallel execution backend: {} with automatic number of workers".format(params["backend"]))
+    else:
+        logging.info(
+            "Parallel execution backend: {} with {:d} workers".format(params["backend"], params["num_workers"])
+        )
+    # Detection cache
+    params["cache_size"] = int(recipe_config.get("cache_size", 100000))
+    assert params["cache_size"] >= 0
+    if params["cache_size"] == 0:
+        logging.info("No detection cache across chunks")
+    else:
+        logging.info("Detection cache of {:d} documents across chunks".format(params["cache_size"]))
+    params["persistent_cache_size"] = int(recipe_config.get("persistent_cache_size", 10000000))
+    assert params["persistent_cache_size"] >= 1
+    # Chunk size
+    params["adaptive_chunking"] = bool(recipe_config.get("adaptive_chunking", True))
+    params["chunk_size"] = int(recipe_config.get("chunk_size", 10000))
+    params["memory_budget_mb"] = float(recipe_config.get("memory_budget_mb", 1024))
+    params["target_chunk_seconds"] = float(recipe_config.get("target_chunk_seconds", 10))
+    params["min_chunk_size"] = int(recipe_config.get("min_chunk_size", 1000))
+    params["max_chunk_size"] = int(recipe_config.get("max_chunk_size", 100000))
+    assert params["chunk_size"] >= 1
+    assert params["memory_budget_mb"] > 0 and params["target_chunk_seconds"] > 0
+    assert 1 <= params["min_chunk_size"] <= params["max_chunk_size"]
+    if params["adaptive_chunking"]:
+        logging.info(
+            "Adaptive chunk size from {:d} to {:d} rows, within {:.0f} MB and {:.1f} seconds per chunk".format(
+                params["min_chunk_size"],
+                params["max_chunk_size"],
+                params["memory_budget_mb"],
+                params["target_chunk_seconds"],
+            )
+        )
+    else:
+        logging.info("Fixed chunk size of {:d} rows".format(params["chunk_size"]))
+    # Pipelining
+    params["pipeline_queue_size"] = int(recipe_config.get("pipeline_queue_size", 2))
+    assert params["pipeline_queue_size"] >= 0
+    if params["pipeline_queue_size"] == 0:
+        logging.info("No pipelining of read, detection and write")
+    else:
+        logging.info(
+            "Pipelining read, detection and write with {:d} chunks per queue".format(params["pipeline_queue_size"])
+        )
+    # Long documents
+    params["max_num_bytes"] = int(recipe_config.get("max_num_bytes", 100000))
+    assert params["max_num_bytes"] >= 0
+    params["progressive_detection"] = bool(recipe_config.get("progressive_detection", False))
+    if params["max_num_bytes"] == 0:
+        logging.info("No maximum number of bytes per document")
+    else:
+        logging.info("Maximum number of bytes per document: {:d}".format(params["max_num_bytes"]))
+    logging.info("Progressive detection of long documents: {}".format(params["progressive_detection"]))
+    # Text normalization
+    params["normalization_steps"] = []
+    if bool(recipe_config.get("text_normalization", False)):
+        params["normalization_steps"] = recipe_config.get("normalization_steps") or list(
+            TextNormalizer.NORMALIZATION_PATTERNS.keys()
+        )
+        logging.info("Text normalization steps: {}".format(params["normalization_steps"]))
+    else:
+        logging.info("No text normalization")
+    params["script_fast_path"] = bool(recipe_config.get("script_fast_path", False))
+    logging.info("Script fast path for unambiguous scripts: {}".format(params["script_fast_path"]))
+    # Routing threshold
+    params["routing_tuning"] = bool(recipe_config.get("routing_tuning", False))
+    params["routing_sample_size"] = int(recipe_config.get("routing_sample_size", 2000))
+    params["routing_accuracy_tolerance"] = float(recipe_config.get("routing_accuracy_tolerance", 0.01))
+    params["routing_retuning"] = bool(recipe_config.get("routing_retuning", False))
+    assert params["routing_sample_size"] >= 1
+    assert params["routing_accuracy_tolerance"] >= 0 and params["routing_accuracy_tolerance"] <= 1
+    if params["routing_tuning"]:
+        logging.info(
+            "Routing threshold tuned on a sample of {:d} rows, within {:.3f} of the best accuracy".format(
+                params["routing_sample_size"], params["routing_accuracy_tolerance"]
+            )
+        )
+        if params["routing_retuning"]:
+            logging.info("Routing threshold tuned again instead of reusing the saved one")
+    # Language distribution mode
+    params["language_distribution_mode"] = bool(recipe_config.get("language_distribution_mode", False))
+    params["distribution_sampling"] = recipe_config.get("distribution_sampling", "streaming")
+    params["distribution_sample_size"] = int(recipe_config.get("distribution_sample_size", 100000))
+    params["distribution_confidence"] = float(recipe_config.get("distribution_confidence", 0.95))
+    params["distribution_margin_of_error"] = float(recipe_config.get("distribution_margin_of_error", 0.01))
+    assert params["distribution_sampling"] in {"streaming", "random", "stratified"}
+    assert params["distribution_sample_size"] >= 1
+    assert params["distribution_confidence"] in {0.9, 0.95, 0.99}
+    assert params["distribution_margin_of_error"] > 0 and params["distribution_margin_of_error"] < 1
+    if params["language_distribution_mode"]:
+        logging.info(
+            "Language distribution on a {} sample of up to {:d} rows, within {:.3f} at {:.0%} confidence".format(
+                params["distribution_sampling"],
+                params["distribution_sample_size"],
+                params["distribution_margin_of_error"],
+                params["distribution_confidence"],
+            )
+        )
+    # Output format
+    params["columnar_output"] = bool(recipe_config.get("columnar_output", False))
+    logging.info("Columnar output without copy: {}".format(params["columnar_output"]))
+    # Profiling
+    params["profiling"] = bool(recipe_config.get("profiling", False))
+    params["profile_chunks"] = int(recipe_config.get("profile_chunks", 0))
+    assert params["profile_chunks"] >= 0
+    if params["profiling"]:
+        logging.info("Profiling of detection engines, with cProfile on {:d} chunks".format(params["profile_chunks"]))
+    # Record count for progress tracking
+    params["record_count_mode"] = recipe_config.get("record_count_mode", "cached")
+    assert params["record_count_mode"] in {"compute", "cached", "none"}
+    logging.info("Record count mode for progress tracking: {}".format(params["record_count_mode"]))
+    # Partitioned inputs
+    params["partition_workers"] = int(recipe_config.get("partition_workers", 4))
+    assert params["partition_workers"] >= 1
+    logging.info("Maximum number of partitions processed in parallel: {:d}".format(params["partition_workers"]))
+    # Incremental mode
+    params["incremental_mode"] = bool(recipe_config.get("incremental_mode", False))
+    params["watermark_column"] = recipe_config.get("watermark_column")
+    if params["incremental_mode"]:
+        assert params["watermark_column"] is not None and params["watermark_column"] != ""
+        logging.info("Incremental mode with watermark column: {}".format(params["watermark_column"]))
     return params
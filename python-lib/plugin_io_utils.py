@@ -12,3 +12,12 @@ def generate_unique(name: AnyStr, existing_names: List[AnyStr], prefix: AnyStr =
             return new_name
         new_name = "{}_{}_{}".format(prefix, name, i)
     raise Exception("Failed to generated a unique name")
+
+
+def get_package_version(package_name: AnyStr) -> AnyStr:
+    try:
+        import pkg_resources
+
+        return pkg_resources.get_distribution(package_name).version
+    except Exception:  # pkg_resources may be missing or the package installed outside of a distribution
+        return "unknown"
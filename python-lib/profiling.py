@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import pstats
+import logging
+import cProfile
+from threading import Lock
+from contextlib import contextmanager
+from collections import defaultdict
+from typing import AnyStr, Dict, List
+
+import numpy as np
+
+
+class DetectionProfiler:
+    """
+    Optional profiling hook of the language detector, to find which engine and which document lengths
+    are the bottleneck on real data:
+    - Histograms of latency per document for each detection engine, by bucket of document length
+    - Optional cProfile capture of the first chunks, aggregated over chunks
+
+    Engines score documents in batches, split by length bucket when profiling,
+    so that latencies are amortized over the documents of each bucket.
+
+    Attributes:
+        profile_chunks: Number of chunks to capture with cProfile, 0 to only record latency histograms
+        num_profile_functions: Number of functions with the highest cumulative time to export from cProfile
+    """
+
+    LENGTH_BUCKET_EDGES = [16, 32, 64, 140, 256, 1024, 4096, 16384]  # in characters
+    LATENCY_BUCKET_EDGES_US = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 100000, 1000000]
+
+    def __init__(self, profile_chunks: int = 0, num_profile_functions: int = 30):
+        self.profile_chunks = int(profile_chunks)
+        self.num_profile_functions = num_profile_functions
+        self.num_profiled_chunks = 0
+        num_latency_buckets = len(self.LATENCY_BUCKET_EDGES_US) + 1
+        self.latency_histograms = defaultdict(
+            lambda: np.zeros((len(self.LENGTH_BUCKET_EDGES) + 1, num_latency_buckets), dtype=np.int64)
+        )
+        self.total_seconds = defaultdict(lambda: np.zeros(len(self.LENGTH_BUCKET_EDGES) + 1))
+        self._profile_stats = None
+        self._lock = Lock()
+        self._profile_lock = Lock()  # cProfile captures one chunk at a time
+
+    @classmethod
+    def _bucket_labels(cls, edges: List, unit: AnyStr = "") -> List[AnyStr]:
+        labels = ["<{}{}".format(edges[0], unit)]
+        labels += ["{}-{}{}".format(low, high, unit) for low, high in zip(edges[:-1], edges[1:])]
+        return labels + [">={}{}".format(edges[-1], unit)]
+
+    def record_engine_latency(self, engine: AnyStr, doc_lengths: List[int], seconds: List[float]) -> None:
+        """
+        Add the latencies of documents detected by an engine to its histograms, bucketed by document length
+        """
+        if len(doc_lengths) == 0:
+            return
+        length_buckets = np.searchsorted(self.LENGTH_BUCKET_EDGES, doc_lengths, side="right")
+        seconds = np.asarray(seconds, dtype=np.float64)
+        latency_buckets = np.searchsorted(self.LATENCY_BUCKET_EDGES_US, seconds * 1e6, side="right")
+        with self._lock:
+            np.add.at(self.latency_histograms[engine], (length_buckets, latency_buckets), 1)
+            np.add.at(self.total_seconds[engine], length_buckets, seconds)
+
+    @contextmanager
+    def capture(self):
+        """
+        Context manager capturing its block with cProfile, until the configured number of chunks is reached.
+        It yields whether the block is captured, so that it may run in the calling thread to be fully profiled.
+        """
+        if self.num_profiled_chunks >= self.profile_chunks or not self._profile_lock.acquire(blocking=False):
+            yield False
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            yield True
+        finally:
+            profile.disable()
+            if self._profile_stats is None:
+                self._profile_stats = pstats.Stats(profile, stream=io.StringIO())
+            else:
+                self._profile_stats.add(profile)
+            self.num_profiled_chunks += 1
+            self._profile_lock.release()
+
+    def _profile_to_list(self) -> List[Dict]:
+        if self._profile_stats is None:
+            return []
+        functions = sorted(self._profile_stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [
+            {
+                "function": "{}:{:d}({})".format(*function),
+                "num_calls": num_calls,
+                "total_seconds": round(total_seconds, 6),
+                "cumulative_seconds": round(cumulative_seconds, 6),
+            }
+            for function, (_, num_calls, total_seconds, cumulative_seconds, _) in functions[
+                : self.num_profile_functions
+            ]
+        ]
+
+    def merge(self, profiler_dict: Dict) -> None:
+        """
+        Merge latency histograms from the output of to_dict, for instance collected in another process
+        """
+        length_labels = self._bucket_labels(self.LENGTH_BUCKET_EDGES)
+        with self._lock:
+            for engine, length_buckets in profiler_dict["engines"].items():
+                for length_bucket, bucket_dict in length_buckets.items():
+                    i = length_labels.index(length_bucket)
+                    self.latency_histograms[engine][i] += np.array(bucket_dict["latency_histogram"], dtype=np.int64)
+                    self.total_seconds[engine][i] += bucket_dict["total_seconds"]
+
+    def to_dict(self) -> Dict:
+        length_labels = self._bucket_labels(self.LENGTH_BUCKET_EDGES)
+        engines = {}
+        with self._lock:
+            for engine, histogram in self.latency_histograms.items():
+                engines[engine] = {}
+                for i, length_bucket in enumerate(length_labels):
+                    count = int(histogram[i].sum())
+                    if count != 0:
+                        engines[engine][length_bucket] = {
+                            "count": count,
+                            "total_seconds": float(self.total_seconds[engine][i]),
+                            "mean_us": round(float(self.total_seconds[engine][i]) / count * 1e6, 3),
+                            "latency_histogram": histogram[i].tolist(),
+                        }
+        return {
+            "length_buckets": length_labels,
+            "latency_buckets": self._bucket_labels(self.LATENCY_BUCKET_EDGES_US, "us"),
+            "engines": engines,
+            "num_profiled_chunks": self.num_profiled_chunks,
+            "profile": self._profile_to_list(),
+        }
+
+    def log_summary(self) -> None:
+        profiler_dict = self.to_dict()
+        for engine, length_buckets in sorted(profiler_dict["engines"].items()):
+            for length_bucket, bucket_dict in length_buckets.items():
+                logging.info(
+                    "Engine '{}' on documents of {} characters: {:d} documents, {:.3f} us per document".format(
+                        engine, length_bucket, bucket_dict["count"], bucket_dict["mean_us"]
+                    )
+                )
+        for function_dict in profiler_dict["profile"][:10]:
+            logging.info(
+                "Profile of {:d} chunks: {}".format(profiler_dict["num_profiled_chunks"], json.dumps(function_dict))
+            )
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Tuning of the document length threshold routing short documents to langid and long documents to cld3,
+or more generally to the short and long document engines of a detector
+
+The cost of langid depends on the language scope, and the accuracy of each engine on the text distribution,
+so the best threshold is measured on a sample of documents rather than fixed. Run with python-lib in the PYTHONPATH:
+    python python-lib/routing_tuning.py --input sample.txt --output routing_tuning.json --language-scope en fr de
+
+The saved result is loaded with RoutingTuner.load_routing_threshold and passed to LanguageDetector(routing_threshold).
+"""
+import json
+import time
+import logging
+import argparse
+from typing import AnyStr, Dict, List
+
+import numpy as np
+
+from language_detection import LanguageDetector
+from language_dict import SUPPORTED_LANGUAGES
+
+
+class RoutingTuner:
+    """
+    Measure the cost and accuracy of the short and long document engines of a detector, langid and cld3 by default,
+    by bucket of document length on a sample, and choose the cheapest routing threshold whose accuracy is
+    within a tolerance of the most accurate one.
+
+    Without labels, the sample is self-labeled: documents on which both engines agree are kept with this language.
+    Each labeled document is also evaluated on its prefixes at the upper edge of each shorter bucket,
+    so that short buckets are covered by a sample of long documents. Costs and accuracies are weighted
+    by the length distribution of the sample documents, to reflect the cost on the whole dataset.
+
+    Attributes:
+        detector: LanguageDetector whose engines, language scope and normalization are tuned
+        accuracy_tolerance: Maximum loss of accuracy accepted to choose a cheaper threshold
+        length_bucket_edges: Upper edges of the length buckets, in characters, also the candidate thresholds
+    """
+
+    LENGTH_BUCKET_EDGES = [20, 40, 70, 100, 140, 200, 300, 500, 1000, 2000]
+    FILE_NAME = "routing_tuning.json"
+
+    def __init__(
+        self, detector: LanguageDetector, accuracy_tolerance: float = 0.01, length_bucket_edges: List[int] = None
+    ):
+        self.detector = detector
+        self.accuracy_tolerance = accuracy_tolerance
+        self.length_bucket_edges = sorted(length_bucket_edges or self.LENGTH_BUCKET_EDGES)
+
+    def _detect_with_engines(self, docs: List[AnyStr]) -> (np.array, np.array, np.array, np.array):
+        # Language codes and seconds per document of each engine, timed per bucket of similar lengths
+        codes = [[""] * len(docs), [""] * len(docs)]
+        seconds = [np.zeros(len(docs)), np.zeros(len(docs))]
+        detect_batch_functions = [self.detector.short_doc_engine.detect_batch, self.detector._long_doc_detection_batch]
+        bucket_indices = np.searchsorted(self.length_bucket_edges, [len(doc) for doc in docs], side="left")
+        for bucket_index in np.unique(bucket_indices):
+            indices = np.flatnonzero(bucket_indices == bucket_index)
+            for engine_index, detect_batch in enumerate(detect_batch_functions):
+                start = time.perf_counter()
+                bucket_codes, _ = detect_batch([docs[i] for i in indices])
+                seconds[engine_index][indices] = (time.perf_counter() - start) / len(indices)
+                for i, code in zip(indices, bucket_codes):
+                    codes[engine_index][i] = code
+        return (np.array(codes[0]), np.array(codes[1]), seconds[0], seconds[1])
+
+    def _label_docs(self, docs: List[AnyStr], labels: List[AnyStr] = None) -> (List[AnyStr], List[AnyStr]):
+        if labels is not None:
+            return (list(docs), list(labels))
+        short_codes, long_codes, _, _ = self._detect_with_engines(docs)
+        is_consistent = short_codes == long_codes
+        logging.info(
+            "Self-labeled sample: both engines agree on {:d} of {:d} documents".format(
+                int(is_consistent.sum()), len(docs)
+            )
+        )
+        return ([doc for doc, keep in zip(docs, is_consistent) if keep], short_codes[is_consistent].tolist())
+
+    def _evaluation_items(self, docs: List[AnyStr], labels: List[AnyStr]) -> (List[AnyStr], List[AnyStr]):
+        eval_docs, eval_labels = [], []
+        for doc, label in zip(docs, labels):
+            prefix_lengths = [edge for edge in self.length_bucket_edges if edge < len(doc)] + [len(doc)]
+            for prefix_length in prefix_lengths:
+                eval_docs.append(doc[:prefix_length])
+                eval_labels.append(label)
+        return (eval_docs, eval_labels)
+
+    def tune(self, docs: List[AnyStr], labels: List[AnyStr] = None) -> Dict:
+        """
+        Measure both engines on a sample of documents, with optional language labels, and choose the threshold.
+        Return a dictionary with the chosen threshold, the statistics per bucket and the candidate thresholds.
+        """
+        if labels is not None and len(labels) != len(docs):
+            raise ValueError("There must be one label per document")
+        if labels is not None:
+            labeled_pairs = [(doc, label) for doc, label in zip(docs, labels) if doc and label]
+            docs, labels = [doc for doc, _ in labeled_pairs], [label for _, label in labeled_pairs]
+        else:
+            docs = [doc for doc in docs if doc]
+        if self.detector.text_normalizer is not None:
+            docs = self.detector.text_normalizer.normalize_batch(docs)
+        labeled_docs, doc_labels = self._label_docs(docs, labels)
+        if len(labeled_docs) == 0:
+            raise ValueError("No labeled documents to tune the routing threshold")
+        eval_docs, eval_labels = self._evaluation_items(labeled_docs, doc_labels)
+        short_codes, long_codes, short_seconds, long_seconds = self._detect_with_engines(eval_docs)
+        eval_labels = np.array(eval_labels)
+        num_buckets = len(self.length_bucket_edges) + 1
+        eval_buckets = np.searchsorted(self.length_bucket_edges, [len(doc) for doc in eval_docs], side="left")
+        doc_buckets = np.searchsorted(self.length_bucket_edges, [len(doc) for doc in docs], side="left")
+        bucket_weights = np.bincount(doc_buckets, minlength=num_buckets) / len(docs)
+        bucket_stats = []
+        for bucket_index in range(num_buckets):
+            is_in_bucket = eval_buckets == bucket_index
+            stats = {
+                "max_num_char": self.length_bucket_edges[bucket_index] if bucket_index < num_buckets - 1 else None,
+                "share_of_docs": round(float(bucket_weights[bucket_index]), 4),
+                "num_evaluated": int(is_in_bucket.sum()),
+            }
+            if stats["num_evaluated"] != 0:
+                for engine, codes, seconds in (
+                    ("short_doc_engine", short_codes, short_seconds),
+                    ("long_doc_engine", long_codes, long_seconds),
+                ):
+                    stats[engine + "_accuracy"] = float(np.mean(codes[is_in_bucket] == eval_labels[is_in_bucket]))
+                    stats[engine + "_us_per_doc"] = float(np.mean(seconds[is_in_bucket]) * 1e6)
+            bucket_stats.append(stats)
+        candidates = []
+        for threshold in [0] + self.length_bucket_edges:
+            accuracy, us_per_doc = 0.0, 0.0
+            for bucket_index, stats in enumerate(bucket_stats):
+                if stats["num_evaluated"] == 0:
+                    continue
+                max_num_char = stats["max_num_char"]
+                is_short = max_num_char is not None and max_num_char <= threshold
+                engine = "short_doc_engine" if is_short else "long_doc_engine"
+                accuracy += bucket_weights[bucket_index] * stats[engine + "_accuracy"]
+                us_per_doc += bucket_weights[bucket_index] * stats[engine + "_us_per_doc"]
+            candidates.append({"threshold": threshold, "accuracy": float(accuracy), "us_per_doc": float(us_per_doc)})
+        best_accuracy = max(candidate["accuracy"] for candidate in candidates)
+        chosen = min(
+            [candidate for candidate in candidates if candidate["accuracy"] >= best_accuracy - self.accuracy_tolerance],
+            key=lambda candidate: candidate["us_per_doc"],
+        )
+        logging.info(
+            "Routing threshold of {:d} characters: accuracy of {:.3f} at {:.1f} microseconds per document".format(
+                chosen["threshold"], chosen["accuracy"], chosen["us_per_doc"]
+            )
+        )
+        return {
+            "routing_threshold": chosen["threshold"],
+            "language_scope": sorted(self.detector.language_scope),
+            "short_doc_engine": self.detector.short_doc_engine.name,
+            "long_doc_engine": self.detector.long_doc_engine.name,
+            "accuracy_tolerance": self.accuracy_tolerance,
+            "labels": "provided" if labels is not None else "self_consistent",
+            "num_docs": len(docs),
+            "buckets": bucket_stats,
+            "candidates": candidates,
+        }
+
+    @classmethod
+    def load(cls, folder, language_scope: List[AnyStr]) -> Dict:
+        """
+        Load the output of a previous tune from a Dataiku managed folder,
+        or None if there is none or if it was tuned for another language scope
+        """
+        try:
+            tuning_dict = folder.read_json(cls.FILE_NAME)
+        except Exception:  # the folder API raises various errors for missing files
+            return None
+        if tuning_dict.get("language_scope") != sorted(language_scope):
+            logging.info("Saved routing threshold was tuned for another language scope")
+            return None
+        return tuning_dict
+
+    @classmethod
+    def load_routing_threshold(cls, tuning_dict: Dict, language_scope: List[AnyStr]) -> int:
+        """
+        Get the routing threshold from the output of tune, if it was tuned for the same language scope
+        """
+        if tuning_dict.get("language_scope") != sorted(language_scope):
+            logging.warning("Routing threshold tuned for another language scope, using the default threshold")
+            return LanguageDetector.LANGID_CLD3_NUM_CHAR_THRESHOLD
+        return int(tuning_dict["routing_threshold"])
+
+
+def main(argv: List[AnyStr] = None) -> None:
+    parser = argparse.ArgumentParser(description="Tune the routing threshold between langid and cld3 on a sample")
+    parser.add_argument("--input", required=True, help="Text file with one document per line")
+    parser.add_argument("--labels", help="Optional text file with the language code of each document, per line")
+    parser.add_argument("--output", default=RoutingTuner.FILE_NAME)
+    parser.add_argument("--language-scope", nargs="*", default=[lang["value"] for lang in SUPPORTED_LANGUAGES])
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.01)
+    parser.add_argument("--max-num-bytes", type=int, default=100000)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="Language Detection plugin %(levelname)s - %(message)s")
+
+    with open(args.input, encoding="utf-8") as input_file:
+        docs = [line.rstrip("\n") for line in input_file]
+    labels = None
+    if args.labels is not None:
+        with open(args.labels, encoding="utf-8") as labels_file:
+            labels = [line.strip() for line in labels_file]
+    detector = LanguageDetector(language_scope=list(args.language_scope), max_num_bytes=args.max_num_bytes)
+    tuning_dict = RoutingTuner(detector, args.accuracy_tolerance).tune(docs, labels)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(tuning_dict, output_file, indent=2)
+    logging.info("Saved routing tuning to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+from typing import AnyStr, List, Tuple
+
+import numpy as np
+
+from language_dict import SUPPORTED_LANGUAGES
+
+SCRIPTS = [
+    "neutral",  # digits, punctuation, symbols, emoji and combining marks, which do not count as letters
+    "other",  # letters of scripts not listed below
+    "latin",
+    "greek",
+    "cyrillic",
+    "armenian",
+    "hebrew",
+    "arabic",
+    "devanagari",
+    "bengali",
+    "gurmukhi",
+    "gujarati",
+    "oriya",
+    "tamil",
+    "telugu",
+    "kannada",
+    "malayalam",
+    "sinhala",
+    "thai",
+    "lao",
+    "tibetan",
+    "myanmar",
+    "georgian",
+    "hangul",
+    "ethiopic",
+    "khmer",
+    "kana",
+    "han",
+]
+
+# Unicode blocks as (first codepoint, last codepoint, script). Codepoints outside these blocks are "other".
+SCRIPT_BLOCKS = [
+    (0x0000, 0x0040, "neutral"),
+    (0x0041, 0x005A, "latin"),
+    (0x005B, 0x0060, "neutral"),
+    (0x0061, 0x007A, "latin"),
+    (0x007B, 0x00BF, "neutral"),
+    (0x00C0, 0x024F, "latin"),
+    (0x02B0, 0x036F, "neutral"),
+    (0x0370, 0x03FF, "greek"),
+    (0x0400, 0x052F, "cyrillic"),
+    (0x0530, 0x058F, "armenian"),
+    (0x0590, 0x05FF, "hebrew"),
+    (0x0600, 0x06FF, "arabic"),
+    (0x0750, 0x077F, "arabic"),
+    (0x08A0, 0x08FF, "arabic"),
+    (0x0900, 0x097F, "devanagari"),
+    (0x0980, 0x09FF, "bengali"),
+    (0x0A00, 0x0A7F, "gurmukhi"),
+    (0x0A80, 0x0AFF, "gujarati"),
+    (0x0B00, 0x0B7F, "oriya"),
+    (0x0B80, 0x0BFF, "tamil"),
+    (0x0C00, 0x0C7F, "telugu"),
+    (0x0C80, 0x0CFF, "kannada"),
+    (0x0D00, 0x0D7F, "malayalam"),
+    (0x0D80, 0x0DFF, "sinhala"),
+    (0x0E00, 0x0E7F, "thai"),
+    (0x0E80, 0x0EFF, "lao"),
+    (0x0F00, 0x0FFF, "tibetan"),
+    (0x1000, 0x109F, "myanmar"),
+    (0x10A0, 0x10FF, "georgian"),
+    (0x1100, 0x11FF, "hangul"),
+    (0x1200, 0x139F, "ethiopic"),
+    (0x1780, 0x17FF, "khmer"),
+    (0x1C90, 0x1CBF, "georgian"),
+    (0x1E00, 0x1EFF, "latin"),
+    (0x1F00, 0x1FFF, "greek"),
+    (0x2000, 0x2BFF, "neutral"),
+    (0x2D00, 0x2D2F, "georgian"),
+    (0x3000, 0x303F, "neutral"),
+    (0x3040, 0x30FF, "kana"),
+    (0x3130, 0x318F, "hangul"),
+    (0x31F0, 0x31FF, "kana"),
+    (0x3400, 0x4DBF, "han"),
+    (0x4E00, 0x9FFF, "han"),
+    (0xA960, 0xA97F, "hangul"),
+    (0xAC00, 0xD7FF, "hangul"),
+    (0xF900, 0xFAFF, "han"),
+    (0xFB50, 0xFDFF, "arabic"),
+    (0xFE00, 0xFE0F, "neutral"),
+    (0xFE70, 0xFEFF, "arabic"),
+    (0xFF00, 0xFF64, "neutral"),
+    (0xFF65, 0xFF9F, "kana"),
+    (0xFFA0, 0xFFDC, "hangul"),
+    (0xFFDD, 0xFFFF, "neutral"),
+    (0x1F000, 0x1FAFF, "neutral"),
+    (0x20000, 0x2FA1F, "han"),
+    (0xE0000, 0xE007F, "neutral"),
+]
+
+# Supported languages written in each script, for scripts used by few of them.
+# Scripts shared by many languages (Latin, Cyrillic, Arabic, Devanagari, Bengali, Han) are left out.
+SCRIPT_LANGUAGES = {
+    "greek": ("el",),
+    "armenian": ("hy",),
+    "hebrew": ("he", "yi"),
+    "gurmukhi": ("pa",),
+    "gujarati": ("gu",),
+    "oriya": ("or",),
+    "tamil": ("ta",),
+    "telugu": ("te",),
+    "kannada": ("kn",),
+    "malayalam": ("ml",),
+    "sinhala": ("si",),
+    "thai": ("th",),
+    "lao": ("lo",),
+    "tibetan": ("dz",),
+    "myanmar": ("my",),
+    "georgian": ("ka",),
+    "hangul": ("ko",),
+    "ethiopic": ("am",),
+    "khmer": ("km",),
+    "kana": ("ja",),
+}
+
+
+class ScriptClassifier:
+    """
+    Fast pre-classifier answering from the Unicode scripts of a document, without language models.
+    A document is classified when one script dominates its letters and this script is written by a single
+    supported language, which is in the language scope. Japanese is recognized by kana mixed with Han characters.
+    The score is the share of letters in the dominant script, so that mixed-script documents get lower scores.
+
+    Attributes:
+        language_scope: List of language codes which may be answered
+        min_script_share: Minimum share of letters in the dominant script to answer
+        min_kana_share: Minimum share of kana letters for a document of kana and Han characters to be Japanese
+        max_num_chars: Number of first characters of each document used to compute the script histogram
+    """
+
+    def __init__(
+        self,
+        language_scope: List[AnyStr],
+        min_script_share: float = 0.9,
+        min_kana_share: float = 0.1,
+        max_num_chars: int = 1000,
+    ):
+        self.language_scope = language_scope
+        self.min_script_share = min_script_share
+        self.min_kana_share = min_kana_share
+        self.max_num_chars = max_num_chars
+        supported_languages = {language["value"] for language in SUPPORTED_LANGUAGES}
+        language_scope_set = set(language_scope)
+        self.script_languages = {
+            script: languages[0]
+            for script, languages in SCRIPT_LANGUAGES.items()
+            if len(languages) == 1 and languages[0] in supported_languages and languages[0] in language_scope_set
+        }
+        # Lookup tables from codepoints to script indices and from script indices to languages
+        block_starts, block_scripts = [], []
+        next_codepoint = 0
+        for first, last, script in SCRIPT_BLOCKS:
+            if first > next_codepoint:
+                block_starts.append(next_codepoint)
+                block_scripts.append(SCRIPTS.index("other"))
+            block_starts.append(first)
+            block_scripts.append(SCRIPTS.index(script))
+            next_codepoint = last + 1
+        block_starts.append(next_codepoint)
+        block_scripts.append(SCRIPTS.index("other"))
+        self._block_starts = np.array(block_starts, dtype=np.uint32)
+        self._block_scripts = np.array(block_scripts, dtype=np.int64)
+        self._script_language_array = np.array([self.script_languages.get(script, "") for script in SCRIPTS])
+
+    def script_histogram(self, docs: List[AnyStr]) -> np.array:
+        """
+        Count characters of each script in each document, vectorized over all documents,
+        as an array of shape (number of documents, number of scripts)
+        """
+        docs = [doc[: self.max_num_chars] for doc in docs]
+        lengths = np.array([len(doc) for doc in docs], dtype=np.int64)
+        codepoints = np.frombuffer("".join(docs).encode("utf-32-le"), dtype=np.uint32)
+        script_indices = self._block_scripts[np.searchsorted(self._block_starts, codepoints, side="right") - 1]
+        doc_indices = np.repeat(np.arange(len(docs)), lengths)
+        histogram = np.bincount(doc_indices * len(SCRIPTS) + script_indices, minlength=len(docs) * len(SCRIPTS))
+        return histogram.reshape(len(docs), len(SCRIPTS))
+
+    def classify_batch(self, docs: List[AnyStr]) -> Tuple[np.array, np.array]:
+        """
+        Classify a list of documents, returning an array of language codes and an array of scores.
+        Documents which cannot be answered from their script have an empty code and a NaN score.
+        """
+        if len(self.script_languages) == 0 or len(docs) == 0:
+            return (np.full(len(docs), "", dtype="U2"), np.full(len(docs), np.nan))
+        histogram = self.script_histogram(docs).astype(np.float64)
+        histogram[:, SCRIPTS.index("neutral")] = 0
+        num_letters = histogram.sum(axis=1)
+        shares = histogram / np.maximum(num_letters, 1)[:, None]
+        kana, han = SCRIPTS.index("kana"), SCRIPTS.index("han")
+        shares[:, kana] = np.where(shares[:, kana] >= self.min_kana_share, shares[:, kana] + shares[:, han], 0)
+        dominant_scripts = shares.argmax(axis=1)
+        scores = shares[np.arange(len(docs)), dominant_scripts]
+        lang_ids = self._script_language_array[dominant_scripts].astype("U2")
+        is_classified = (num_letters > 0) & (scores >= self.min_script_share) & (lang_ids != "")
+        lang_ids[~is_classified] = ""
+        scores[~is_classified] = np.nan
+        return (lang_ids, scores)
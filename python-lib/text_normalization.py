@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import re
+from collections import OrderedDict
+from typing import AnyStr, List
+
+EMOJI_PATTERN = "[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF]\uFE0F?"  # joined with U+200D in sequences
+
+
+class TextNormalizer:
+    """
+    Remove noise which carries no language information before routing and detection,
+    with a single precompiled pattern combining the selected normalization steps
+
+    Attributes:
+        steps: List of normalization steps among NORMALIZATION_PATTERNS keys, applied in the order of this dictionary
+    """
+
+    NORMALIZATION_PATTERNS = OrderedDict(
+        [
+            ("html", r"<[^<>]{1,500}>|&(?:[a-zA-Z]{2,8}|#\d{1,6});"),
+            ("url", r"(?:https?://|www\.)\S+"),
+            ("email", r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"),
+            ("mention", r"@\w+"),
+            ("hashtag", r"#\w+"),
+            ("digits", r"\d{4,}"),  # long digit runs, e.g. identifiers, but not short numerals within sentences
+            ("emoji", "(?:{0}(?:\u200D{0})*){{2,}}".format(EMOJI_PATTERN)),  # repeated emoji, not single ones
+        ]
+    )
+    WHITESPACE_PATTERN = re.compile(r"\s{2,}")
+    ALPHABETIC_PATTERN = re.compile(r"[^\W\d_]")
+
+    def __init__(self, steps: List[AnyStr] = None):
+        if steps is None:
+            steps = list(self.NORMALIZATION_PATTERNS.keys())
+        unknown_steps = set(steps) - set(self.NORMALIZATION_PATTERNS.keys())
+        if len(unknown_steps) != 0:
+            raise ValueError(
+                "Normalization steps {} not in {}".format(sorted(unknown_steps), list(self.NORMALIZATION_PATTERNS))
+            )
+        self.steps = [step for step in self.NORMALIZATION_PATTERNS.keys() if step in steps]
+        self._pattern = None
+        if len(self.steps) != 0:
+            self._pattern = re.compile("|".join(self.NORMALIZATION_PATTERNS[step] for step in self.steps))
+
+    def normalize(self, doc: AnyStr) -> AnyStr:
+        if self._pattern is not None:
+            doc = self._pattern.sub(" ", doc)
+        return self.WHITESPACE_PATTERN.sub(" ", doc).strip()
+
+    def normalize_batch(self, docs: List[AnyStr]) -> List[AnyStr]:
+        """
+        Normalize a list of documents, keeping missing documents as None
+        """
+        normalize = self.normalize
+        return [normalize(doc) if doc else doc for doc in docs]
+
+    def has_alphabetic_content(self, doc: AnyStr) -> bool:
+        return self.ALPHABETIC_PATTERN.search(doc) is not None
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Generate synthetic multilingual corpora with controlled length distributions, duplicate ratios and script mixes
+"""
+
+import random
+from typing import List, AnyStr, Dict
+
+WORDS_BY_LANGUAGE = {
+    "en": "the of and to in is you that it he was for on are as with his they at be this have from or one had "
+    "by word but not what all were we when your can said there use each which she do how their if will up other "
+    "about out many then them these so some her would make like him into time has look two more write go see",
+    "fr": "le de un être et à il avoir ne je son que se qui ce dans en du elle au pour pas que vous par sur faire "
+    "plus dire me on mon lui nous comme mais pouvoir avec tout y aller voir en bien où sans tu ou leur homme si",
+    "de": "der die und in den von zu das mit sich des auf für ist im dem nicht ein eine als auch es an werden aus "
+    "er hat dass sie nach wird bei einer um am sind noch wie einem über einen so zum war haben nur oder aber vor",
+    "es": "de la que el en y a los se del las un por con no una su para es al lo como más o pero sus le ha me si "
+    "sin sobre este ya entre cuando todo esta ser son dos también fue había era muy años hasta desde está mi",
+    "it": "di che è e la il un a per non in una sono mi ho lo ma ti ha le si con cosa se io come da ci questo qui "
+    "hai sei del bene tu sì me più al mio c'è perché lei solo era gli della tutto te cosa molto anche",
+    "ru": "и в не на я быть он с что а по это она этот к но они мы как из у который то за свой что весь год от "
+    "так о для ты же все тот мочь вы человек такой его сказать только или ещё бы себя один как уже до время",
+    "el": "και το να η ο της την του με για που δεν τα θα στο σε από είναι τον οι στην ένα των μια στη ότι τη "
+    "αλλά στα αυτό πολύ μου ως τις όταν πως έχει μας κατά όπως μετά",
+    "ja": "の に は を た が で て と し れ さ ある いる も する から な こと として い や れる など なっ ない この "
+    "ため その あっ よう また もの という あり まで られ なる へ か だ これ によって により おり より による ず なり",
+    "ko": "이 그 저 것 수 등 들 및 에서 그리고 하다 있다 되다 없다 않다 나 사람 우리 아니다 보다 같다 주다 대하다 "
+    "가다 년 한 말 일 때문 생각 때 중 알다 오다 소리 자기 집 안 위하다 통하다",
+    "ar": "في من على إلى عن مع هذا هذه التي الذي كان أن لا ما هو هي كل بعد قد ثم أو بين عند حتى لم إذا لكن "
+    "منذ كانت يكون قبل حيث غير أي تلك ذلك",
+}
+
+
+def generate_doc(language: AnyStr, num_char: int, rng: random.Random, mixed_language: AnyStr = None) -> AnyStr:
+    """
+    Generate a pseudo-sentence of about num_char characters from frequent words of one or two languages
+    """
+    words = WORDS_BY_LANGUAGE[language].split()
+    mixed_words = WORDS_BY_LANGUAGE[mixed_language].split() if mixed_language is not None else []
+    separator = "" if language == "ja" else " "
+    doc_words, doc_length = [], 0
+    while doc_length < num_char:
+        word = rng.choice(mixed_words) if mixed_words and rng.random() < 0.5 else rng.choice(words)
+        doc_words.append(word)
+        doc_length += len(word) + len(separator)
+    return separator.join(doc_words)[:num_char]
+
+
+def generate_corpus(
+    num_docs: int = 10000,
+    median_num_char: int = 60,
+    length_sigma: float = 1.0,
+    max_num_char: int = 100000,
+    duplicate_ratio: float = 0.0,
+    mixed_script_ratio: float = 0.0,
+    languages: List[AnyStr] = None,
+    seed: int = 42,
+) -> List[AnyStr]:
+    """
+    Generate a list of documents with:
+    - Lengths in characters following a log-normal distribution of given median and sigma
+    - A ratio of documents duplicated from previous ones
+    - A ratio of documents mixing words from two languages
+    """
+    rng = random.Random(seed)
+    languages = languages or sorted(WORDS_BY_LANGUAGE.keys())
+    corpus = []
+    for _ in range(num_docs):
+        if len(corpus) != 0 and rng.random() < duplicate_ratio:
+            corpus.append(rng.choice(corpus))
+            continue
+        num_char = min(max(1, int(rng.lognormvariate(0, length_sigma) * median_num_char)), max_num_char)
+        language = rng.choice(languages)
+        mixed_language = rng.choice(languages) if rng.random() < mixed_script_ratio else None
+        corpus.append(generate_doc(language, num_char, rng, mixed_language))
+    return corpus
+
+
+def describe_corpus(corpus: List[AnyStr]) -> Dict:
+    lengths = sorted(len(doc) for doc in corpus)
+    return {
+        "num_docs": len(corpus),
+        "num_unique_docs": len(set(corpus)),
+        "num_chars": sum(lengths),
+        "median_num_char": lengths[len(lengths) // 2] if len(lengths) != 0 else 0,
+        "max_num_char": lengths[-1] if len(lengths) != 0 else 0,
+    }
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the parts of the dataiku dataset API used by dku_io_utils, to benchmark the chunk pipeline offline.
+It is only installed as the dataiku module if the real one cannot be imported.
+"""
+
+import sys
+import time
+import types
+from typing import AnyStr, Dict
+
+import pandas as pd
+
+
+class LocalComputedMetrics:
+    """
+    Last metric values of a local dataset, with only the record count metric
+    """
+
+    def __init__(self, record_count: int = None):
+        self.record_count = record_count
+
+    def get_global_data(self, metric_id: AnyStr) -> Dict:
+        if self.record_count is None:
+            raise ValueError("Metric {} was never computed".format(metric_id))
+        return {"value": str(self.record_count), "dataType": "BIGINT"}
+
+    @staticmethod
+    def get_value_from_data(data: Dict) -> int:
+        return int(data["value"])
+
+
+class LocalDatasetWriter:
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def write_dataframe(self, df: pd.DataFrame) -> None:
+        if self.dataset.write_latency > 0:
+            time.sleep(self.dataset.write_latency)
+        self.dataset.num_rows_written += len(df)
+
+
+class LocalDataset:
+    """
+    In-memory dataset reading a dataframe by chunks, with optional simulated I/O latency per chunk.
+    A partitioned dataset is defined by a dictionary of dataframes per partition, and is also registered
+    by name so that a new instance created from the same name can read its partitions.
+    Written rows are counted but not kept, so that memory does not grow with the size of the benchmark.
+    """
+
+    _partitioned_datasets = {}
+
+    def __init__(
+        self,
+        name: AnyStr,
+        df: pd.DataFrame = None,
+        read_latency: float = 0.0,
+        write_latency: float = 0.0,
+        partition_dfs: Dict[AnyStr, pd.DataFrame] = None,
+    ):
+        self.name = name if name.startswith("BENCHMARK.") else "BENCHMARK." + name
+        self.read_partitions = None
+        if partition_dfs is not None:  # as in a recipe reading all partitions
+            LocalDataset._partitioned_datasets[self.name] = (partition_dfs, read_latency)
+            self.read_partitions = sorted(partition_dfs.keys())
+        elif self.name in LocalDataset._partitioned_datasets:
+            partition_dfs, read_latency = LocalDataset._partitioned_datasets[self.name]
+        self.partition_dfs = partition_dfs
+        self.df = df
+        self.writePartition = None
+        self.read_latency = read_latency
+        self.write_latency = write_latency
+        self.num_rows_written = 0
+        self.schema = None
+
+    def add_read_partitions(self, partition: AnyStr) -> None:
+        self.read_partitions = (self.read_partitions or []) + [partition]
+
+    def iter_dataframes(self, chunksize: int = 10000, infer_with_pandas: bool = True, **kwargs):
+        df = self.df
+        if self.partition_dfs is not None:
+            partitions = self.read_partitions or sorted(self.partition_dfs.keys())
+            df = pd.concat([self.partition_dfs[partition] for partition in partitions])
+        for start in range(0, len(df), chunksize):
+            if self.read_latency > 0:
+                time.sleep(self.read_latency)
+            yield df.iloc[start : start + chunksize]
+
+    def get_last_metric_values(self) -> LocalComputedMetrics:
+        return LocalComputedMetrics(len(self.df) if self.df is not None else None)
+
+    def get_writer(self) -> LocalDatasetWriter:
+        return LocalDatasetWriter(self)
+
+    def write_schema_from_dataframe(self, df: pd.DataFrame, dropAndCreate: bool = False) -> None:
+        self.schema = [{"name": column, "type": str(dtype)} for column, dtype in df.dtypes.items()]
+
+
+def install_dataiku_stand_in() -> None:
+    """
+    Register a minimal dataiku module backed by local datasets, unless the real dataiku package is available
+    """
+    try:
+        import dataiku  # noqa
+    except ImportError:
+        module = types.ModuleType("dataiku")
+        module.Dataset = LocalDataset
+        module.ComputedMetrics = LocalComputedMetrics
+        sys.modules["dataiku"] = module
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark suite for the language detection engine and the chunk pipeline.
+
+Usage, from the root of the repository: make benchmarks BENCHMARK_ARGS="--baseline benchmark_baseline.json"
+Or directly, with python-lib and tests/python/benchmark in the PYTHONPATH:
+    python tests/python/benchmark/run_benchmarks.py --output benchmark_results.json --baseline benchmark_baseline.json
+
+Results are written as JSON. If a baseline file from a previous run is given, the script exits with an error
+when the throughput of any benchmark is lower than the baseline by more than the tolerance.
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+from itertools import product
+from typing import AnyStr, Callable, Dict, List
+
+import pandas as pd
+
+from corpus_generation import generate_corpus, describe_corpus
+from dataiku_stand_in import install_dataiku_stand_in, LocalDataset
+
+install_dataiku_stand_in()
+
+from language_detection import LanguageDetector  # noqa
+from dku_io_utils import process_dataset_chunks, process_dataset_partitions  # noqa
+from parallel_utils import get_available_cpu_count  # noqa
+
+CORPUS_PROFILES = {
+    "tweets": {"median_num_char": 60, "length_sigma": 0.6, "duplicate_ratio": 0.3},
+    "reviews": {"median_num_char": 300, "length_sigma": 0.8, "duplicate_ratio": 0.05, "mixed_script_ratio": 0.1},
+    "documents": {"median_num_char": 3000, "length_sigma": 1.5, "duplicate_ratio": 0.0},
+}
+
+
+def measure(func: Callable, num_docs: int, num_chars: int, num_repeats: int) -> Dict:
+    """
+    Run a function several times and report the best time, to limit the noise from other processes
+    """
+    durations = []
+    for _ in range(num_repeats):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    best_seconds = min(durations)
+    return {
+        "seconds": best_seconds,
+        "docs_per_second": num_docs / best_seconds if best_seconds > 0 else 0.0,
+        "chars_per_second": num_chars / best_seconds if best_seconds > 0 else 0.0,
+    }
+
+
+def benchmark_detect_language_doc(corpus: List[AnyStr], routing_threshold: int, num_repeats: int) -> Dict:
+    detector = LanguageDetector(routing_threshold=routing_threshold)
+    return measure(
+        lambda: [detector.detect_language_doc(doc) for doc in corpus],
+        len(corpus),
+        sum(len(doc) for doc in corpus),
+        num_repeats,
+    )
+
+
+def benchmark_detect_languages_df(
+    corpus: List[AnyStr], routing_threshold: int, backend: AnyStr, num_workers: int, num_repeats: int
+) -> Dict:
+    detector = LanguageDetector(backend=backend, num_workers=num_workers, routing_threshold=routing_threshold)
+    df = pd.DataFrame({"text": corpus})
+    detector.detect_languages_df(df.head(10), "text")  # start worker processes outside of the measure
+    result = measure(
+        lambda: detector.detect_languages_df(df, "text"), len(corpus), sum(len(doc) for doc in corpus), num_repeats
+    )
+    detector.close()
+    return result
+
+
+def benchmark_process_dataset_chunks(
+    corpus: List[AnyStr], chunksize: int, pipeline_queue_size: int, io_latency: float, num_repeats: int
+) -> Dict:
+    detector = LanguageDetector()
+    df = pd.DataFrame({"text": corpus})
+
+    def run():
+        input_dataset = LocalDataset("input", df, read_latency=io_latency, write_latency=io_latency)
+        output_dataset = LocalDataset("output")
+        process_dataset_chunks(
+            input_dataset=input_dataset,
+            output_dataset=output_dataset,
+            func=detector.detect_languages_df,
+            chunksize=chunksize,
+            pipeline_queue_size=pipeline_queue_size,
+            record_count_mode="cached",
+            text_column="text",
+        )
+
+    return measure(run, len(corpus), sum(len(doc) for doc in corpus), num_repeats)
+
+
+def benchmark_process_dataset_partitions(
+    corpus: List[AnyStr], num_partitions: int, partition_workers: int, io_latency: float, num_repeats: int
+) -> Dict:
+    partition_size = len(corpus) // num_partitions
+    partition_dfs = {
+        "partition_{:03d}".format(i): pd.DataFrame({"text": corpus[i * partition_size : (i + 1) * partition_size]})
+        for i in range(num_partitions)
+    }
+
+    def run():
+        input_dataset = LocalDataset("partitioned_input", read_latency=io_latency, partition_dfs=partition_dfs)
+        output_dataset = LocalDataset("output", write_latency=io_latency)
+        process_dataset_partitions(
+            input_dataset=input_dataset,
+            output_dataset=output_dataset,
+            func_factory=lambda: LanguageDetector().detect_languages_df,
+            partition_workers=partition_workers,
+            chunksize=1000,
+            text_column="text",
+        )
+
+    num_docs = partition_size * num_partitions
+    return measure(run, num_docs, sum(len(doc) for doc in corpus[:num_docs]), num_repeats)
+
+
+def run_benchmarks(num_docs: int, num_repeats: int, profiles: List[AnyStr], quick: bool) -> List[Dict]:
+    results = []
+    max_num_workers = get_available_cpu_count()
+    for profile in profiles:
+        corpus = generate_corpus(num_docs=num_docs, **CORPUS_PROFILES[profile])
+        corpus_description = describe_corpus(corpus)
+        logging.info("Benchmarking corpus '{}': {}".format(profile, corpus_description))
+        routing_thresholds = [140] if quick else [70, 140, 280]
+        for routing_threshold in routing_thresholds:
+            params = {"corpus": profile, "routing_threshold": routing_threshold}
+            result = benchmark_detect_language_doc(corpus, routing_threshold, num_repeats)
+            results.append({"name": "detect_language_doc", "params": params, **result})
+        backends = [("thread", 4)] if quick else product(["thread", "process"], sorted({1, 4, max_num_workers}))
+        for (backend, num_workers), routing_threshold in product(backends, routing_thresholds):
+            params = {"corpus": profile, "routing_threshold": routing_threshold}
+            params.update({"backend": backend, "num_workers": num_workers})
+            result = benchmark_detect_languages_df(corpus, routing_threshold, backend, num_workers, num_repeats)
+            results.append({"name": "detect_languages_df", "params": params, **result})
+        chunksizes = [1000] if quick else [1000, 10000]
+        pipeline_queue_sizes = [0, 2]
+        for chunksize, pipeline_queue_size in product(chunksizes, pipeline_queue_sizes):
+            params = {"corpus": profile, "chunksize": chunksize, "pipeline_queue_size": pipeline_queue_size}
+            result = benchmark_process_dataset_chunks(corpus, chunksize, pipeline_queue_size, 0.01, num_repeats)
+            results.append({"name": "process_dataset_chunks", "params": params, **result})
+        for partition_workers in [1, 4]:
+            params = {"corpus": profile, "num_partitions": 8, "partition_workers": partition_workers}
+            result = benchmark_process_dataset_partitions(corpus, 8, partition_workers, 0.01, num_repeats)
+            results.append({"name": "process_dataset_partitions", "params": params, **result})
+    for result in results:
+        logging.info(
+            "{} {}: {:.1f} docs/s".format(
+                result["name"], json.dumps(result["params"], sort_keys=True), result["docs_per_second"]
+            )
+        )
+    return results
+
+
+def _result_key(result: Dict) -> AnyStr:
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+
+def compare_to_baseline(results: List[Dict], baseline_results: List[Dict], tolerance: float) -> List[AnyStr]:
+    """
+    List benchmarks whose throughput is lower than in the baseline by more than the tolerance ratio
+    """
+    baseline_by_key = {_result_key(result): result for result in baseline_results}
+    regressions = []
+    for result in results:
+        baseline = baseline_by_key.get(_result_key(result))
+        if baseline is None:
+            continue
+        if result["docs_per_second"] < baseline["docs_per_second"] * (1 - tolerance):
+            regressions.append(
+                "{} {}: {:.1f} docs/s against {:.1f} docs/s in baseline".format(
+                    result["name"],
+                    json.dumps(result["params"], sort_keys=True),
+                    result["docs_per_second"],
+                    baseline["docs_per_second"],
+                )
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark language detection offline")
+    parser.add_argument("--output", default="benchmark_results.json", help="Path of the JSON results")
+    parser.add_argument("--baseline", default=None, help="Path of JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed throughput decrease ratio")
+    parser.add_argument("--num-docs", type=int, default=5000, help="Number of documents per corpus")
+    parser.add_argument("--num-repeats", type=int, default=3, help="Number of runs per benchmark")
+    parser.add_argument("--profiles", nargs="+", default=sorted(CORPUS_PROFILES.keys()), help="Corpus profiles")
+    parser.add_argument("--quick", action="store_true", help="Only run a small grid of parameters")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    results = run_benchmarks(args.num_docs, args.num_repeats, args.profiles, args.quick)
+    output = {
+        "environment": {
+            "python_version": platform.python_version(),
+            "platform": platform.platform(),
+            "num_cpus": get_available_cpu_count(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+    logging.info("Benchmark results written to: {}".format(args.output))
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            logging.error("Performance regression: {}".format(regression))
+        if len(regressions) != 0:
+            return 1
+        logging.info("No performance regression against baseline: {}".format(args.baseline))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
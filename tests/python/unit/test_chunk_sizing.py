@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+import pandas as pd
+
+from chunk_sizing import AdaptiveChunkSizer  # noqa
+
+
+def test_adaptive_chunk_sizer_latency():
+    chunk_sizer = AdaptiveChunkSizer(target_chunk_seconds=1.0, min_chunksize=10, max_chunksize=10000)
+    assert chunk_sizer.chunksize == 10
+    chunk_sizer.observe_processing(num_rows=10, seconds=0.001)  # fast rows: grow up to the maximum
+    assert chunk_sizer.chunksize == 10000
+    for _ in range(20):
+        chunk_sizer.observe_processing(num_rows=1000, seconds=1.0)  # 1 ms per row
+    assert 900 <= chunk_sizer.chunksize <= 1100
+
+
+def test_adaptive_chunk_sizer_memory():
+    chunk_sizer = AdaptiveChunkSizer(memory_budget_mb=1, min_chunksize=10, max_chunksize=100000)
+    long_text_df = pd.DataFrame({"text": ["x" * 10000] * 10})
+    chunk_sizer.observe_read(long_text_df)
+    chunk_sizer.observe_processing(num_rows=10, seconds=0.0001)
+    assert 10 <= chunk_sizer.chunksize < 100  # 1 MB holds about 30 rows of 10 KB with the memory overhead
+
+
+def test_iter_rechunked():
+    chunk_sizer = AdaptiveChunkSizer(min_chunksize=10, max_chunksize=100)
+    small_chunks = [pd.DataFrame({"text": ["a"] * 10}) for _ in range(10)]
+    chunk_sizer.chunksize = 30
+    rechunked = list(chunk_sizer.iter_rechunked(iter(small_chunks)))
+    assert [len(df) for df in rechunked] == [30, 30, 30, 10]
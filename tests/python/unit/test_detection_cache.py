@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+import os
+
+from detection_cache import LRUDetectionCache, PersistentDetectionCache  # noqa
+
+
+def test_lru_detection_cache():
+    cache = LRUDetectionCache(max_size=2)
+    cache.set_many(["Bonjour", "Hello"], [("fr", "French", 0.9), ("en", "English", 0.8)])
+    assert cache.get_many(["Bonjour", "Hola"]) == {"Bonjour": ("fr", "French", 0.9)}
+    cache.set_many(["Hallo " * 100], [("de", "German", 1.0)])  # evicts "Hello", the least recently used
+    assert cache.get_many(["Hello", "Bonjour", "Hallo " * 100]) == {
+        "Bonjour": ("fr", "French", 0.9),
+        "Hallo " * 100: ("de", "German", 1.0),
+    }
+    assert cache.get_stats()["hits"] == 3 and cache.get_stats()["misses"] == 2
+
+
+def test_persistent_detection_cache(tmpdir):
+    path = os.path.join(str(tmpdir), "cache.sqlite")
+    cache = PersistentDetectionCache(path, config_fingerprint="a", max_size=2)
+    cache.set_many(["Bonjour", "Hello", "Hola"], [("fr", "French", 0.9), ("en", "English", None), ("es", "", 0.5)])
+    assert cache.get_stats()["size"] == 2
+    cache.close()
+    cache = PersistentDetectionCache(path, config_fingerprint="a", max_size=2)
+    assert cache.get_many(["Hello", "Hola"]) == {"Hello": ("en", "English", None), "Hola": ("es", "", 0.5)}
+    cache.close()
+    cache = PersistentDetectionCache(path, config_fingerprint="b", max_size=2)  # configuration changed
+    assert cache.get_many(["Hello", "Hola"]) == {}
+    cache.close()
+
+
+def test_persistent_detection_cache_entry_count(tmpdir):
+    path = os.path.join(str(tmpdir), "cache.sqlite")
+    cache = PersistentDetectionCache(path, config_fingerprint="a", max_size=1000)
+    cache.set_many(["Bonjour", "Hello"], [("fr", "French", 0.9), ("en", "English", 0.8)])
+    cache.set_many(["Hello", "Hola"], [("en", "English", 0.7), ("es", "Spanish", 0.5)])  # one entry already cached
+    assert cache._num_entries == cache.get_stats()["size"] == 3
+    assert cache.get_many(["Hello"]) == {"Hello": ("en", "English", 0.7)}
+    cache.close()
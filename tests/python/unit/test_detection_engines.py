@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+import numpy as np
+import pytest
+
+from detection_engines import DetectionEngine, ENGINE_REGISTRY, create_engine, register_engine  # noqa
+from language_detection import LanguageDetector  # noqa
+
+
+@register_engine
+class ConstantEngine(DetectionEngine):
+    name = "constant_test_engine"
+    LANGUAGE_REMAPPING = {"iw": "he"}
+
+    def detect_batch(self, texts):
+        return ([self.get_language_code("iw-Latn")] * len(texts), np.full(len(texts), 0.5))
+
+
+def test_detection_engines():
+    assert {"langid", "cld3"} <= set(ENGINE_REGISTRY)
+    langid_engine = create_engine("langid", ["en", "fr", "yo"])
+    assert "yo" not in langid_engine.SUPPORTED_LANGUAGES
+    codes, scores = langid_engine.detect_batch(["Every performance is an adventure", "Comment est votre blanquette ?"])
+    assert codes == ["en", "fr"] and scores.shape == (2,)
+    with pytest.raises(ValueError):
+        create_engine("unknown", ["en"])
+
+
+def test_language_detection_custom_engine(tmpdir):
+    detector = LanguageDetector(
+        language_scope=["en", "he"],
+        short_doc_engine="constant_test_engine",
+        persistent_cache_path=str(tmpdir.join("cache.sqlite")),
+    )
+    assert detector.detect_language_batch(["Hello", ""]) == [("he", "Hebrew", 0.5), ("", "", None)]
+    assert "constant_test_engine" in detector.metrics.to_dict()["timers"]
+    assert detector.get_config_fingerprint() != LanguageDetector(language_scope=["en", "he"]).get_config_fingerprint()
+    detector.close()
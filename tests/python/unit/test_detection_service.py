@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+import json
+import asyncio
+
+from language_detection import LanguageDetector  # noqa
+from detection_service import MicroBatcher, DetectionService  # noqa
+
+
+DOCS = [
+    "Comment est votre blanquette ?",
+    "Every performance is an adventure with this group. They're called Fire Saga.",
+    "このオレはいずれ火影の名を受け継いで、先代のどの火影をも超えてやるんだ",
+]
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_micro_batcher():
+    detector = LanguageDetector(language_scope=["en", "fr", "ja"], minimum_score=0.0, fallback_language="")
+    batcher = MicroBatcher(detector, max_batch_size=8, max_wait_ms=10, num_workers=2)
+
+    async def detect_all():
+        await batcher.start()
+        results = await asyncio.gather(*[batcher.detect(doc) for doc in DOCS * 10])
+        await batcher.stop()
+        return results
+
+    results = _run(detect_all())
+    detector.close()
+    assert [code for code, _, _ in results] == ["fr", "en", "ja"] * 10
+    stats = batcher.get_stats()
+    assert stats["num_requests"] == 30
+    assert 1 < stats["mean_batch_size"] <= 8
+    assert stats["latency_ms_p50"] <= stats["latency_ms_p99"]
+
+
+def test_micro_batcher_failure_isolation():
+    detector = LanguageDetector(language_scope=["en", "fr", "ja"], minimum_score=0.0, fallback_language="")
+    batcher = MicroBatcher(detector, max_batch_size=8, max_wait_ms=10, num_workers=1)
+
+    async def detect_all():
+        await batcher.start()
+        results = await asyncio.gather(*[batcher.detect(doc) for doc in DOCS + [1]], return_exceptions=True)
+        await batcher.stop()
+        return results
+
+    results = _run(detect_all())
+    detector.close()
+    assert [code for code, _, _ in results[:3]] == ["fr", "en", "ja"]  # not failed by the invalid document
+    assert isinstance(results[3], TypeError)
+
+
+def test_detection_service():
+    detector = LanguageDetector(language_scope=["en", "fr", "ja"], minimum_score=0.0, fallback_language="")
+    service = DetectionService(MicroBatcher(detector, max_batch_size=8, max_wait_ms=1), port=0)
+
+    async def request(writer, reader, method, path, body=b"", content_length=None):
+        content_length = str(len(body)) if content_length is None else content_length
+        writer.write(
+            "{} {} HTTP/1.1\r\nContent-Length: {}\r\n\r\n".format(method, path, content_length).encode() + body
+        )
+        status_line = await reader.readline()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        payload = await reader.readexactly(int(headers["content-length"]))
+        return int(status_line.split()[1]), json.loads(payload.decode())
+
+    async def query_service():
+        await service.start()
+        port = service._server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        responses = [
+            await request(writer, reader, "POST", "/detect", json.dumps({"text": DOCS[0]}).encode()),
+            await request(writer, reader, "POST", "/detect", json.dumps({"texts": DOCS}).encode()),
+            await request(writer, reader, "POST", "/detect", b"not json"),
+            await request(writer, reader, "POST", "/detect", json.dumps({"texts": [DOCS[0], 1]}).encode()),
+            await request(writer, reader, "GET", "/stats"),
+            await request(writer, reader, "GET", "/unknown"),
+        ]
+        writer.close()
+        for content_length in ["abc", "-5"]:  # answered before the connection is closed
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            responses.append(
+                await asyncio.wait_for(request(writer, reader, "POST", "/detect", b"{}", content_length), timeout=10)
+            )
+            assert await reader.read() == b""
+            writer.close()
+        await service.stop()
+        return responses
+
+    responses = _run(query_service())
+    detector.close()
+    assert responses[0] == (200, {"language_code": "fr", "language_name": "French", "language_score": 1.0})
+    assert [r["language_code"] for r in responses[1][1]["results"]] == ["fr", "en", "ja"]
+    assert responses[2][0] == 400
+    assert responses[3][0] == 400
+    assert responses[4][0] == 200 and responses[4][1]["num_requests"] == 4
+    assert responses[5][0] == 404
+    assert responses[6] == (400, {"error": "Invalid Content-Length: 'abc'"})
+    assert responses[7] == (400, {"error": "Invalid Content-Length: '-5'"})
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+from diagnostics import DetectionDiagnostics  # noqa
+
+
+def test_detection_diagnostics():
+    diagnostics = DetectionDiagnostics()
+    for score in [0.05, 0.5, 0.99, 1.0]:
+        diagnostics.add_score(score)
+    diagnostics.add_rejection("Hallo " * 100, "de", 0.9, "out_of_scope", "en")
+    diagnostics.add_rejection("1", "en", 0.1, "below_minimum_score", "en")
+    other_diagnostics = DetectionDiagnostics()
+    other_diagnostics.add_rejection("Hallo", "de", 0.8, "out_of_scope", "en")
+    diagnostics.merge(other_diagnostics.to_dict())
+    diagnostics_dict = diagnostics.to_dict()
+    assert diagnostics_dict["rejection_counts"] == {"out_of_scope": 2, "below_minimum_score": 1}
+    assert diagnostics_dict["fallback_counts"][0] == {"detected": "de", "fallback": "en", "count": 2}
+    assert diagnostics_dict["score_histogram"]["counts"] == [1, 0, 0, 0, 0, 1, 0, 0, 0, 2]
+    assert len(diagnostics_dict["examples"]) == 3
+    assert len(diagnostics_dict["examples"][0]["doc"]) == DetectionDiagnostics.EXAMPLE_MAX_NUM_CHAR + 3
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+import json
+
+import pandas as pd
+
+from incremental_state import IncrementalState  # noqa
+
+
+def test_incremental_state_watermark():
+    config = {"detector": "abc", "text_columns": ["text"]}
+    state = IncrementalState("id", config)
+    assert state.is_full_rebuild
+    first_df = pd.DataFrame({"id": [1, 3, 2, None], "text": ["a", "b", "c", "d"]})
+    assert list(state.filter_new_rows(first_df)["text"]) == ["a", "b", "c"]
+    saved_state = json.loads(json.dumps(state.to_dict()))
+    next_state = IncrementalState("id", config, saved_state)
+    assert not next_state.is_full_rebuild
+    next_df = pd.DataFrame({"id": [2, 3, 4, 5], "text": ["c", "b", "e", "f"]})
+    assert list(next_state.filter_new_rows(next_df)["text"]) == ["e", "f"]
+    assert next_state.to_dict()["watermark"] == {"type": "int", "value": 5}
+
+
+def test_incremental_state_datetime_watermark():
+    config = {"detector": "abc"}
+    state = IncrementalState("date", config)
+    state.filter_new_rows(pd.DataFrame({"date": pd.to_datetime(["2020-01-01", "2020-01-03"])}))
+    next_state = IncrementalState("date", config, json.loads(json.dumps(state.to_dict())))
+    next_df = pd.DataFrame({"date": pd.to_datetime(["2020-01-02", "2020-01-04"])})
+    assert len(next_state.filter_new_rows(next_df)) == 1
+
+
+def test_incremental_state_full_rebuild():
+    state = IncrementalState("id", {"detector": "abc"})
+    state.filter_new_rows(pd.DataFrame({"id": [1, 2]}))
+    saved_state = state.to_dict()
+    assert IncrementalState("id", {"detector": "def"}, saved_state).is_full_rebuild
+    assert IncrementalState("other_id", {"detector": "abc"}, saved_state).is_full_rebuild
+    forced_state = IncrementalState("id", {"detector": "abc"}, saved_state)
+    forced_state.force_full_rebuild("the output is overwritten")
+    assert forced_state.is_full_rebuild
+    assert len(forced_state.filter_new_rows(pd.DataFrame({"id": [1, 2, 3]}))) == 3
+
+
+def test_incremental_state_tied_watermark():
+    config = {"detector": "abc"}
+    state = IncrementalState("date", config)
+    first_df = pd.DataFrame(
+        {"date": pd.to_datetime(["2020-01-01", "2020-01-02", "2020-01-02"]), "text": ["a", "b", "b"]}
+    )
+    assert len(state.filter_new_rows(first_df)) == 3
+    next_state = IncrementalState("date", config, json.loads(json.dumps(state.to_dict())))
+    # Rows arriving later with the same timestamp as the last processed rows are not lost
+    next_df = pd.DataFrame(
+        {"date": pd.to_datetime(["2020-01-01"] + ["2020-01-02"] * 4), "text": ["a", "b", "c", "b", "b"]}
+    )
+    assert list(next_state.filter_new_rows(next_df)["text"]) == ["c", "b"]
+    last_state = IncrementalState("date", config, json.loads(json.dumps(next_state.to_dict())))
+    assert len(last_state.filter_new_rows(next_df)) == 0
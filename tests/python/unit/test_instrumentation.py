@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+from instrumentation import ProcessingMetrics  # noqa
+
+
+def test_processing_metrics():
+    metrics = ProcessingMetrics()
+    with metrics.timer("langid", count=10):
+        metrics.increment("docs", 10)
+        metrics.increment("chars", 250)
+    other_metrics = ProcessingMetrics()
+    other_metrics.add_time("langid", 1.0, count=5)
+    other_metrics.increment("docs", 5)
+    metrics.merge(other_metrics.to_dict())
+    metrics_dict = metrics.to_dict()
+    assert metrics_dict["timers"]["langid"]["count"] == 15
+    assert metrics_dict["timers"]["langid"]["total_seconds"] >= 1.0
+    assert metrics_dict["counters"] == {"docs": 15, "chars": 250}
+    assert metrics_dict["throughput"]["docs_per_second"] > 0
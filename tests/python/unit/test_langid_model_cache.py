@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+import os
+
+import numpy as np
+
+from langid_model_cache import load_langid_identifier  # noqa
+from detection_engines import LangidEngine  # noqa
+
+
+def test_load_langid_identifier(tmpdir):
+    languages = ["en", "fr", "ja"]
+    docs = ["Comment est votre blanquette ?", "このオレはいずれ火影の名を受け継いで", "Every performance is an adventure"]
+    identifier = load_langid_identifier(languages, model_cache_dir=None)
+    compiled_identifier = load_langid_identifier(languages, model_cache_dir=str(tmpdir))
+    assert len(os.listdir(str(tmpdir))) == 1
+    cached_identifier = load_langid_identifier(languages, model_cache_dir=str(tmpdir))
+    for doc in docs:
+        assert identifier.classify(doc) == compiled_identifier.classify(doc) == cached_identifier.classify(doc)
+
+
+def test_langid_engine_shares_memory_mapped_model(tmpdir):
+    load_langid_identifier(["en", "fr"], model_cache_dir=str(tmpdir))  # compile the model
+    engine = LangidEngine(["en", "fr"], model_cache_dir=str(tmpdir))
+    assert isinstance(engine._identifier.nb_ptc, np.memmap)
+    assert np.shares_memory(engine._nb_ptc, engine._identifier.nb_ptc)
@@ -3,10 +3,16 @@
 # pytest automatically runs all the function starting with "test_"
 # see https://docs.pytest.org for more information
 
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import numpy as np
+import pytest
 
-from language_detection import LanguageDetector  # noqa
+from language_detection import LanguageDetector, create_process_pool, truncate_utf8  # noqa
+from detection_engines import LangidEngine  # noqa
+from profiling import DetectionProfiler  # noqa
+from text_normalization import TextNormalizer  # noqa
 
 
 INPUT_DF = pd.DataFrame(
@@ -34,3 +40,215 @@ def test_language_detection():
     output_df = detector.detect_languages_df(INPUT_DF, "input_text").sort_values(by=["input_text"])
     for col in output_df.columns:
         np.testing.assert_array_equal(output_df[col].values, OUTPUT_DF[col].values)
+
+
+def test_language_detection_batch():
+    # Same results as the per-document langid and cld3 calls of the original detector
+    import cld3
+    from langid.langid import LanguageIdentifier, model
+    from language_dict import SUPPORTED_LANGUAGES, SUPPORTED_LANGUAGES_IN_CLD3_NOT_IN_LANGID, LANGUAGE_REMAPPING
+
+    detector = LanguageDetector(minimum_score=0.2, fallback_language="es")
+    identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
+    identifier.set_languages([l for l in detector.language_scope if l not in SUPPORTED_LANGUAGES_IN_CLD3_NOT_IN_LANGID])
+
+    def detect_language_doc(doc):
+        if doc == "":
+            return ("", "", None)
+        if len(doc) <= LanguageDetector.LANGID_CLD3_NUM_CHAR_THRESHOLD:
+            lang_id, lang_probability = identifier.classify(doc)
+            lang_id = lang_id[:2]
+        else:
+            output = cld3.get_language(doc)
+            lang_id, lang_probability = output.language[:2], output.probability
+            for original_code, new_code in LANGUAGE_REMAPPING.items():
+                lang_id = lang_id.replace(original_code, new_code)
+        if lang_probability < 0.2 or lang_id not in detector.language_scope:
+            lang_id, lang_probability = "es", None
+        lang_name = {language["value"]: language["label"] for language in SUPPORTED_LANGUAGES}.get(lang_id, "")
+        return (lang_id, lang_name, round(float(lang_probability), 3) if lang_probability else None)
+
+    docs = INPUT_DF["input_text"].tolist() + ["Das ist ein kurzer Satz.", "OK", "Thanks!", "Merci beaucoup " * 20]
+    assert detector.detect_language_batch(docs) == [detect_language_doc(doc) for doc in docs]
+
+
+def test_langid_batch_matches_classify():
+    from langid.langid import LanguageIdentifier, model
+
+    engine = LangidEngine(["en", "fr", "de", "es", "ja", "ru", "ar", "zh"], model_cache_dir=None)
+    identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
+    identifier.set_languages([str(language) for language in engine._identifier.nb_classes])
+    base_docs = INPUT_DF["input_text"].tolist()[2:] + [
+        "Das ist ein kurzer Satz.",
+        "OK",
+        "Thanks! 👍 https://example.com",
+        "¿Dónde está la biblioteca? Está cerca de la estación de tren.",
+        "Привет, как дела? Всё хорошо, спасибо.",
+        "مرحبا، كيف حالك اليوم؟",
+        "我们今天去公园散步吧",
+        "Merci beaucoup " * 50,
+        "Mixing English words avec des mots français und deutsche Wörter",
+    ]
+    docs = [doc + " " + str(i) for i in range(30) for doc in base_docs]  # more than one sub-batch of 256 texts
+    codes, scores = engine.detect_batch(docs)
+    expected = [identifier.classify(doc) for doc in docs]
+    assert codes == [code for code, _ in expected]
+    np.testing.assert_allclose(scores, [score for _, score in expected], rtol=1e-9)
+
+
+def test_language_detection_process_backend():
+    detector = LanguageDetector(minimum_score=0.2, fallback_language="es", backend="process", num_workers=2)
+    detector.start()
+    process_pool = create_process_pool(num_workers=2, minimum_score=0.2, fallback_language="es")
+    shared_pool_detector = LanguageDetector(
+        minimum_score=0.2, fallback_language="es", backend="process", num_workers=2, process_pool=process_pool
+    )
+    shared_pool_output_df = shared_pool_detector.detect_languages_df(INPUT_DF, "input_text")
+    shared_pool_detector.close()
+    assert process_pool.map(abs, [-1]) == [1]  # processes of the shared pool are not stopped by the detector
+    process_pool.close()
+    process_pool.join()
+    output_df = detector.detect_languages_df(INPUT_DF, "input_text").sort_values(by=["input_text"])
+    detector.close()
+    for col in output_df.columns:
+        np.testing.assert_array_equal(output_df[col].values, OUTPUT_DF[col].values)
+        np.testing.assert_array_equal(
+            shared_pool_output_df.sort_values(by=["input_text"])[col].values, OUTPUT_DF[col].values
+        )
+    # Language codes of any length are kept intact, as with the thread backend
+    detector = LanguageDetector(minimum_score=0.9, fallback_language="und", backend="process", num_workers=2)
+    output_df = detector.detect_languages_df(INPUT_DF, "input_text")
+    detector.close()
+    assert "und" in set(output_df["input_text_language_code"])
+    pd.testing.assert_frame_equal(
+        output_df,
+        LanguageDetector(minimum_score=0.9, fallback_language="und").detect_languages_df(INPUT_DF, "input_text"),
+    )
+
+
+def test_language_detection_cache():
+    detector = LanguageDetector(minimum_score=0.2, fallback_language="es", cache_size=100)
+    input_df = pd.concat([INPUT_DF, INPUT_DF]).sort_values(by=["input_text"])
+    detector.detect_languages_df(INPUT_DF, "input_text")
+    output_df = detector.detect_languages_df(input_df, "input_text").sort_values(by=["input_text"])
+    for col in output_df.columns:
+        np.testing.assert_array_equal(output_df[col].values, OUTPUT_DF.loc[input_df.index, col].values)
+    assert detector.cache.get_stats()["hits"] == len(INPUT_DF)
+
+
+def test_language_detection_long_documents():
+    assert truncate_utf8("火影" * 10, 7) == "火影"
+    assert truncate_utf8("Hello", 7) == "Hello"
+    long_doc = "Every performance is an adventure with this group. They're called Fire Saga. " * 1000
+    detector = LanguageDetector(max_num_bytes=10000, progressive_detection=True)
+    assert detector.detect_language_doc(long_doc)[:2] == ("en", "English")
+    metrics_dict = detector.metrics.to_dict()
+    assert metrics_dict["counters"]["truncated_docs"] == 1
+    assert metrics_dict["counters"]["progressive_early_stops"] == 1
+
+
+def test_language_detection_profiling():
+    detector = LanguageDetector(minimum_score=0.2, fallback_language="es", profiler=DetectionProfiler(profile_chunks=1))
+    input_df = pd.DataFrame({"input_text": INPUT_DF["input_text"].tolist() + ["Merci beaucoup " * 20]})
+    detector.detect_languages_df(input_df, "input_text")
+    profiler_dict = detector.profiler.to_dict()
+    assert profiler_dict["engines"]["langid"]["<16"]["count"] == 1  # "1", as empty documents are not detected
+    assert profiler_dict["engines"]["cld3"]["256-1024"]["count"] == 1
+    assert profiler_dict["num_profiled_chunks"] == 1
+    assert "enrichment" in detector.metrics.to_dict()["timers"]
+
+
+def test_language_detection_script_fast_path():
+    docs = [
+        "안녕하세요, 오늘 날씨가 정말 좋네요!",
+        "สวัสดีครับ ยินดีที่ได้รู้จัก",
+        "このオレはいずれ火影の名を受け継いで、先代のどの火影をも超えてやるんだ",
+        "这是一个中文句子。",
+        "Every performance is an adventure with this group.",
+        "",
+    ]
+    detector = LanguageDetector(script_fast_path=True)
+    output = detector.detect_language_batch(docs)
+    assert [t[0] for t in output] == ["ko", "th", "ja", "zh", "en", ""]
+    assert output == [detector.detect_language_doc(doc) for doc in docs]
+    assert detector.metrics.to_dict()["counters"]["script_fast_path_docs"] == 6  # 3 documents, detected twice
+    # Korean is out of scope, so Hangul documents go through the models as without the fast path
+    detector = LanguageDetector(language_scope=["en", "ja"], script_fast_path=True)
+    assert detector.detect_language_doc(docs[0]) == LanguageDetector(["en", "ja"]).detect_language_doc(docs[0])
+    assert detector.metrics.to_dict()["counters"]["script_fast_path_docs"] == 0
+
+
+def test_language_detection_normalization():
+    detector = LanguageDetector(minimum_score=0.2, fallback_language="es", normalization_steps=["url", "digits"])
+    doc = "Comment est votre blanquette ? https://www.example.com/" + "1234567890" * 20
+    assert detector.detect_language_doc(doc) == ("fr", "French", 1.0)
+    assert detector.detect_language_doc("12 345") == ("es", "Spanish", None)
+    assert detector.detect_language_batch([doc, "12 345"]) == [("fr", "French", 1.0), ("es", "Spanish", None)]
+    counters = detector.metrics.to_dict()["counters"]
+    assert counters["normalization_short_circuited_docs"] == 2
+    assert counters["normalization_removed_chars"] == 2 * (len(doc) - len("Comment est votre blanquette ?"))
+    # Only long digit runs and repeated emoji are noise, short numerals and single emoji are kept
+    assert detector.text_normalizer.normalize("The room 12 is free 👍") == "The room 12 is free 👍"
+    assert TextNormalizer().normalize("Call 0612345678 now 😂😂😂") == "Call now"
+
+
+def test_language_detection_iter():
+    detector = LanguageDetector(minimum_score=0.2, fallback_language="es", cache_size=100)
+    docs = INPUT_DF["input_text"].tolist() * 3 + [None]
+    lang_output_tuple_list = list(detector.detect_languages_iter(iter(docs), batch_size=2))
+    assert lang_output_tuple_list == [detector.detect_language_doc(doc) for doc in docs]
+
+
+def test_language_detection_thread_pool_shared_by_threads():
+    detector = LanguageDetector(num_workers=2)
+    with ThreadPoolExecutor(max_workers=8) as executor:  # as in the detection service, which detects from threads
+        thread_pools = list(executor.map(lambda _: detector._get_thread_pool(), range(8)))
+    assert all(thread_pool is thread_pools[0] for thread_pool in thread_pools)
+    detector.close()
+
+
+def test_language_detection_columnar_output():
+    detector = LanguageDetector(minimum_score=0.2, fallback_language="es")
+    input_df = INPUT_DF.copy()
+    input_df.loc[len(input_df)] = [None]
+    output_df = detector.detect_languages_df(input_df, "input_text", columnar_output=True)
+    assert output_df is input_df
+    assert output_df["input_text_language_code"].dtype == "category"
+    assert output_df["input_text_language_score"].dtype == np.float32
+    output_df = output_df.dropna(subset=["input_text"]).sort_values(by=["input_text"])
+    for col in OUTPUT_DF.columns:
+        np.testing.assert_array_equal(np.asarray(output_df[col], dtype=OUTPUT_DF[col].dtype), OUTPUT_DF[col].values)
+    assert input_df.iloc[-1, 1:].isnull().all()
+
+
+def test_language_detection_multiple_columns():
+    detector = LanguageDetector(minimum_score=0.2, fallback_language="es", cache_size=100)
+    input_df = INPUT_DF.copy()
+    input_df["input_text_language_code"] = "existing"  # output names must not clash with existing columns
+    input_df["title"] = input_df["input_text"].values[::-1]
+    for columnar_output in [False, True]:
+        output_df = detector.detect_languages_df(input_df.copy(), ["input_text", "title"], columnar_output)
+        assert list(detector.column_description_dict.keys())[:4] == [
+            "input_text_language_code_1",
+            "input_text_language_name",
+            "input_text_language_score",
+            "title_language_code",
+        ]
+        output_df = output_df.sort_values(by=["input_text"])
+        np.testing.assert_array_equal(
+            np.asarray(output_df["input_text_language_code_1"], dtype=object),
+            OUTPUT_DF["input_text_language_code"].values,
+        )
+        np.testing.assert_array_equal(
+            np.asarray(output_df.sort_values(by=["title"])["title_language_code"], dtype=object),
+            OUTPUT_DF["input_text_language_code"].values,
+        )
+    assert detector.cache.get_stats()["hits"] == len(INPUT_DF)  # second pass only
+
+
+def test_language_detection_arrow():
+    pa = pytest.importorskip("pyarrow")
+    detector = LanguageDetector()
+    output_table = detector.detect_languages_arrow(pa.array(["Comment est votre blanquette ?", None]))
+    assert output_table.column("language_code").to_pylist() == ["fr", None]
+    assert output_table.column("language_score").to_pylist() == [1.0, None]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+import pandas as pd
+
+from language_detection import LanguageDetector  # noqa
+from language_distribution import LanguageDistributionEstimator  # noqa
+
+
+EN_DOC = "Every performance is an adventure with this group. They're called Fire Saga."
+FR_DOC = "Comment est votre blanquette ? Elle est très bonne, merci beaucoup."
+
+
+def test_language_distribution():
+    detector = LanguageDetector(language_scope=["en", "fr", "de"])
+    sample_df = pd.DataFrame({"text": [EN_DOC + " {:d}".format(i) for i in range(300)] + [FR_DOC] * 100 + [None] * 10})
+    estimator = LanguageDistributionEstimator(detector, margin_of_error=0.2, min_sample_size=100, batch_size=100)
+    distribution_dict = estimator.estimate({"": sample_df}, ["text"])
+    assert distribution_dict["stop_reason"] == "converged"
+    assert distribution_dict["num_sampled_rows"] == 100  # the first batch is enough for a margin of 20%
+    full_dict = LanguageDistributionEstimator(detector).estimate({"": sample_df}, ["text"])
+    assert full_dict["stop_reason"] == "sample_exhausted"
+    en_estimate, fr_estimate = full_dict["text_columns"]["text"]["languages"]
+    assert (en_estimate["language_code"], fr_estimate["language_code"]) == ("en", "fr")
+    assert en_estimate["proportion"] == 0.75 and en_estimate["ci_lower"] < 0.75 < en_estimate["ci_upper"]
+    assert full_dict["text_columns"]["text"]["num_empty_docs"] == 10
+
+
+def test_stratified_language_distribution():
+    detector = LanguageDetector(language_scope=["en", "fr", "de"])
+    sample_dfs = {"2021": pd.DataFrame({"text": [EN_DOC] * 50}), "2022": pd.DataFrame({"text": [FR_DOC] * 50})}
+    estimator = LanguageDistributionEstimator(detector, batch_size=10)
+    distribution_dict = estimator.estimate(sample_dfs, ["text"], stratum_sizes={"2021": 900, "2022": 100})
+    assert distribution_dict["text_columns"]["text"]["num_docs_per_stratum"] == {"2021": 50, "2022": 50}
+    distribution_df = estimator.to_df()
+    assert distribution_df["language_code"].tolist() == ["en", "fr"]
+    assert distribution_df["proportion"].round(6).tolist() == [0.9, 0.1]
+    assert list(distribution_df.columns) == list(LanguageDistributionEstimator.COLUMN_DESCRIPTION_DICT.keys())
+
+
+def test_language_distribution_from_chunks():
+    detector = LanguageDetector(language_scope=["en", "fr", "de"])
+    num_read_chunks = []
+
+    def iter_chunks():
+        for i in range(100):
+            num_read_chunks.append(i)
+            yield pd.DataFrame({"text": [EN_DOC, FR_DOC] * 50})
+
+    estimator = LanguageDistributionEstimator(detector, margin_of_error=0.1, min_sample_size=100, batch_size=100)
+    distribution_dict = estimator.estimate_from_chunks(iter_chunks(), ["text"])
+    assert distribution_dict["stop_reason"] == "converged"
+    assert len(num_read_chunks) < 100  # reading stops once the intervals are precise enough
+    assert [estimate["proportion"] for estimate in distribution_dict["text_columns"]["text"]["languages"]] == [0.5, 0.5]
+
+
+def test_language_distribution_mean_score():
+    sample_df = pd.DataFrame({"text": [EN_DOC] * 10 + ["OK"] * 10})  # "OK" is below the minimum score
+    for fallback_language, expected_mean_scores in [("en", {"en": 1.0}), ("es", {"en": 1.0, "es": None})]:
+        detector = LanguageDetector(
+            language_scope=["en", "fr", "de"], minimum_score=0.9, fallback_language=fallback_language
+        )
+        distribution_dict = LanguageDistributionEstimator(detector).estimate({"": sample_df}, ["text"])
+        languages = distribution_dict["text_columns"]["text"]["languages"]
+        assert {e["language_code"]: e["mean_score"] for e in languages} == expected_mean_scores
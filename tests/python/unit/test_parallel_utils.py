@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+import time
+from functools import partial
+
+import pytest
+
+from parallel_utils import iter_prefetched, iter_parallel_ordered, BackgroundConsumer  # noqa
+
+
+def _failing_iterator():
+    yield 1
+    raise ValueError("read error")
+
+
+def test_iter_prefetched():
+    assert list(iter_prefetched(iter(range(100)), max_queue_size=2)) == list(range(100))
+    with pytest.raises(ValueError):
+        list(iter_prefetched(_failing_iterator(), max_queue_size=2))
+
+
+def test_iter_parallel_ordered():
+    iterator_funcs = [lambda i=i: iter(range(i * 10, (i + 1) * 10)) for i in range(8)]
+    items = list(iter_parallel_ordered(iterator_funcs, max_workers=3, max_queue_size=2))
+    assert [item for _, item in items] == list(range(80))
+    assert [i for i, _ in items] == [i for i in range(8) for _ in range(10)]
+    with pytest.raises(ValueError):
+        list(iter_parallel_ordered([lambda: iter(range(3)), _failing_iterator], max_workers=2, max_queue_size=1))
+    started = []
+
+    def failing_first(i):
+        started.append(i)
+        if i == 0:
+            raise ValueError("read error")
+        time.sleep(0.01)
+        return iter(range(3))
+
+    with pytest.raises(ValueError):
+        list(iter_parallel_ordered([partial(failing_first, i) for i in range(20)], max_workers=2, max_queue_size=1))
+    assert len(started) <= 3  # the iterators running when the error is raised, not the queued ones
+
+
+def test_background_consumer():
+    consumed_items = []
+    with BackgroundConsumer(consumed_items.append, max_queue_size=2) as consumer:
+        for i in range(100):
+            consumer.put(i)
+    assert consumed_items == list(range(100))
+    with pytest.raises(ZeroDivisionError):
+        with BackgroundConsumer(lambda x: 1 / x, max_queue_size=2) as consumer:
+            for i in range(100):
+                consumer.put(i)
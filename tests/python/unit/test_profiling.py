@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+from profiling import DetectionProfiler  # noqa
+
+
+def test_detection_profiler():
+    profiler = DetectionProfiler(profile_chunks=1)
+    profiler.record_engine_latency("langid", [10, 20, 100], [0.00001, 0.00001, 0.00002])
+    profiler.record_engine_latency("cld3", [], [])
+    other_profiler = DetectionProfiler()
+    other_profiler.record_engine_latency("cld3", [500, 2000], [0.0001, 0.001])
+    profiler.merge(other_profiler.to_dict())
+    for _ in range(2):
+        with profiler.capture() as is_captured:
+            sum(range(1000))
+    assert not is_captured  # only the first chunk is captured
+    profiler_dict = profiler.to_dict()
+    assert profiler_dict["engines"]["langid"]["<16"]["count"] == 1
+    assert profiler_dict["engines"]["langid"]["64-140"]["mean_us"] == 20.0
+    assert sorted(profiler_dict["engines"]["cld3"].keys()) == ["1024-4096", "256-1024"]
+    assert sum(profiler_dict["engines"]["cld3"]["256-1024"]["latency_histogram"]) == 1
+    assert profiler_dict["num_profiled_chunks"] == 1
+    assert len(profiler_dict["profile"]) != 0
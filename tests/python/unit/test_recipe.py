@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+import os
+import sys
+import runpy
+import types
+
+import pandas as pd
+
+RECIPE_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "..", "custom-recipes", "nlp-language-detection-recipe", "recipe.py"
+)
+EN_DOC = "Every performance is an adventure with this group. They're called Fire Saga."
+FR_DOC = "Comment est votre blanquette ? Elle est très bonne, merci beaucoup."
+
+
+class RecipeDataset:
+    """
+    In-memory stand-in for the parts of dataiku.Dataset used by the recipe, with input partitions registered by name
+    """
+
+    partition_dfs = {}
+    instances = {}
+
+    def __init__(self, name):
+        self.name = name
+        self.input_partition_dfs = self.partition_dfs.get(name)
+        self.read_partitions = sorted(self.input_partition_dfs) if self.input_partition_dfs is not None else None
+        self.added_read_partitions = []
+        self.writePartition = None
+        self.spec_item = {"appendMode": False}
+        self.written_dfs = []
+        self.schema = None
+        if self.input_partition_dfs is not None:
+            df = next(iter(self.input_partition_dfs.values()))
+            self.schema = [{"name": col, "type": "string", "comment": "Input " + col} for col in df.columns]
+        RecipeDataset.instances[name] = self
+
+    def add_read_partitions(self, partition):
+        self.added_read_partitions.append(partition)
+
+    def iter_dataframes(self, chunksize=10000, **kwargs):
+        partitions = self.added_read_partitions or self.read_partitions
+        df = pd.concat([self.input_partition_dfs[partition] for partition in partitions], ignore_index=True)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start : start + chunksize]
+
+    def get_writer(self):
+        dataset = self
+
+        class Writer:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, exc_type, exc_value, traceback):
+                pass
+
+            def write_dataframe(self, df):
+                dataset.written_dfs.append(df)
+
+        return Writer()
+
+    def write_schema_from_dataframe(self, df, dropAndCreate=False):
+        self.schema = [{"name": col, "type": "string"} for col in df.columns]
+
+    def read_schema(self):
+        return [dict(col) for col in self.schema]
+
+    def write_schema(self, schema):
+        self.schema = schema
+
+
+def run_recipe(monkeypatch, partition_dfs, recipe_config):
+    dataiku_module = types.ModuleType("dataiku")
+    dataiku_module.Dataset = RecipeDataset
+    dataiku_module.ComputedMetrics = object  # only used in type annotations by the partition path
+    customrecipe_module = types.ModuleType("dataiku.customrecipe")
+    customrecipe_module.get_input_names_for_role = lambda role: ["input"] if role == "input_dataset" else []
+    customrecipe_module.get_output_names_for_role = lambda role: ["output"] if role == "output_dataset" else []
+    customrecipe_module.get_recipe_config = lambda: recipe_config
+    dataiku_module.customrecipe = customrecipe_module
+    monkeypatch.setitem(sys.modules, "dataiku", dataiku_module)
+    monkeypatch.setitem(sys.modules, "dataiku.customrecipe", customrecipe_module)
+    monkeypatch.delitem(sys.modules, "dku_io_utils", raising=False)  # imported again with the stand-in module
+    monkeypatch.setattr(RecipeDataset, "partition_dfs", {"input": partition_dfs})
+    monkeypatch.setattr(RecipeDataset, "instances", {})
+    runpy.run_path(RECIPE_PATH, run_name="__main__")
+    return RecipeDataset.instances["output"]
+
+
+def test_recipe_partitions_process_backend(monkeypatch):
+    partition_dfs = {
+        "2021": pd.DataFrame({"id": ["1", "2"], "text": [EN_DOC, FR_DOC]}),
+        "2022": pd.DataFrame({"id": ["3", "4"], "text": [FR_DOC, EN_DOC]}),
+    }
+    recipe_config = {
+        "text_column": "text",
+        "minimum_score": 0.0,
+        "backend": "process",
+        "num_workers": 2,
+        "partition_workers": 2,
+    }
+    output_dataset = run_recipe(monkeypatch, partition_dfs, recipe_config)
+    output_df = pd.concat(output_dataset.written_dfs, ignore_index=True)
+    assert output_df["text_language_code"].tolist() == ["en", "fr", "fr", "en"]
+    column_comments = {col["name"]: col["comment"] for col in output_dataset.schema}
+    assert column_comments == {
+        "id": "Input id",
+        "text": "Input text",
+        "text_language_code": "Language code in ISO 639-1 format",
+        "text_language_name": "Language name in ISO 639-1 format",
+        "text_language_score": "Confidence score from 0 to 1",
+    }
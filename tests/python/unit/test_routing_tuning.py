@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+from language_detection import LanguageDetector  # noqa
+from routing_tuning import RoutingTuner  # noqa
+
+
+DOCS = [
+    "Every performance is an adventure with this group. They're called Fire Saga. " * 3,
+    "Comment est votre blanquette ? Elle est très bonne, merci beaucoup. " * 3,
+    "Das ist ein kurzer Satz, aber er ist auf Deutsch geschrieben worden. " * 3,
+]
+
+
+def test_routing_tuner():
+    detector = LanguageDetector(language_scope=["en", "fr", "de"])
+    tuning_dict = RoutingTuner(detector, accuracy_tolerance=1.0).tune(DOCS, labels=["en", "fr", "de"])
+    assert tuning_dict["labels"] == "provided"
+    assert (
+        sum(bucket["num_evaluated"] for bucket in tuning_dict["buckets"]) == 3 * 7
+    )  # prefixes up to 200 characters and the document
+    with_full_tolerance = min(tuning_dict["candidates"], key=lambda candidate: candidate["us_per_doc"])
+    assert tuning_dict["routing_threshold"] == with_full_tolerance["threshold"]
+    assert RoutingTuner.load_routing_threshold(tuning_dict, ["fr", "de", "en"]) == tuning_dict["routing_threshold"]
+    assert RoutingTuner.load_routing_threshold(tuning_dict, ["en"]) == LanguageDetector.LANGID_CLD3_NUM_CHAR_THRESHOLD
+    self_labeled_dict = RoutingTuner(detector).tune(DOCS)
+    assert self_labeled_dict["labels"] == "self_consistent"
+
+
+def test_routing_threshold():
+    detector = LanguageDetector(routing_threshold=1000)
+    assert detector.detect_language_batch(DOCS[:1])[0][0] == "en"
+    assert "cld3" not in detector.metrics.to_dict()["timers"]
+    assert detector.get_config_fingerprint() != LanguageDetector().get_config_fingerprint()
+
+
+class DictFolder:
+    def __init__(self):
+        self.files = {}
+
+    def read_json(self, path):
+        return self.files[path]
+
+    def write_json(self, path, obj):
+        self.files[path] = obj
+
+
+def test_routing_tuning_reuse():
+    folder = DictFolder()
+    assert RoutingTuner.load(folder, ["en", "fr"]) is None
+    folder.write_json(RoutingTuner.FILE_NAME, {"routing_threshold": 70, "language_scope": ["en", "fr"]})
+    assert RoutingTuner.load(folder, ["fr", "en"])["routing_threshold"] == 70
+    assert RoutingTuner.load(folder, ["en"]) is None  # tuned again when the language scope changes